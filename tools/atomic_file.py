@@ -0,0 +1,30 @@
+#!/usr/bin/env python3
+"""
+Atomic File - write a file via temp file + rename
+
+A reader sees either the old file or the new one, never a half-written
+file, also when the writer is interrupted. Shared by the mail store, the
+import journal, the sync checkpoints, the Gmail token file and the feature
+flag snapshot; kept separate so callers don't import the mail storage stack.
+"""
+
+import os
+import tempfile
+from pathlib import Path
+
+
+def atomic_write(path, data):
+    """Write bytes via temp file + rename so a file is never half-written"""
+    path = Path(path)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    fd, tmp_path = tempfile.mkstemp(dir=path.parent, prefix='.tmp-')
+    try:
+        with os.fdopen(fd, 'wb') as f:
+            f.write(data)
+        os.replace(tmp_path, path)
+    except BaseException:
+        try:
+            os.unlink(tmp_path)
+        except OSError:
+            pass
+        raise
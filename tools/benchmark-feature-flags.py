@@ -0,0 +1,192 @@
+#!/usr/bin/env python3
+"""
+Feature Flag Benchmark - time the flag rollouts offline against local fakes
+
+Starts fake_flag_api (and fake_ssh_server for the upload scenarios) in this
+process, points the scripts at them and measures end-to-end rollout time.
+Every scenario starts from the same state: all flags False.
+
+    enable-serial    enable-feature-flags.py, one PUT at a time
+    enable-parallel  enable-feature-flags.py, MAX_WORKERS parallel PUTs
+    upload-single    upload-feature-flags.py: SFTP upload + restart + readiness
+    fleet-serial     upload-feature-flags.py --fleet, one host at a time, one wave
+    fleet-waves      upload-feature-flags.py --fleet, FLEET_WAVES with FLEET_WORKERS
+
+A Restart-WebAppPool on a fake host reads the uploaded config and restarts
+its fake API: 503 for --restart-delay seconds, then the new flags.
+
+Usage:
+    python benchmark-feature-flags.py [--latency 0.05] [--restart-delay 0.5] [--hosts 10]
+                                      [--failure-rate 0.0] [--scenarios enable-serial,fleet-waves]
+                                      [--json results.json]
+"""
+
+import argparse
+import contextlib
+import functools
+import importlib.util
+import json
+import os
+import shutil
+import tempfile
+import time
+from pathlib import Path
+
+TOOLS_DIR = Path(__file__).resolve().parent
+
+SCENARIOS = ['enable-serial', 'enable-parallel', 'upload-single', 'fleet-serial', 'fleet-waves']
+
+
+def load_script(filename):
+    spec = importlib.util.spec_from_file_location(filename[:-3].replace('-', '_'), TOOLS_DIR / filename)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    # Geen snapshot in C:/scripts/_machine tijdens een benchmark
+    module.FlagClient = functools.partial(module.FlagClient, cache_path=None)
+    return module
+
+
+class FakeHost:
+    """Fake API + fake SSH server; de restart zet de geüploade flags live"""
+
+    def __init__(self, root, remote_path, latency, restart_delay, failure_rate, seed):
+        import fake_flag_api
+        import fake_ssh_server
+
+        self.root = root
+        self.remote_path = remote_path
+        self.restart_delay = restart_delay
+        self.api = fake_flag_api.start(latency=latency, failure_rate=failure_rate, seed=seed)
+        self.ssh = fake_ssh_server.start(root, latency=latency, on_exec=self.on_exec)
+        self.local_path = fake_ssh_server.local_path
+
+    def on_exec(self, command):
+        if 'Restart-WebAppPool' not in command:
+            return f"unknown command: {command}", 1
+        config = json.loads(self.local_path(self.root, self.remote_path).read_text(encoding='utf-8'))
+        self.api.restart(config['FeatureFlags'], self.restart_delay)
+        return '', 0
+
+    def reset(self, flags):
+        self.api.restart({name: False for name in flags}, delay=0)
+        self.api.stats.reset()
+        self.ssh.stats.reset()
+
+    def stats(self):
+        api, ssh = self.api.stats.snapshot(), self.ssh.stats.snapshot()
+        return {'requests': api.get('requests', 0), 'connections': ssh.get('connections', 0)}
+
+    def shutdown(self):
+        self.api.shutdown()
+        self.ssh.shutdown()
+
+
+def run_scenario(name, hosts, workdir):
+    main_host = hosts[0]
+    if name in ('enable-serial', 'enable-parallel'):
+        module = load_script('enable-feature-flags.py')
+        module.API_BASE = main_host.api.url
+        workers = 1 if name == 'enable-serial' else module.MAX_WORKERS
+        return module.enable_flags(workers=workers)
+
+    module = load_script('upload-feature-flags.py')
+    if name == 'upload-single':
+        module.SSH_HOST, module.SSH_PORT = '127.0.0.1', main_host.ssh.port
+        module.FLAGS_URL = f"{main_host.api.url}/api/featureflags"
+        return module.upload_feature_flags()
+
+    inventory = workdir / 'inventory.json'
+    inventory.write_text(json.dumps([
+        {'host': '127.0.0.1', 'port': host.ssh.port, 'name': f"host{number:02d}",
+         'url': f"{host.api.url}/api/featureflags"}
+        for number, host in enumerate(hosts, 1)
+    ]), encoding='utf-8')
+    if name == 'fleet-serial':
+        results = module.rollout_fleet(module.load_inventory(inventory), [100], workers=1)
+    else:
+        results = module.rollout_fleet(module.load_inventory(inventory))
+    return all(r['status'] == 'ok' for r in results) and len(results) == len(hosts)
+
+
+def print_table(results):
+    print(f"\n{'Scenario':<16} {'Hosts':>5} {'Tijd (s)':>9} {'API req':>8} {'SSH conn':>9}  Resultaat")
+    print('-' * 62)
+    for r in results:
+        if 'skipped' in r or 'error' in r:
+            print(f"{r['scenario']:<16} {'-':>5}   {r.get('skipped') or r.get('error')}")
+            continue
+        print(f"{r['scenario']:<16} {r['hosts']:>5} {r['seconds']:>9.2f} {r['requests']:>8} "
+              f"{r['connections']:>9}  {'ok' if r['ok'] else 'FAILED'}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the feature flag rollouts against local fakes")
+    parser.add_argument('--latency', type=float, default=0.05, help="seconds per request / SSH round trip")
+    parser.add_argument('--restart-delay', type=float, default=0.5, help="seconds the fake API is down after a restart")
+    parser.add_argument('--hosts', type=int, default=10, help="fake hosts for the fleet scenarios")
+    parser.add_argument('--failure-rate', type=float, default=0.0, help="fraction of API requests answered with 500")
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--scenarios', default=','.join(SCENARIOS))
+    parser.add_argument('--json', help="write results to this file")
+    args = parser.parse_args()
+
+    try:
+        import paramiko  # noqa: F401
+        import requests  # noqa: F401
+    except ImportError as e:
+        print(f"⚠ Benchmark overgeslagen, ontbrekende module: {e.name}")
+        return
+
+    names = [s.strip() for s in args.scenarios.split(',') if s.strip()]
+    for name in names:
+        if name not in SCENARIOS:
+            print(f"⚠ Onbekend scenario: {name}")
+    names = [name for name in names if name in SCENARIOS]
+
+    upload = load_script('upload-feature-flags.py')
+    flags = upload.FEATURE_FLAGS['FeatureFlags']
+    workdir = Path(tempfile.mkdtemp(prefix='bench-flags-'))
+    host_count = max(1, args.hosts) if any(n.startswith('fleet') for n in names) else 1
+    hosts = [FakeHost(workdir / f"host{number:02d}", upload.REMOTE_PATH, args.latency, args.restart_delay,
+                      args.failure_rate, args.seed + number)
+             for number in range(host_count)]
+    print(f"✓ {host_count} fake hosts (latency {args.latency * 1000:.0f} ms, "
+          f"restart {args.restart_delay:g}s, failure rate {args.failure_rate:g})")
+
+    results = []
+    try:
+        for name in names:
+            used = hosts if name.startswith('fleet') else hosts[:1]
+            for host in hosts:
+                host.reset(flags)
+            print(f"▶ {name}...")
+            result = {'scenario': name, 'hosts': len(used)}
+            started = time.perf_counter()
+            try:
+                with open(os.devnull, 'w', encoding='utf-8') as devnull, contextlib.redirect_stdout(devnull):
+                    result['ok'] = bool(run_scenario(name, used, workdir))
+            except Exception as e:
+                result['error'] = f"{type(e).__name__}: {e}"
+            result['seconds'] = time.perf_counter() - started
+            stats = [host.stats() for host in used]
+            result['requests'] = sum(s['requests'] for s in stats)
+            result['connections'] = sum(s['connections'] for s in stats)
+            results.append(result)
+    finally:
+        for host in hosts:
+            host.shutdown()
+        shutil.rmtree(workdir, ignore_errors=True)
+
+    print_table(results)
+    if args.json:
+        Path(args.json).write_text(json.dumps({
+            'latency': args.latency,
+            'restart_delay': args.restart_delay,
+            'failure_rate': args.failure_rate,
+            'results': results,
+        }, indent=2), encoding='utf-8')
+        print(f"\n✓ Resultaten opgeslagen: {args.json}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,306 @@
+#!/usr/bin/env python3
+"""
+Import Benchmark - run the email importers offline against local fake servers
+
+Generates (or loads) a mail_corpus mbox, starts fake_imap_server (plain and
+Gmail flavour) and fake_gmail_api in this process, and runs every importer
+in its own child process against them with a fresh output directory. Each
+importer runs as its mail_pipeline.py source, exactly like the real script:
+
+    arjan       import-arjan-emails.py
+    arjan-async import-arjan-emails.py, asyncio backend (ArjanAsyncSource)
+    inbox       fetch-inbox-emails.py (FROM meppel.nl)
+    sent        fetch-sent-emails.py (TO meppel.nl)
+    gmail       gmail-import.py            (needs google-api-python-client)
+    arjan-v2    import-arjan-emails-v2.py  (needs google-api-python-client)
+
+Reported per scenario: stored messages, wall time, messages per second,
+bytes sent by the fake server and the child's peak RSS. The incremental
+importers (inbox, sent) then get one new message delivered and run again
+on the same output directory: that run must fetch only the new message,
+otherwise the UID checkpoint did not move.
+
+Usage:
+    python benchmark-imports.py [--count 2000] [--latency 0.02] [--scenarios arjan,inbox]
+                                [--corpus corpus.mbox] [--json results.json] [--packed] [--single-phase]
+"""
+
+import argparse
+import contextlib
+import imaplib
+import importlib.util
+import json
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+from mail_store import PACKS_DIR
+
+TOOLS_DIR = Path(__file__).resolve().parent
+BENCH_ACCOUNT = 'martiendejong2008@gmail.com'
+BENCH_PASSWORD = 'benchmark'
+
+SCENARIOS = ['arjan', 'arjan-async', 'inbox', 'sent', 'gmail', 'arjan-v2']
+GMAIL_SCENARIOS = ('gmail', 'arjan-v2')
+# Welke fake server een scenario gebruikt
+SCENARIO_SERVER = {
+    'arjan': 'gmail-imap',
+    'arjan-async': 'gmail-imap',
+    'inbox': 'imap',
+    'sent': 'imap',
+    'gmail': 'gmail-api',
+    'arjan-v2': 'gmail-api',
+}
+# Importers met een UID checkpoint (imap_sync.py): folder en filter van de tweede run
+INCREMENTAL_SCENARIOS = {
+    'inbox': ('INBOX', 'in', b'From:'),
+    'sent': ('Sent', 'out', b'To:'),
+}
+
+
+# --- child: één importer draaien ---
+
+def load_script(filename):
+    spec = importlib.util.spec_from_file_location(filename[:-3].replace('-', '_'), TOOLS_DIR / filename)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+class PlainIMAP4(imaplib.IMAP4):
+    """IMAP4_SSL stand-in; the fake server speaks plain IMAP on localhost"""
+
+    def __init__(self, host='', port=imaplib.IMAP4_SSL_PORT, *args, **kwargs):
+        super().__init__(host, port)
+
+
+def use_plain_imap():
+    import imap_async
+    imaplib.IMAP4_SSL = PlainIMAP4
+    open_connection = imap_async.AsyncImap.open.__func__
+
+    async def open_plain(cls, host, port=993, use_ssl=True, timeout=imap_async.CONNECT_TIMEOUT):
+        return await open_connection(cls, host, port, False, timeout)
+    imap_async.AsyncImap.open = classmethod(open_plain)
+
+
+def gmail_service(url):
+    import httplib2
+    from googleapiclient.discovery import build
+    return build('gmail', 'v1', http=httplib2.Http(), static_discovery=True, cache_discovery=False,
+                 client_options={'api_endpoint': url})
+
+
+def pipeline_source(name, endpoint, out, single_phase=False):
+    """De mail_pipeline Source van een importer, tegen de fake servers"""
+    if name in ('arjan', 'arjan-async'):
+        use_plain_imap()
+        module = load_script('import-arjan-emails.py')
+        module.ACCOUNTS = [{'email': BENCH_ACCOUNT, 'imap_server': '127.0.0.1', 'imap_port': int(endpoint)}]
+        source_class = module.ArjanAsyncSource if name == 'arjan-async' else module.ArjanSource
+        return source_class(module.ACCOUNTS, {BENCH_ACCOUNT: BENCH_PASSWORD}, module.SEARCH_TERMS)
+    if name in ('inbox', 'sent'):
+        use_plain_imap()
+        module = load_script(f"fetch-{name}-emails.py")
+        module.IMAP_HOST, module.IMAP_PORT = '127.0.0.1', int(endpoint)
+        module.OUTPUT_DIR = out
+        module.SYNC_STATE_FILE = os.path.join(out, 'imap_sync_state.json')
+        module.MAX_EMAILS = 10 ** 9
+        if single_phase:
+            module.TWO_PHASE = False
+        return module.pipeline_source()
+    if name == 'gmail':
+        return load_script('gmail-import.py').GmailImportSource(gmail_service(endpoint))
+    return load_script('import-arjan-emails-v2.py').ArjanV2Source(services={BENCH_ACCOUNT: gmail_service(endpoint)})
+
+
+def run_scenario(name, endpoint, out, single_phase=False):
+    """(messages in the store, run_pipeline result)"""
+    from mail_pipeline import run_pipeline
+    from mail_store import MailStore
+
+    store = MailStore(out)
+    result = run_pipeline(pipeline_source(name, endpoint, out, single_phase), store)
+    store.close()
+    return len(MailStore(out)), result
+
+
+def peak_rss_mb():
+    """Peak resident set size of this process in MB (None when unavailable)"""
+    # Linux: VmHWM begint opnieuw bij exec, ru_maxrss erft de piek van de parent
+    try:
+        with open('/proc/self/status', encoding='ascii') as status:
+            for line in status:
+                if line.startswith('VmHWM:'):
+                    return int(line.split()[1]) / 1024
+    except OSError:
+        pass
+    try:
+        import resource
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        return peak / 1024 / 1024 if sys.platform == 'darwin' else peak / 1024
+    except ImportError:
+        pass
+    try:
+        import psutil
+        return psutil.Process().memory_info().peak_wset / 1024 / 1024
+    except (ImportError, AttributeError):
+        return None
+
+
+def child(name, endpoint, out, single_phase=False):
+    sys.argv = [name]
+    result = {'scenario': name}
+    started = time.perf_counter()
+    try:
+        with open(os.devnull, 'w', encoding='utf-8') as devnull, contextlib.redirect_stdout(devnull):
+            result['messages'], counts = run_scenario(name, endpoint, out, single_phase)
+        result['new'], result['existing'] = counts['new'], counts['existing']
+    except ImportError as e:
+        result['skipped'] = f"ontbrekende module: {e.name}"
+    except Exception as e:
+        result['error'] = f"{type(e).__name__}: {e}"
+    result['seconds'] = time.perf_counter() - started
+    result['peak_rss_mb'] = peak_rss_mb()
+    print(json.dumps(result))
+
+
+# --- parent: servers starten en scenario's meten ---
+
+def run_child(name, endpoint, out, single_phase=False):
+    command = [sys.executable, __file__, '--child', name, '--endpoint', str(endpoint), '--out', out]
+    if single_phase:
+        command.append('--single-phase')
+    completed = subprocess.run(command, capture_output=True, text=True, encoding='utf-8', cwd=TOOLS_DIR)
+    lines = completed.stdout.strip().splitlines()
+    if completed.returncode != 0 or not lines:
+        return {'scenario': name, 'error': completed.stderr.strip().splitlines()[-1:] or 'geen output'}
+    return json.loads(lines[-1])
+
+
+def rerun_check(name, server, endpoint, out, messages, single_phase=False):
+    """Eén nieuw bericht afleveren en opnieuw draaien: alleen dat bericht mag binnenkomen"""
+    folder, direction, header = INCREMENTAL_SCENARIOS[name]
+    raw = next(raw for kind, raw in messages
+               if kind == direction and any(line.startswith(header) and b'meppel.nl' in line
+                                            for line in raw.split(b'\n')))
+    # Extra header: zelfde afzender/ontvanger, ander bericht (andere digest); load_mbox geeft CRLF
+    server.deliver(folder, b'X-Benchmark-Rerun: 1\r\n' + raw)
+    result = run_child(name, endpoint, out, single_phase)
+    return {key: result.get(key) for key in ('new', 'existing', 'error')}
+
+
+def print_table(results):
+    print(f"\n{'Scenario':<15} {'Emails':>7} {'Tijd (s)':>9} {'Emails/s':>9} {'MB over':>9} {'Peak RSS':>9}")
+    print('-' * 63)
+    for r in results:
+        if 'skipped' in r or 'error' in r:
+            print(f"{r['scenario']:<15} {'-':>7}   {r.get('skipped') or r.get('error')}")
+            continue
+        rate = r['messages'] / r['seconds'] if r['seconds'] else 0
+        rss = f"{r['peak_rss_mb']:.0f} MB" if r.get('peak_rss_mb') else 'n/a'
+        print(f"{r['scenario']:<15} {r['messages']:>7} {r['seconds']:>9.2f} {rate:>9.1f} "
+              f"{r['bytes_out'] / 1024 / 1024:>9.2f} {rss:>9}")
+    for r in results:
+        rerun = r.get('rerun')
+        if rerun and (rerun.get('error') or rerun.get('new') != 1 or rerun.get('existing')):
+            print(f"✗ {r['scenario']}: tweede run na één nieuw bericht: {rerun} (verwacht new 1, existing 0)")
+        elif rerun:
+            print(f"✓ {r['scenario']}: tweede run haalde alleen het nieuwe bericht op")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the email importers against local fake servers")
+    parser.add_argument('--count', type=int, default=2000, help="emails in the generated corpus")
+    parser.add_argument('--body-size', type=int, default=4000)
+    parser.add_argument('--attachment-ratio', type=float, default=0.1)
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--corpus', help="existing mbox instead of a generated corpus")
+    parser.add_argument('--latency', type=float, default=0.0, help="seconds per round trip on the fake servers")
+    parser.add_argument('--gmail-rate-limit', type=int, help="fake Gmail API requests/s before 429")
+    parser.add_argument('--scenarios', default=','.join(SCENARIOS))
+    parser.add_argument('--json', help="write results to this file")
+    parser.add_argument('--keep', action='store_true', help="keep the output directories")
+    parser.add_argument('--packed', action='store_true', help="write into pack segments instead of one file per message")
+    parser.add_argument('--single-phase', action='store_true',
+                        help="inbox/sent without the header pass (TWO_PHASE = False)")
+    parser.add_argument('--child', help=argparse.SUPPRESS)
+    parser.add_argument('--endpoint', help=argparse.SUPPRESS)
+    parser.add_argument('--out', help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        child(args.child, args.endpoint, args.out, args.single_phase)
+        return
+
+    import fake_gmail_api
+    import fake_imap_server
+    from mail_corpus import load_mbox, write_mbox
+
+    corpus = args.corpus
+    if not corpus:
+        corpus = os.path.join(tempfile.mkdtemp(prefix='bench-corpus-'), 'corpus.mbox')
+        print(f"Corpus genereren: {args.count} emails...")
+        write_mbox(corpus, count=args.count, body_size=args.body_size,
+                   attachment_ratio=args.attachment_ratio, seed=args.seed)
+    messages = load_mbox(corpus)
+    print(f"✓ Corpus: {len(messages)} emails, {sum(len(raw) for _, raw in messages) / 1024 / 1024:.1f} MB")
+
+    servers = {
+        'imap': fake_imap_server.start(messages, latency=args.latency),
+        'gmail-imap': fake_imap_server.start(messages, latency=args.latency, gmail=True),
+        'gmail-api': fake_gmail_api.start(messages, latency=args.latency, rate_limit=args.gmail_rate_limit),
+    }
+    endpoints = {
+        'imap': servers['imap'].server_address[1],
+        'gmail-imap': servers['gmail-imap'].server_address[1],
+        'gmail-api': servers['gmail-api'].url,
+    }
+    print(f"✓ Fake servers: IMAP :{endpoints['imap']}, Gmail IMAP :{endpoints['gmail-imap']}, "
+          f"Gmail API {endpoints['gmail-api']} (latency {args.latency * 1000:.0f} ms)")
+
+    results = []
+    for name in [s.strip() for s in args.scenarios.split(',') if s.strip()]:
+        if name not in SCENARIOS:
+            print(f"⚠ Onbekend scenario: {name}")
+            continue
+        server = servers[SCENARIO_SERVER[name]]
+        server.stats.reset()
+        print(f"▶ {name}...")
+        out = tempfile.mkdtemp(prefix=f"bench-{name}-")
+        if args.packed:
+            # Een packs directory zet de mail store in packed mode
+            os.mkdir(os.path.join(out, PACKS_DIR))
+        try:
+            result = run_child(name, endpoints[SCENARIO_SERVER[name]], out, args.single_phase)
+            stats = server.stats.snapshot()
+            result['bytes_out'] = stats['bytes_out']
+            result['server'] = stats
+            if name in INCREMENTAL_SCENARIOS and 'messages' in result:
+                result['rerun'] = rerun_check(name, server, endpoints[SCENARIO_SERVER[name]], out,
+                                              messages, args.single_phase)
+        finally:
+            if not args.keep:
+                shutil.rmtree(out, ignore_errors=True)
+        results.append(result)
+
+    for server in servers.values():
+        server.shutdown()
+
+    print_table(results)
+    if args.json:
+        Path(args.json).write_text(json.dumps({
+            'corpus': {'path': corpus, 'messages': len(messages)},
+            'latency': args.latency,
+            'packed': args.packed,
+            'results': results,
+        }, indent=2), encoding='utf-8')
+        print(f"\n✓ Resultaten opgeslagen: {args.json}")
+
+
+if __name__ == '__main__':
+    main()
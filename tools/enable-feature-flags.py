@@ -1,11 +1,32 @@
 #!/usr/bin/env python3
-"""Enable all feature flags on brand2boost production"""
+"""
+Enable all feature flags on brand2boost production
 
-import requests
+Reads the current flags once (conditional GET /api/featureflags through
+flag_client, a 304 when the cached snapshot is still current), PUTs only
+the flags that differ from FLAGS - in parallel over one keep-alive
+session - and verifies the result against that same snapshot.
+
+Usage:
+    python enable-feature-flags.py            # apply
+    python enable-feature-flags.py --dry-run  # only show what would change
+"""
+
+import argparse
 import json
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+from requests.adapters import HTTPAdapter
+
+from flag_client import FlagClient
 
 API_BASE = "https://api.brand2boost.com"
 
+# Parallelle PUTs over dezelfde sessie (één TLS verbinding per worker)
+MAX_WORKERS = 8
+REQUEST_TIMEOUT = 15  # seconden
+
 # Feature flags to enable
 FLAGS = {
     "EnableArtifactCards": True,
@@ -19,44 +40,93 @@ FLAGS = {
     "UseSingleLLMOrchestration": True
 }
 
-def enable_flags():
-    """Enable all feature flags"""
+def new_session(workers=MAX_WORKERS):
+    """Keep-alive sessie met een connection pool zo groot als het aantal workers"""
+    session = requests.Session()
+    adapter = HTTPAdapter(pool_connections=1, pool_maxsize=workers)
+    session.mount("https://", adapter)
+    session.mount("http://", adapter)
+    session.headers["Content-Type"] = "application/json"
+    return session
+
+def diff_flags(current, desired):
+    """Alleen de flags die nog niet de gewenste waarde hebben"""
+    return {name: value for name, value in desired.items() if current.get(name) != value}
+
+def put_flag(session, flag_name, flag_value):
+    """PUT één flag; geeft (ok, melding)"""
+    try:
+        response = session.put(
+            f"{API_BASE}/api/featureflags/{flag_name}",
+            json=flag_value,
+            timeout=REQUEST_TIMEOUT
+        )
+    except Exception as e:
+        return False, f"[ERROR] {flag_name}: {e}"
+    if response.status_code == 200:
+        return True, f"[OK] {flag_name}: {flag_value}"
+    return False, f"[FAIL] {flag_name}: HTTP {response.status_code}\n  Response: {response.text}"
+
+def apply_flags(session, changes, workers=MAX_WORKERS):
+    """PUT alle gewijzigde flags parallel; geeft {flag: ok}"""
+    if not changes:
+        return {}
+    results = {}
+    with ThreadPoolExecutor(max_workers=min(workers, len(changes))) as executor:
+        futures = {executor.submit(put_flag, session, name, value): name for name, value in changes.items()}
+        for future, flag_name in futures.items():
+            ok, message = future.result()
+            print(message)
+            results[flag_name] = ok
+    return results
+
+def verify_flags(snapshot, changes, results, desired):
+    """Verwachte eindstand: snapshot + geslaagde PUTs. Geeft de flags die afwijken"""
+    final = dict(snapshot)
+    final.update({name: value for name, value in changes.items() if results.get(name)})
+    return final, {name: final.get(name) for name, value in desired.items() if final.get(name) != value}
+
+def enable_flags(desired=FLAGS, dry_run=False, session=None, workers=MAX_WORKERS):
+    """Enable all feature flags; geeft True als alle flags de gewenste waarde hebben"""
     print("Enabling feature flags on production...")
     print(f"API: {API_BASE}")
     print()
 
-    # Update each flag
-    for flag_name, flag_value in FLAGS.items():
-        url = f"{API_BASE}/api/featureflags/{flag_name}"
-
-        try:
-            response = requests.put(
-                url,
-                json=flag_value,
-                headers={"Content-Type": "application/json"}
-            )
-
-            if response.status_code == 200:
-                print(f"[OK] {flag_name}: {flag_value}")
-            else:
-                print(f"[FAIL] {flag_name}: HTTP {response.status_code}")
-                print(f"  Response: {response.text}")
-        except Exception as e:
-            print(f"[ERROR] {flag_name}: {e}")
+    session = session or new_session(workers)
+    client = FlagClient(f"{API_BASE}/api/featureflags", session=session)
+    try:
+        snapshot, _ = client.refresh()
+    except Exception as e:
+        # Zonder snapshot geen diff: alles zetten, zoals vroeger
+        print(f"[WARN] Could not read current flags ({e}), updating all")
+        snapshot = {}
+
+    changes = diff_flags(snapshot, desired)
+    unchanged = len(desired) - len(changes)
+    print(f"{len(changes)} to update, {unchanged} already set")
+    if dry_run:
+        for flag_name, flag_value in changes.items():
+            print(f"  {flag_name}: {snapshot.get(flag_name)} -> {flag_value}")
+        return not changes
+
+    results = apply_flags(session, changes, workers)
+    if any(results.values()):
+        # Server heeft nu een nieuwe versie; volgende lezing niet uit de snapshot
+        client.invalidate()
 
     print()
     print("Verifying feature flags...")
+    final, mismatches = verify_flags(snapshot, changes, results, desired)
+    print(json.dumps(final, indent=2))
+    if mismatches:
+        print(f"[WARNING] {len(mismatches)} flags not set: {', '.join(mismatches)}")
+    return not mismatches
 
-    # Get current flags
-    try:
-        response = requests.get(f"{API_BASE}/api/featureflags")
-        if response.status_code == 200:
-            flags = response.json()
-            print(json.dumps(flags, indent=2))
-        else:
-            print(f"Failed to get flags: HTTP {response.status_code}")
-    except Exception as e:
-        print(f"Error getting flags: {e}")
+def main():
+    parser = argparse.ArgumentParser(description="Enable feature flags on brand2boost production")
+    parser.add_argument("--dry-run", action="store_true", help="show the diff without changing anything")
+    args = parser.parse_args()
+    enable_flags(dry_run=args.dry_run)
 
 if __name__ == "__main__":
-    enable_flags()
+    main()
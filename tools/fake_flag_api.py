@@ -0,0 +1,165 @@
+#!/usr/bin/env python3
+"""
+Fake Flag API - local stand-in for the brand2boost /api/featureflags endpoints
+
+    GET /api/featureflags          all flags as a JSON object, with ETag
+                                   (If-None-Match -> 304)
+    PUT /api/featureflags/{name}   JSON body true/false -> 200 {"name": value}
+
+--latency sleeps per request (requests run in parallel threads, like a real
+round trip); --failure-rate answers that fraction of requests with a 500.
+restart(flags, delay) simulates an app pool restart: 503 for `delay`
+seconds, then the new flags (fake_ssh_server calls it for
+Restart-WebAppPool).
+
+Usage:
+    python fake_flag_api.py [--port 8086] [--latency 0.05] [--failure-rate 0.05] [--flags flags.json]
+"""
+
+import argparse
+import hashlib
+import json
+import random
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from fake_imap_server import Stats
+
+FLAGS_PATH = '/api/featureflags'
+
+
+class FlagHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+
+    def log_message(self, format, *args):
+        pass
+
+    def send_json(self, status, body=None, headers=None):
+        data = json.dumps(body).encode('utf-8') if body is not None else b''
+        self.send_response(status)
+        if body is not None:
+            self.send_header('Content-Type', 'application/json; charset=utf-8')
+        self.send_header('Content-Length', str(len(data)))
+        for key, value in (headers or {}).items():
+            self.send_header(key, value)
+        self.end_headers()
+        self.wfile.write(data)
+        self.server.stats.add('bytes_out', len(data))
+
+    def begin(self):
+        """Latency, restart en random fouten; False als het request al beantwoord is"""
+        server = self.server
+        server.stats.add('requests')
+        if server.latency:
+            time.sleep(server.latency)
+        if time.monotonic() < server.down_until:
+            server.stats.add('unavailable')
+            self.send_json(503, {'error': 'Service Unavailable'})
+            return False
+        if server.failure_rate and server.random() < server.failure_rate:
+            server.stats.add('failures')
+            self.send_json(500, {'error': 'Internal Server Error'})
+            return False
+        return True
+
+    def do_GET(self):
+        if not self.begin():
+            return
+        if self.path.split('?')[0].rstrip('/') != FLAGS_PATH:
+            self.send_json(404, {'error': 'Not Found'})
+            return
+        flags, etag = self.server.current()
+        if self.headers.get('If-None-Match') == etag:
+            self.server.stats.add('not_modified')
+            self.send_json(304, headers={'ETag': etag})
+            return
+        self.send_json(200, flags, {'ETag': etag})
+
+    def do_PUT(self):
+        length = int(self.headers.get('Content-Length') or 0)
+        body = self.rfile.read(length)
+        self.server.stats.add('bytes_in', length)
+        if not self.begin():
+            return
+        prefix, _, name = self.path.split('?')[0].rpartition('/')
+        if prefix != FLAGS_PATH or not name:
+            self.send_json(404, {'error': 'Not Found'})
+            return
+        try:
+            value = json.loads(body)
+        except ValueError:
+            self.send_json(400, {'error': 'Invalid JSON'})
+            return
+        self.server.set_flag(name, value)
+        self.server.stats.add('puts')
+        self.send_json(200, {name: value})
+
+
+class FakeFlagServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self, address, flags, latency=0.0, failure_rate=0.0, seed=None):
+        super().__init__(address, FlagHandler)
+        self.flags = dict(flags)
+        self.latency = latency
+        self.failure_rate = failure_rate
+        self.down_until = 0.0
+        self.lock = threading.Lock()
+        self.random = random.Random(seed).random
+        self.stats = Stats()
+
+    @property
+    def url(self):
+        return f"http://127.0.0.1:{self.server_address[1]}"
+
+    def current(self):
+        with self.lock:
+            flags = dict(self.flags)
+        data = json.dumps(flags, sort_keys=True).encode('utf-8')
+        return flags, f'"{hashlib.sha1(data).hexdigest()[:16]}"'
+
+    def set_flag(self, name, value):
+        with self.lock:
+            self.flags[name] = value
+
+    def restart(self, flags=None, delay=1.0):
+        """App pool restart: 503 tijdens het opstarten, daarna de (nieuwe) configuratie"""
+        with self.lock:
+            if flags is not None:
+                self.flags = dict(flags)
+            self.down_until = time.monotonic() + delay
+
+
+def start(flags=None, port=0, latency=0.0, failure_rate=0.0, seed=None):
+    """Start a server on 127.0.0.1 in a background thread; server.url is the API_BASE"""
+    server = FakeFlagServer(('127.0.0.1', port), flags or {}, latency, failure_rate, seed)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Local fake of the brand2boost feature flag API")
+    parser.add_argument('--port', type=int, default=8086)
+    parser.add_argument('--latency', type=float, default=0.0, help="seconds added to every request")
+    parser.add_argument('--failure-rate', type=float, default=0.0, help="fraction of requests answered with 500")
+    parser.add_argument('--flags', help="JSON file with the initial flags")
+    args = parser.parse_args()
+
+    flags = {}
+    if args.flags:
+        with open(args.flags, encoding='utf-8') as f:
+            flags = json.load(f)
+    server = start(flags, args.port, args.latency, args.failure_rate)
+    print(f"🚩 Fake flag API op {server.url}{FLAGS_PATH} - {len(flags)} flags")
+    print("   Ctrl+C om te stoppen")
+    try:
+        while True:
+            time.sleep(1)
+    except KeyboardInterrupt:
+        server.shutdown()
+        print(f"\nStatistiek: {server.stats.snapshot()}")
+
+
+if __name__ == '__main__':
+    main()
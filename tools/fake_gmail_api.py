@@ -0,0 +1,235 @@
+#!/usr/bin/env python3
+"""
+Fake Gmail API - local stand-in for the Gmail REST endpoints the importers use
+
+Serves a mail_corpus mbox over HTTP with the same paths and JSON shapes as
+gmail.googleapis.com:
+
+    GET /gmail/v1/users/{user}/profile
+    GET /gmail/v1/users/{user}/messages?q=&maxResults=&pageToken=
+    GET /gmail/v1/users/{user}/messages/{id}?format=raw|minimal|metadata|full
+
+Point googleapiclient at it with
+    build('gmail', 'v1', http=httplib2.Http(), static_discovery=True,
+          client_options={'api_endpoint': 'http://127.0.0.1:<port>/'})
+
+--latency sleeps per request (requests run in parallel threads, like a real
+round trip); --rate-limit answers 429 with Retry-After above that many
+requests per second, to exercise quota handling.
+
+Usage:
+    python fake_gmail_api.py corpus.mbox [--port 8085] [--latency 0.05] [--rate-limit 50]
+"""
+
+import argparse
+import base64
+import email
+import json
+import threading
+import time
+from email import policy
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+from fake_imap_server import ALL_MAIL, FakeMailbox, Stats, gmail_query
+from mail_corpus import load_mbox
+
+DEFAULT_PAGE_SIZE = 100
+MAX_PAGE_SIZE = 500
+
+
+def _b64(data):
+    return base64.urlsafe_b64encode(data).decode('ascii')
+
+
+def _payload(part):
+    """Gmail 'full' payload for an email.message part"""
+    payload = {
+        'mimeType': part.get_content_type(),
+        'filename': part.get_filename() or '',
+        'headers': [{'name': k, 'value': str(v)} for k, v in part.items()],
+    }
+    if part.is_multipart():
+        payload['body'] = {'size': 0}
+        payload['parts'] = [_payload(p) for p in part.iter_parts()]
+    else:
+        data = part.get_payload(decode=True) or b''
+        payload['body'] = {'size': len(data), 'data': _b64(data)}
+    return payload
+
+
+class GmailCorpus:
+    """Messages in Gmail shape: hex ids, thread ids from In-Reply-To/References, newest first"""
+
+    def __init__(self, messages, account='me@example.com'):
+        self.account = account
+        mailbox = FakeMailbox(messages, gmail=True)
+        entries = [message for _, message in mailbox.folders[ALL_MAIL]]
+        self.by_id = {}
+        self.threads = {}
+        roots = {}
+        for message in entries:
+            gmail_id = format(message.gm_msgid, 'x')
+            head = email.message_from_bytes(message.head, policy=policy.default)
+            references = str(head.get('References', '') or '').split() + [str(head.get('In-Reply-To', '') or '').strip()]
+            thread_id = next((roots[r] for r in references if r in roots), gmail_id)
+            roots[str(head.get('Message-ID', '')).strip()] = thread_id
+            self.by_id[gmail_id] = message
+            self.threads[gmail_id] = thread_id
+        self.order = sorted(self.by_id, key=lambda i: -self.by_id[i].gm_msgid)
+
+    def search(self, query):
+        if not query:
+            return list(self.order)
+        match = gmail_query(query)
+        return [gmail_id for gmail_id in self.order if match(self.by_id[gmail_id])]
+
+
+class RateLimiter:
+    """Fixed one-second windows; allow() is False above `rate` requests in the current window"""
+
+    def __init__(self, rate):
+        self.rate = rate
+        self.window = int(time.monotonic())
+        self.count = 0
+        self.lock = threading.Lock()
+
+    def allow(self):
+        with self.lock:
+            now = int(time.monotonic())
+            if now != self.window:
+                self.window = now
+                self.count = 0
+            self.count += 1
+            return self.count <= self.rate
+
+
+class GmailHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+
+    def log_message(self, format, *args):
+        pass
+
+    def send_json(self, status, body, headers=None):
+        data = json.dumps(body).encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json; charset=UTF-8')
+        self.send_header('Content-Length', str(len(data)))
+        for key, value in (headers or {}).items():
+            self.send_header(key, value)
+        self.end_headers()
+        self.wfile.write(data)
+        self.server.stats.add('bytes_out', len(data))
+
+    def error(self, status, reason, message):
+        self.send_json(status, {'error': {'code': status, 'message': message,
+                                          'errors': [{'reason': reason, 'message': message}]}},
+                       {'Retry-After': '1'} if status == 429 else None)
+
+    def do_GET(self):
+        server = self.server
+        server.stats.add('requests')
+        if server.latency:
+            time.sleep(server.latency)
+        if server.rate_limiter and not server.rate_limiter.allow():
+            server.stats.add('throttled')
+            self.error(429, 'rateLimitExceeded', 'User-rate limit exceeded')
+            return
+
+        url = urlparse(self.path)
+        params = {k: v[-1] for k, v in parse_qs(url.query).items()}
+        parts = [p for p in url.path.split('/') if p]
+        # gmail/v1/users/{user}/...
+        if parts[:3] != ['gmail', 'v1', 'users'] or len(parts) < 5:
+            self.error(404, 'notFound', f"Unknown path {url.path}")
+            return
+        resource = parts[4:]
+        corpus = server.corpus
+
+        if resource == ['profile']:
+            self.send_json(200, {'emailAddress': corpus.account, 'messagesTotal': len(corpus.order),
+                                 'threadsTotal': len(set(corpus.threads.values())), 'historyId': '1'})
+        elif resource == ['messages']:
+            ids = corpus.search(params.get('q', ''))
+            size = min(int(params.get('maxResults', DEFAULT_PAGE_SIZE)), MAX_PAGE_SIZE)
+            start = int(params.get('pageToken', 0) or 0)
+            page = ids[start:start + size]
+            body = {'messages': [{'id': i, 'threadId': corpus.threads[i]} for i in page],
+                    'resultSizeEstimate': len(ids)}
+            if start + size < len(ids):
+                body['nextPageToken'] = str(start + size)
+            if not page:
+                del body['messages']
+            self.send_json(200, body)
+        elif len(resource) == 2 and resource[0] == 'messages':
+            message = corpus.by_id.get(resource[1])
+            if message is None:
+                self.error(404, 'notFound', 'Requested entity was not found.')
+                return
+            self.send_json(200, self.message_body(resource[1], message, params.get('format', 'full')))
+        else:
+            self.error(404, 'notFound', f"Unknown path {url.path}")
+
+    def message_body(self, gmail_id, message, format):
+        corpus = self.server.corpus
+        body = {
+            'id': gmail_id,
+            'threadId': corpus.threads[gmail_id],
+            'labelIds': ['INBOX'],
+            'sizeEstimate': len(message.raw),
+            'historyId': '1',
+            'internalDate': str(message.gm_msgid),
+        }
+        if format == 'raw':
+            body['raw'] = _b64(message.raw)
+        elif format == 'metadata':
+            head = email.message_from_bytes(message.head, policy=policy.default)
+            body['payload'] = {'headers': [{'name': k, 'value': str(v)} for k, v in head.items()]}
+        elif format == 'full':
+            body['payload'] = _payload(email.message_from_bytes(message.raw, policy=policy.default))
+        return body
+
+
+class FakeGmailServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self, address, corpus, latency=0.0, rate_limit=None):
+        super().__init__(address, GmailHandler)
+        self.corpus = corpus
+        self.latency = latency
+        self.rate_limiter = RateLimiter(rate_limit) if rate_limit else None
+        self.stats = Stats()
+
+    @property
+    def url(self):
+        return f"http://127.0.0.1:{self.server_address[1]}/"
+
+
+def start(messages, port=0, latency=0.0, rate_limit=None, account='me@example.com'):
+    """Start a server on 127.0.0.1 in a background thread; server.url is the api_endpoint"""
+    server = FakeGmailServer(('127.0.0.1', port), GmailCorpus(messages, account), latency, rate_limit)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Local fake Gmail REST API for a mail_corpus mbox")
+    parser.add_argument('mbox')
+    parser.add_argument('--port', type=int, default=8085)
+    parser.add_argument('--latency', type=float, default=0.0, help="seconds added to every request")
+    parser.add_argument('--rate-limit', type=int, help="requests per second before 429 responses")
+    args = parser.parse_args()
+
+    server = start(load_mbox(args.mbox), args.port, args.latency, args.rate_limit)
+    print(f"📬 Fake Gmail API op {server.url} - {len(server.corpus.order)} emails")
+    print("   Ctrl+C om te stoppen")
+    try:
+        while True:
+            time.sleep(1)
+    except KeyboardInterrupt:
+        server.shutdown()
+        print(f"\nStatistiek: {server.stats.snapshot()}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,572 @@
+#!/usr/bin/env python3
+"""
+Fake IMAP Server - local IMAP4rev1 stand-in for offline import tests and benchmarks
+
+Serves a mail_corpus mbox from memory: incoming mail in INBOX, outgoing mail
+in Sent and, in --gmail mode, everything again in [Gmail]/All Mail (same
+X-GM-MSGID, like the real thing). Implements what the importers use: LOGIN,
+CAPABILITY, ENABLE CONDSTORE, LIST, SELECT/EXAMINE, (UID) SEARCH with
+FROM/TO/CC/BCC/SUBJECT/BODY/TEXT/OR/NOT/UID/SINCE/BEFORE and X-GM-RAW,
+(UID) FETCH with RFC822, RFC822.SIZE, FLAGS, X-GM-MSGID and
+BODY.PEEK[HEADER.FIELDS (...)], NOOP, IDLE and LOGOUT.
+
+--latency delays every response by that many seconds without serialising
+pipelined commands, so it behaves like a round trip to a remote server.
+Bytes in/out and command counts are kept in server.stats.
+
+Usage:
+    python fake_imap_server.py corpus.mbox [--port 1143] [--latency 0.05] [--gmail]
+                               [--certfile cert.pem --keyfile key.pem]
+"""
+
+import argparse
+import email
+import heapq
+import re
+import socketserver
+import ssl
+import threading
+import time
+from datetime import datetime
+from email import policy
+from email.utils import parsedate_to_datetime
+
+from mail_corpus import load_mbox
+
+UIDVALIDITY = 1
+ALL_MAIL = '[Gmail]/All Mail'
+
+TOKEN_RE = re.compile(rb'\(|\)|"(?:[^"\\]|\\.)*"|[^\s()]+')
+BODY_ITEM_RE = re.compile(r'BODY(?:\.PEEK)?\[([^\]]*)\]', re.I)
+LITERAL_RE = re.compile(rb'\{(\d+)\+?\}\r\n$')
+
+
+class FakeMessage:
+    def __init__(self, raw, gm_msgid):
+        self.raw = raw
+        self.gm_msgid = gm_msgid
+        self.flags = []
+        head, _, body = raw.partition(b'\r\n\r\n')
+        self.head = head + b'\r\n\r\n'
+        msg = email.message_from_bytes(self.head, policy=policy.default)
+        self.headers = {}
+        for name in ('From', 'To', 'Cc', 'Bcc', 'Subject', 'Message-ID'):
+            try:
+                self.headers[name.upper()] = ' '.join(str(v) for v in msg.get_all(name, [])).lower()
+            except Exception:
+                self.headers[name.upper()] = ''
+        try:
+            self.date = parsedate_to_datetime(str(msg['Date'])).date()
+        except (TypeError, ValueError):
+            self.date = None
+        self.text = raw.decode('latin-1').lower()
+
+    def header_fields(self, names):
+        """Header block with only the given fields (HEADER.FIELDS)"""
+        wanted = {n.upper() for n in names}
+        lines = []
+        keep = False
+        for line in self.head.split(b'\r\n'):
+            if not line:
+                continue
+            if line[:1] in (b' ', b'\t'):
+                if keep:
+                    lines.append(line)
+                continue
+            keep = line.split(b':', 1)[0].decode('latin-1').upper() in wanted
+            if keep:
+                lines.append(line)
+        return b'\r\n'.join(lines) + b'\r\n\r\n'
+
+
+class FakeMailbox:
+    """Folders with (uid, FakeMessage) lists; thread-safe delivery"""
+
+    def __init__(self, messages=(), gmail=False):
+        self.gmail = gmail
+        self.folders = {'INBOX': [], 'Sent': []}
+        if gmail:
+            self.folders[ALL_MAIL] = []
+        self.modseq = 1
+        self.lock = threading.Lock()
+        self._next_gm_msgid = 1000
+        for direction, raw in messages:
+            self.deliver('Sent' if direction == 'out' else 'INBOX', raw)
+
+    def deliver(self, folder, raw):
+        """Append a message (and to All Mail in gmail mode); returns its UID in folder"""
+        with self.lock:
+            self._next_gm_msgid += 1
+            message = FakeMessage(raw, self._next_gm_msgid)
+            self.modseq += 1
+            targets = [folder] + ([ALL_MAIL] if self.gmail and folder != ALL_MAIL else [])
+            uid = None
+            for name in targets:
+                entries = self.folders.setdefault(name, [])
+                next_uid = entries[-1][0] + 1 if entries else 1
+                entries.append((next_uid, message))
+                if name == folder:
+                    uid = next_uid
+            return uid
+
+    def uidnext(self, folder):
+        entries = self.folders[folder]
+        return entries[-1][0] + 1 if entries else 1
+
+
+def _parse_set(text, maximum):
+    numbers = set()
+    for part in text.split(','):
+        start, _, end = part.partition(':')
+        start = maximum if start == '*' else int(start)
+        end = start if not end else (maximum if end == '*' else int(end))
+        if start > end:
+            start, end = end, start
+        numbers.update(range(start, end + 1))
+    return numbers
+
+
+def _unquote(token):
+    if token.startswith(b'"'):
+        return re.sub(rb'\\(.)', rb'\1', token[1:-1]).decode()
+    return token.decode()
+
+
+def gmail_query(query):
+    """X-GM-RAW subset: terms joined by OR; from:/to:/subject: prefixes, plain words match anywhere"""
+    terms = [t.strip().strip('"') for t in re.split(r'\s+OR\s+', query)]
+    def match(message):
+        for term in terms:
+            key, _, value = term.partition(':')
+            if value and key.lower() in ('from', 'to', 'cc', 'subject'):
+                if value.lower() in message.headers[key.upper()]:
+                    return True
+            elif term.lower() in message.text:
+                return True
+        return False
+    return match
+
+
+class _Search:
+    """Compile SEARCH criteria into a predicate over (seq, uid, message)"""
+
+    def __init__(self, tokens, max_seq, max_uid):
+        self.tokens = tokens
+        self.pos = 0
+        self.max_seq = max_seq
+        self.max_uid = max_uid
+
+    def compile(self):
+        keys = []
+        while self.pos < len(self.tokens):
+            keys.append(self._key())
+        return lambda seq, uid, m: all(key(seq, uid, m) for key in keys)
+
+    def _next(self):
+        token = self.tokens[self.pos]
+        self.pos += 1
+        return token
+
+    def _key(self):
+        token = self._next()
+        if token == b'(':
+            keys = []
+            while self.tokens[self.pos] != b')':
+                keys.append(self._key())
+            self.pos += 1
+            return lambda seq, uid, m: all(key(seq, uid, m) for key in keys)
+        name = token.decode().upper()
+        if name == 'OR':
+            left, right = self._key(), self._key()
+            return lambda seq, uid, m: left(seq, uid, m) or right(seq, uid, m)
+        if name == 'NOT':
+            inner = self._key()
+            return lambda seq, uid, m: not inner(seq, uid, m)
+        if name in ('FROM', 'TO', 'CC', 'BCC', 'SUBJECT'):
+            value = _unquote(self._next()).lower()
+            return lambda seq, uid, m: value in m.headers[name]
+        if name in ('BODY', 'TEXT'):
+            value = _unquote(self._next()).lower()
+            return lambda seq, uid, m: value in m.text
+        if name == 'HEADER':
+            field, value = _unquote(self._next()).upper(), _unquote(self._next()).lower()
+            return lambda seq, uid, m: value in m.headers.get(field, '')
+        if name == 'X-GM-RAW':
+            match = gmail_query(_unquote(self._next()))
+            return lambda seq, uid, m: match(m)
+        if name == 'UID':
+            uids = _parse_set(self._next().decode(), self.max_uid)
+            return lambda seq, uid, m: uid in uids
+        if name in ('SINCE', 'BEFORE', 'ON'):
+            day = datetime.strptime(_unquote(self._next()), '%d-%b-%Y').date()
+            compare = {'SINCE': lambda d: d >= day, 'BEFORE': lambda d: d < day, 'ON': lambda d: d == day}[name]
+            return lambda seq, uid, m: m.date is not None and compare(m.date)
+        if name == 'LARGER':
+            size = int(self._next())
+            return lambda seq, uid, m: len(m.raw) > size
+        if name == 'SMALLER':
+            size = int(self._next())
+            return lambda seq, uid, m: len(m.raw) < size
+        if re.match(r'^[\d*:,]+$', name):
+            seqs = _parse_set(name, self.max_seq)
+            return lambda seq, uid, m: seq in seqs
+        # ALL, SEEN, UNSEEN, ... gedragen zich als ALL
+        return lambda seq, uid, m: True
+
+
+def _fetch_items(text):
+    """'(UID RFC822.SIZE BODY.PEEK[HEADER.FIELDS (FROM TO)])' -> list of item strings"""
+    text = text.strip()
+    if text.startswith('(') and text.endswith(')'):
+        text = text[1:-1]
+    items = []
+    depth = 0
+    current = ''
+    for char in text:
+        if char in '[(':
+            depth += 1
+        elif char in '])':
+            depth -= 1
+        if char == ' ' and depth == 0:
+            if current:
+                items.append(current)
+            current = ''
+        else:
+            current += char
+    if current:
+        items.append(current)
+    return items
+
+
+class _Sender(threading.Thread):
+    """Writes responses after `latency` seconds, in order, without blocking the reader"""
+
+    def __init__(self, wfile, latency, stats):
+        super().__init__(daemon=True)
+        self.wfile = wfile
+        self.latency = latency
+        self.stats = stats
+        self.queue = []
+        self.counter = 0
+        self.cond = threading.Condition()
+        self.closed = False
+
+    def send(self, data, delayed=True):
+        with self.cond:
+            self.counter += 1
+            due = time.monotonic() + (self.latency if delayed else 0)
+            heapq.heappush(self.queue, (due, self.counter, data))
+            self.cond.notify()
+
+    def close(self):
+        with self.cond:
+            self.closed = True
+            self.cond.notify()
+        self.join(timeout=5)
+
+    def run(self):
+        while True:
+            with self.cond:
+                while not self.queue and not self.closed:
+                    self.cond.wait()
+                if not self.queue and self.closed:
+                    return
+                due, _, data = self.queue[0]
+                wait = due - time.monotonic()
+                if wait > 0:
+                    self.cond.wait(wait)
+                    continue
+                heapq.heappop(self.queue)
+            try:
+                self.wfile.write(data)
+                self.wfile.flush()
+            except OSError:
+                return
+            self.stats.add('bytes_out', len(data))
+
+
+class Stats:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.values = {'bytes_in': 0, 'bytes_out': 0, 'commands': 0, 'connections': 0}
+
+    def add(self, key, amount=1):
+        with self.lock:
+            self.values[key] = self.values.get(key, 0) + amount
+
+    def snapshot(self):
+        with self.lock:
+            return dict(self.values)
+
+    def reset(self):
+        with self.lock:
+            for key in self.values:
+                self.values[key] = 0
+
+
+class ImapHandler(socketserver.StreamRequestHandler):
+    def setup(self):
+        super().setup()
+        self.mailbox = self.server.mailbox
+        self.stats = self.server.stats
+        self.stats.add('connections')
+        self.sender = _Sender(self.wfile, self.server.latency, self.stats)
+        self.sender.start()
+        self.selected = None
+        self.idle_tag = None
+
+    def finish(self):
+        self.server.forget_idler(self)
+        self.sender.close()
+        try:
+            super().finish()
+        except OSError:
+            pass
+
+    def capabilities(self):
+        caps = ['IMAP4rev1', 'IDLE', 'ENABLE', 'CONDSTORE', 'UIDPLUS', 'LITERAL+']
+        if self.mailbox.gmail:
+            caps.append('X-GM-EXT-1')
+        return ' '.join(caps)
+
+    def handle(self):
+        self.sender.send(f"* OK [CAPABILITY {self.capabilities()}] Fake IMAP ready\r\n".encode(), delayed=False)
+        while True:
+            line = self.rfile.readline()
+            if not line:
+                return
+            self.stats.add('bytes_in', len(line))
+            # Literals van de client (bv. LOGIN met bijzondere tekens)
+            while LITERAL_RE.search(line):
+                size = int(LITERAL_RE.search(line).group(1))
+                if b'+}' not in line:
+                    self.sender.send(b"+ Ready\r\n", delayed=False)
+                literal = self.rfile.read(size)
+                line = line[:LITERAL_RE.search(line).start()] + b'"' + literal.replace(b'"', b'\\"') + b'"'
+                rest = self.rfile.readline()
+                line += rest
+            if self.idle_tag:
+                if line.strip().upper() == b'DONE':
+                    self.server.forget_idler(self)
+                    self.sender.send(f"{self.idle_tag} OK IDLE terminated\r\n".encode())
+                    self.idle_tag = None
+                continue
+            self.stats.add('commands')
+            if not self.dispatch(line.rstrip(b'\r\n')):
+                return
+
+    def reply(self, text):
+        self.sender.send(text.encode() + b'\r\n' if isinstance(text, str) else text)
+
+    def dispatch(self, line):
+        parts = line.split(b' ', 2)
+        tag = parts[0].decode(errors='replace')
+        command = parts[1].decode(errors='replace').upper() if len(parts) > 1 else ''
+        args = parts[2] if len(parts) > 2 else b''
+        uid = False
+        if command == 'UID':
+            sub, _, args = args.partition(b' ')
+            command = sub.decode().upper()
+            uid = True
+
+        if command == 'CAPABILITY':
+            self.reply(f"* CAPABILITY {self.capabilities()}")
+        elif command in ('LOGIN', 'AUTHENTICATE'):
+            pass
+        elif command == 'ENABLE':
+            self.reply(f"* ENABLED {args.decode()}")
+        elif command == 'LIST':
+            for name in self.mailbox.folders:
+                self.reply(f'* LIST (\\HasNoChildren) "/" "{name}"')
+        elif command in ('SELECT', 'EXAMINE'):
+            folder = _unquote(args.strip())
+            if folder not in self.mailbox.folders:
+                self.reply(f"{tag} NO [NONEXISTENT] Unknown mailbox {folder}")
+                return True
+            self.selected = folder
+            with self.mailbox.lock:
+                count = len(self.mailbox.folders[folder])
+                uidnext = self.mailbox.uidnext(folder)
+                modseq = self.mailbox.modseq
+            self.reply("* FLAGS (\\Answered \\Flagged \\Deleted \\Seen \\Draft)")
+            self.reply(f"* {count} EXISTS")
+            self.reply("* 0 RECENT")
+            self.reply(f"* OK [UIDVALIDITY {UIDVALIDITY}] UIDs valid")
+            self.reply(f"* OK [UIDNEXT {uidnext}] Predicted next UID")
+            self.reply(f"* OK [HIGHESTMODSEQ {modseq}] Highest")
+            mode = 'READ-ONLY' if command == 'EXAMINE' else 'READ-WRITE'
+            self.reply(f"{tag} OK [{mode}] {command} completed")
+            return True
+        elif command == 'SEARCH':
+            if self.selected is None:
+                self.reply(f"{tag} BAD No mailbox selected")
+                return True
+            self.search(args, uid)
+        elif command == 'FETCH':
+            if self.selected is None:
+                self.reply(f"{tag} BAD No mailbox selected")
+                return True
+            self.fetch(args, uid)
+        elif command == 'IDLE':
+            self.idle_tag = tag
+            self.server.register_idler(self)
+            self.sender.send(b"+ idling\r\n", delayed=False)
+            return True
+        elif command in ('NOOP', 'CHECK', 'CLOSE'):
+            pass
+        elif command == 'LOGOUT':
+            self.reply("* BYE Fake IMAP logging out")
+            self.reply(f"{tag} OK LOGOUT completed")
+            return False
+        else:
+            self.reply(f"{tag} BAD Unknown command {command}")
+            return True
+        self.reply(f"{tag} OK {command} completed")
+        return True
+
+    def _entries(self):
+        with self.mailbox.lock:
+            return list(self.mailbox.folders[self.selected])
+
+    def search(self, args, uid):
+        tokens = TOKEN_RE.findall(args)
+        if tokens and tokens[0].upper() == b'CHARSET':
+            tokens = tokens[2:]
+        entries = self._entries()
+        max_uid = entries[-1][0] if entries else 0
+        predicate = _Search(tokens, len(entries), max_uid).compile()
+        hits = [str(u if uid else seq) for seq, (u, m) in enumerate(entries, 1) if predicate(seq, u, m)]
+        self.reply("* SEARCH" + ''.join(' ' + h for h in hits))
+
+    def fetch(self, args, uid):
+        numbers, _, items = args.decode(errors='replace').partition(' ')
+        items = _fetch_items(items)
+        entries = self._entries()
+        max_uid = entries[-1][0] if entries else 0
+        wanted = _parse_set(numbers, max_uid if uid else len(entries))
+        if uid and not any(i.upper() == 'UID' for i in items):
+            items = ['UID'] + items
+        for seq, (message_uid, message) in enumerate(entries, 1):
+            if (message_uid if uid else seq) in wanted:
+                self.reply(self.fetch_response(seq, message_uid, message, items))
+
+    def fetch_response(self, seq, uid, message, items):
+        out = [f"* {seq} FETCH (".encode()]
+        first = True
+        for item in items:
+            upper = item.upper()
+            prefix = b'' if first else b' '
+            first = False
+            if upper == 'UID':
+                out.append(prefix + f"UID {uid}".encode())
+            elif upper == 'FLAGS':
+                out.append(prefix + f"FLAGS ({' '.join(message.flags)})".encode())
+            elif upper == 'RFC822.SIZE':
+                out.append(prefix + f"RFC822.SIZE {len(message.raw)}".encode())
+            elif upper == 'X-GM-MSGID':
+                out.append(prefix + f"X-GM-MSGID {message.gm_msgid}".encode())
+            elif upper == 'X-GM-THRID':
+                out.append(prefix + f"X-GM-THRID {message.gm_msgid}".encode())
+            elif upper in ('RFC822', 'BODY[]', 'BODY.PEEK[]', 'RFC822.HEADER'):
+                name = 'RFC822.HEADER' if upper == 'RFC822.HEADER' else ('RFC822' if upper == 'RFC822' else 'BODY[]')
+                data = message.head if name == 'RFC822.HEADER' else message.raw
+                out.append(prefix + f"{name} {{{len(data)}}}\r\n".encode() + data)
+            else:
+                body = BODY_ITEM_RE.match(item)
+                if not body:
+                    continue
+                section = body.group(1)
+                upper_section = section.upper()
+                if upper_section.startswith('HEADER.FIELDS'):
+                    names = section[section.index('(') + 1:section.rindex(')')].split()
+                    data = message.header_fields(names)
+                elif upper_section == 'HEADER':
+                    data = message.head
+                elif upper_section == 'TEXT':
+                    data = message.raw[len(message.head):]
+                else:
+                    data = message.raw
+                out.append(prefix + f"BODY[{section}] {{{len(data)}}}\r\n".encode() + data)
+        out.append(b")\r\n")
+        return b''.join(out)
+
+    def notify_exists(self):
+        with self.mailbox.lock:
+            count = len(self.mailbox.folders.get(self.selected, []))
+        self.sender.send(f"* {count} EXISTS\r\n".encode(), delayed=False)
+
+
+class FakeImapServer(socketserver.ThreadingTCPServer):
+    allow_reuse_address = True
+    daemon_threads = True
+
+    def __init__(self, address, mailbox, latency=0.0, ssl_context=None):
+        super().__init__(address, ImapHandler)
+        self.mailbox = mailbox
+        self.latency = latency
+        self.ssl_context = ssl_context
+        self.stats = Stats()
+        self._idlers = set()
+        self._idle_lock = threading.Lock()
+
+    def get_request(self):
+        sock, address = super().get_request()
+        if self.ssl_context:
+            sock = self.ssl_context.wrap_socket(sock, server_side=True)
+        return sock, address
+
+    def register_idler(self, handler):
+        with self._idle_lock:
+            self._idlers.add(handler)
+
+    def forget_idler(self, handler):
+        with self._idle_lock:
+            self._idlers.discard(handler)
+
+    def deliver(self, folder, raw):
+        """New mail arrives: store it and wake IDLE clients that have the folder selected"""
+        uid = self.mailbox.deliver(folder, raw)
+        with self._idle_lock:
+            idlers = list(self._idlers)
+        for handler in idlers:
+            if handler.selected in (folder, ALL_MAIL):
+                handler.notify_exists()
+        return uid
+
+
+def start(messages, port=0, latency=0.0, gmail=False, certfile=None, keyfile=None):
+    """Start a server on 127.0.0.1 in a background thread; server.server_address[1] is the port"""
+    context = None
+    if certfile:
+        context = ssl.create_default_context(ssl.Purpose.CLIENT_AUTH)
+        context.load_cert_chain(certfile, keyfile)
+    server = FakeImapServer(('127.0.0.1', port), FakeMailbox(messages, gmail=gmail), latency, context)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Local fake IMAP server for a mail_corpus mbox")
+    parser.add_argument('mbox')
+    parser.add_argument('--port', type=int, default=1143)
+    parser.add_argument('--latency', type=float, default=0.0, help="seconds added to every response")
+    parser.add_argument('--gmail', action='store_true', help="Gmail extensions and [Gmail]/All Mail")
+    parser.add_argument('--certfile')
+    parser.add_argument('--keyfile')
+    args = parser.parse_args()
+
+    messages = load_mbox(args.mbox)
+    server = start(messages, args.port, args.latency, args.gmail, args.certfile, args.keyfile)
+    folders = ', '.join(f"{name} ({len(entries)})" for name, entries in server.mailbox.folders.items())
+    print(f"📬 Fake IMAP op 127.0.0.1:{server.server_address[1]} - {folders}")
+    print("   Ctrl+C om te stoppen")
+    try:
+        while True:
+            time.sleep(1)
+    except KeyboardInterrupt:
+        server.shutdown()
+        print(f"\nStatistiek: {server.stats.snapshot()}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,247 @@
+#!/usr/bin/env python3
+"""
+Fake SSH Server - local SSH/SFTP stand-in for upload-feature-flags.py (needs paramiko)
+
+Password login, an SFTP subsystem backed by a local directory and exec
+requests. Remote Windows paths map into the root directory
+("C:/stores/x.json" -> <root>/C/stores/x.json); parent directories are
+created on upload. rename fails when the target exists (like Windows),
+posix-rename@openssh.com replaces it.
+
+Exec commands go to on_exec(command) -> (output, exit status); by default a
+Restart-WebAppPool command is answered with exit status 0. --latency delays
+every exec and SFTP open, like a round trip to a remote server.
+
+Usage:
+    python fake_ssh_server.py --root /tmp/fake-server [--port 2222] [--latency 0.05]
+"""
+
+import argparse
+import os
+import socket
+import threading
+import time
+from pathlib import Path
+
+import paramiko
+
+from fake_imap_server import Stats
+
+USERNAME = 'administrator'
+PASSWORD = 'YOUR_SERVER_PASSWORD'
+
+_host_key = None
+_host_key_lock = threading.Lock()
+
+
+def host_key():
+    """One RSA host key per process (generating one takes a moment)"""
+    global _host_key
+    with _host_key_lock:
+        if _host_key is None:
+            _host_key = paramiko.RSAKey.generate(2048)
+        return _host_key
+
+
+def local_path(root, path):
+    path = path.replace('\\', '/')
+    drive, colon, rest = path.partition(':')
+    if colon and len(drive) == 1:
+        path = f"{drive}/{rest}"
+    return Path(root) / path.lstrip('/')
+
+
+def default_exec(command):
+    return '', 0
+
+
+class SshInterface(paramiko.ServerInterface):
+    def __init__(self, server):
+        self.server = server
+
+    def get_allowed_auths(self, username):
+        return 'password'
+
+    def check_auth_password(self, username, password):
+        if (username, password) == (self.server.username, self.server.password):
+            return paramiko.AUTH_SUCCESSFUL
+        return paramiko.AUTH_FAILED
+
+    def check_channel_request(self, kind, chanid):
+        if kind == 'session':
+            return paramiko.OPEN_SUCCEEDED
+        return paramiko.OPEN_FAILED_ADMINISTRATIVELY_PROHIBITED
+
+    def check_channel_exec_request(self, channel, command):
+        threading.Thread(target=self.server.run_exec, args=(channel, command.decode('utf-8')), daemon=True).start()
+        return True
+
+
+class SftpHandle(paramiko.SFTPHandle):
+    def stat(self):
+        try:
+            return paramiko.SFTPAttributes.from_stat(os.fstat((self.readfile or self.writefile).fileno()))
+        except OSError as e:
+            return paramiko.SFTPServer.convert_errno(e.errno)
+
+
+class SftpInterface(paramiko.SFTPServerInterface):
+    def __init__(self, interface, server, *args, **kwargs):
+        super().__init__(interface, *args, **kwargs)
+        self.server = server
+
+    def _path(self, path):
+        return local_path(self.server.root, path)
+
+    def open(self, path, flags, attr):
+        self.server.delay()
+        self.server.stats.add('sftp_opens')
+        target = self._path(path)
+        try:
+            if flags & (os.O_WRONLY | os.O_RDWR):
+                target.parent.mkdir(parents=True, exist_ok=True)
+            fd = os.open(target, flags | getattr(os, 'O_BINARY', 0), 0o666)
+        except OSError as e:
+            return paramiko.SFTPServer.convert_errno(e.errno)
+        if flags & os.O_WRONLY:
+            mode = 'ab' if flags & os.O_APPEND else 'wb'
+        elif flags & os.O_RDWR:
+            mode = 'a+b' if flags & os.O_APPEND else 'r+b'
+        else:
+            mode = 'rb'
+        handle = SftpHandle(flags)
+        handle.filename = str(target)
+        handle.readfile = handle.writefile = os.fdopen(fd, mode)
+        return handle
+
+    def stat(self, path):
+        try:
+            return paramiko.SFTPAttributes.from_stat(os.stat(self._path(path)))
+        except OSError as e:
+            return paramiko.SFTPServer.convert_errno(e.errno)
+
+    lstat = stat
+
+    def list_folder(self, path):
+        folder = self._path(path)
+        try:
+            return [paramiko.SFTPAttributes.from_stat(entry.stat(), entry.name) for entry in os.scandir(folder)]
+        except OSError as e:
+            return paramiko.SFTPServer.convert_errno(e.errno)
+
+    def remove(self, path):
+        try:
+            os.remove(self._path(path))
+        except OSError as e:
+            return paramiko.SFTPServer.convert_errno(e.errno)
+        return paramiko.SFTP_OK
+
+    def rename(self, oldpath, newpath):
+        # SFTP v3 / Windows: doel mag niet bestaan
+        if self._path(newpath).exists():
+            return paramiko.SFTP_FAILURE
+        return self.posix_rename(oldpath, newpath)
+
+    def posix_rename(self, oldpath, newpath):
+        try:
+            os.replace(self._path(oldpath), self._path(newpath))
+        except OSError as e:
+            return paramiko.SFTPServer.convert_errno(e.errno)
+        self.server.stats.add('renames')
+        return paramiko.SFTP_OK
+
+    def mkdir(self, path, attr):
+        try:
+            self._path(path).mkdir(parents=True)
+        except OSError as e:
+            return paramiko.SFTPServer.convert_errno(e.errno)
+        return paramiko.SFTP_OK
+
+
+class FakeSshServer:
+    def __init__(self, root, port=0, username=USERNAME, password=PASSWORD, latency=0.0, on_exec=None):
+        self.root = Path(root)
+        self.username = username
+        self.password = password
+        self.latency = latency
+        self.on_exec = on_exec or default_exec
+        self.stats = Stats()
+        self.transports = []
+        self.sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        self.sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        self.sock.bind(('127.0.0.1', port))
+        self.sock.listen(64)
+        self.port = self.sock.getsockname()[1]
+        self.running = True
+
+    def delay(self):
+        if self.latency:
+            time.sleep(self.latency)
+
+    def serve_forever(self):
+        while self.running:
+            try:
+                conn, _ = self.sock.accept()
+            except OSError:
+                break
+            self.stats.add('connections')
+            threading.Thread(target=self.handshake, args=(conn,), daemon=True).start()
+
+    def handshake(self, conn):
+        transport = paramiko.Transport(conn)
+        transport.add_server_key(host_key())
+        transport.set_subsystem_handler('sftp', paramiko.SFTPServer, SftpInterface, self)
+        self.transports.append(transport)
+        try:
+            transport.start_server(server=SshInterface(self))
+        except (paramiko.SSHException, EOFError, OSError):
+            transport.close()
+
+    def run_exec(self, channel, command):
+        self.stats.add('commands')
+        self.delay()
+        try:
+            output, status = self.on_exec(command)
+        except Exception as e:
+            output, status = f"{type(e).__name__}: {e}", 1
+        if output:
+            channel.sendall(output.encode('utf-8') if isinstance(output, str) else output)
+        channel.send_exit_status(status)
+        channel.close()
+
+    def shutdown(self):
+        self.running = False
+        self.sock.close()
+        for transport in self.transports:
+            transport.close()
+
+
+def start(root, port=0, username=USERNAME, password=PASSWORD, latency=0.0, on_exec=None):
+    """Start a server on 127.0.0.1 in a background thread; server.port is the port"""
+    server = FakeSshServer(root, port, username, password, latency, on_exec)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Local fake SSH/SFTP server (paramiko)")
+    parser.add_argument('--root', required=True, help="local directory that backs the remote file system")
+    parser.add_argument('--port', type=int, default=2222)
+    parser.add_argument('--user', default=USERNAME)
+    parser.add_argument('--password', default=PASSWORD)
+    parser.add_argument('--latency', type=float, default=0.0)
+    args = parser.parse_args()
+
+    server = start(args.root, args.port, args.user, args.password, args.latency)
+    print(f"🔑 Fake SSH op 127.0.0.1:{server.port} - root {server.root}")
+    print("   Ctrl+C om te stoppen")
+    try:
+        while True:
+            time.sleep(1)
+    except KeyboardInterrupt:
+        server.shutdown()
+        print(f"\nStatistiek: {server.stats.snapshot()}")
+
+
+if __name__ == '__main__':
+    main()
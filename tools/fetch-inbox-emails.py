@@ -2,14 +2,25 @@
 """
 Email Fetcher - Retrieve Inbox Emails via IMAP
 Fetches emails from INBOX folder and saves them as text files
+
+    python fetch-inbox-emails.py            # one incremental run (mail_pipeline.py: fetch, parse and store overlap)
+    python fetch-inbox-emails.py --watch    # stay connected (IDLE), fetch new mail as it lands
 """
 
+import argparse
 import imaplib
 import email
 import os
-import re
-from datetime import datetime
-from pathlib import Path
+from itertools import takewhile
+
+from imap_fetch import FILTER_EXTRA, FILTER_FIELDS, HeaderFilter, fetch_headers, fetch_raw
+from imap_pool import ImapPool
+from imap_sync import SyncState, enable_condstore
+from imap_watch import IDLE_TIMEOUT, POLL_INTERVAL, watch
+from mail_attachments import attachment_store
+from mail_pipeline import Message, Source, run_pipeline
+from mail_store import MailStore
+from mail_threads import thread_index
 
 # Configuration
 IMAP_HOST = "mail.zxcs.nl"
@@ -19,12 +30,14 @@ IMAP_PASSWORD = "hLPFy6MdUnfEDbYTwXps"
 OUTPUT_DIR = r"C:\scripts\correspondence\gemeente-meppel"
 FILTER_FROM = "meppel.nl"  # Only emails FROM this domain
 MAX_EMAILS = 100
-
-def sanitize_filename(text):
-    """Convert text to safe filename"""
-    text = re.sub(r'[<>:"/\\|?*]', '', text)
-    text = re.sub(r'\s+', '_', text)
-    return text[:100]
+FETCH_CHUNK_SIZE = 50  # Messages per UID FETCH round trip
+SYNC_STATE_FILE = os.path.join(OUTPUT_DIR, "imap_sync_state.json")
+TWO_PHASE = True  # Fetch headers first, download bodies only for messages that pass
+SINCE = None  # Optional date window start, e.g. "2024-01-01"
+MAX_MESSAGE_SIZE = None  # Optional size cap in bytes, e.g. 25 * 1024 * 1024
+WATCH_POLL_INTERVAL = POLL_INTERVAL  # Seconds between NOOP polls when the server lacks IDLE
+FETCH_CONNECTIONS = 4  # Pipeline: parallel IMAP connections for the bodies
+SHARD_SIZE = 200  # Pipeline: UIDs per download task
 
 def decode_header(header):
     """Decode email header"""
@@ -42,128 +55,200 @@ def decode_header(header):
             result.append(part)
     return ''.join(result)
 
-def extract_email_body(msg):
-    """Extract email body from message"""
-    body = ""
-    if msg.is_multipart():
-        for part in msg.walk():
-            content_type = part.get_content_type()
-            content_disposition = str(part.get("Content-Disposition"))
-            if content_type == "text/plain" and "attachment" not in content_disposition:
-                try:
-                    body = part.get_payload(decode=True).decode('utf-8', errors='replace')
-                    break
-                except:
-                    pass
-            elif content_type == "text/html" and not body and "attachment" not in content_disposition:
-                try:
-                    body = part.get_payload(decode=True).decode('utf-8', errors='replace')
-                except:
-                    pass
-    else:
-        try:
-            body = msg.get_payload(decode=True).decode('utf-8', errors='replace')
-        except:
-            body = str(msg.get_payload())
-    return body
+def connect():
+    """Open and log in; CONDSTORE enabled so checkpoints can skip unchanged folders"""
+    print("Connecting to IMAP server...")
+    imap = imaplib.IMAP4_SSL(IMAP_HOST, IMAP_PORT)
 
-def main():
-    print("=== Email Fetcher (INBOX) ===")
-    print(f"Host: {IMAP_HOST}")
-    print(f"Email: {EMAIL_ADDRESS}")
-    print(f"Filter: FROM {FILTER_FROM}")
-    print(f"Output: {OUTPUT_DIR}")
-    print()
+    print("Logging in...")
+    imap.login(EMAIL_ADDRESS, IMAP_PASSWORD)
+    enable_condstore(imap)
+    return imap
 
-    Path(OUTPUT_DIR).mkdir(parents=True, exist_ok=True)
+def find_new(imap, sync_state):
+    """Select INBOX; UIDs of matching mail since the last checkpoint. Returns (uids, folder_status)"""
+    status, messages = imap.select('"INBOX"', readonly=True)
+    if status != 'OK':
+        print("Could not select INBOX")
+        return [], None
 
+    # Search only for mail that arrived since the last run
+    email_ids, folder_status = sync_state.search_new(imap, EMAIL_ADDRESS, 'INBOX', f'FROM "{FILTER_FROM}"')
+
+    last_uid = sync_state.checkpoint(EMAIL_ADDRESS, 'INBOX').get('last_uid', 0)
+    print(f"Found {len(email_ids)} new matching emails (after UID {last_uid})")
+
+    # Two-phase: headers + size first, full bodies only for what passes locally
+    if TWO_PHASE and email_ids:
+        header_filter = HeaderFilter(participants=[FILTER_FROM], participant_headers=('From',),
+                                     since=SINCE, max_size=MAX_MESSAGE_SIZE)
+        candidates = list(fetch_headers(imap, email_ids, FILTER_FIELDS, extra=FILTER_EXTRA))
+        accepted, rejected = header_filter.split(candidates)
+        email_ids = [message.uid for message in accepted]
+        if rejected:
+            print(f"Filtered out locally: {rejected}")
+    return email_ids, folder_status
+
+def save_text(store, digest, parsed):
+    """Readable text version next to the raw message; returns (date, from, subject)"""
+    msg = parsed.headers
+
+    # Extract headers
+    subject = decode_header(msg.get('Subject', 'No Subject'))
+    date_str = msg.get('Date', '')
+    to_addr = decode_header(msg.get('To', ''))
+    from_addr = decode_header(msg.get('From', ''))
+    cc_addr = decode_header(msg.get('Cc', ''))
+
+    # Parse date
     try:
-        print("Connecting to IMAP server...")
-        imap = imaplib.IMAP4_SSL(IMAP_HOST, IMAP_PORT)
+        date_parsed = email.utils.parsedate_to_datetime(date_str)
+        date_formatted = date_parsed.strftime('%Y-%m-%d %H:%M:%S')
+    except:
+        date_formatted = date_str
 
-        print("Logging in...")
-        imap.login(EMAIL_ADDRESS, IMAP_PASSWORD)
+    body = parsed.body
 
-        status, messages = imap.select('"INBOX"', readonly=True)
-        if status != 'OK':
-            print("Could not select INBOX")
-            return
+    lines = [
+        "=== EMAIL (RECEIVED) ===",
+        f"Date: {date_formatted}",
+        f"From: {from_addr}",
+        f"To: {to_addr}",
+    ]
+    if cc_addr:
+        lines.append(f"Cc: {cc_addr}")
+    lines.append(f"Subject: {subject}")
+    for attachment in parsed.attachments:
+        lines.append(f"Attachment: {attachment['filename']} ({attachment['size']} bytes)")
+    lines.append("\n--- BODY ---\n")
+    store.put_sidecar(digest, '.txt', "\n".join(lines) + "\n" + body)
+    return date_formatted, from_addr, subject
+
+def sync_inbox(imap, store, sync_state):
+    """Select INBOX and store matching mail that arrived since the last checkpoint"""
+    email_ids, folder_status = find_new(imap, sync_state)
+    total_emails = len(email_ids)
+    if not email_ids:
+        return 0
+
+    # Fetch emails
+    emails_fetched = 0
+    skipped = 0
+    stored_uids = []
+    # UID FETCH in batches of FETCH_CHUNK_SIZE, one round trip per batch
+    for i, (uid, raw_email) in enumerate(fetch_raw(imap, email_ids[-MAX_EMAILS:], FETCH_CHUNK_SIZE), 1):
+        print(f"Fetching {i}/{min(total_emails, MAX_EMAILS)}...", end='\r')
+
+        # Store raw message under its content hash; known mail is a no-op
+        ref = f"imap:{EMAIL_ADDRESS}:INBOX:{folder_status['uidvalidity']}:{uid}"
+        digest, created = store.put(raw_email, ref=ref, label='INBOX', account=EMAIL_ADDRESS, folder='INBOX')
+        stored_uids.append(uid)
+        if not created:
+            skipped += 1
+            continue
+
+        # Stream-parse the stored copy; attachments are decoded once into the deduplicated blob store
+        parsed = attachment_store(store).extract(digest)
+        thread_index(store).add(store, digest)
+        date_formatted, from_addr, subject = save_text(store, digest, parsed)
 
-        print("Selected folder: INBOX")
+        emails_fetched += 1
+        print(f"  ✓ {date_formatted}  {from_addr}: {subject}")
 
-        # Search for emails
-        print(f"Searching for emails from '{FILTER_FROM}'...")
-        status, message_ids = imap.search(None, f'(FROM "{FILTER_FROM}")')
+    # Checkpoint only after the messages are stored
+    wanted = min(total_emails, MAX_EMAILS)
+    sync_state.commit(EMAIL_ADDRESS, 'INBOX', folder_status, stored_uids,
+                      complete=len(stored_uids) == wanted)
 
-        if status != 'OK':
-            print("No messages found.")
+    print(f"Fetched: {emails_fetched} new emails ({skipped} already stored)")
+    return emails_fetched
+
+class InboxSource(Source):
+    """
+    sync_inbox() as a pipeline source (mail_pipeline.py): one search, then
+    UID shards downloaded over FETCH_CONNECTIONS connections while earlier
+    messages are parsed and stored.
+    """
+
+    name = 'fetch-inbox-emails'
+
+    @property
+    def root(self):
+        return OUTPUT_DIR
+
+    def open(self, store):
+        super().open(store)
+        self.sync_state = SyncState(SYNC_STATE_FILE)
+        self.pool = ImapPool(connect, FETCH_CONNECTIONS, EMAIL_ADDRESS)
+        self.workers = {'fetch': FETCH_CONNECTIONS}
+        self.folder_status = None
+        self.planned = []
+        self.stored_uids = set()
+        self.new = 0
+
+    def list(self, search):
+        with self.pool.connection() as imap:
+            email_ids, self.folder_status = find_new(imap, self.sync_state)
+        self.planned = email_ids[-MAX_EMAILS:]
+        for start in range(0, len(self.planned), SHARD_SIZE):
+            yield tuple(self.planned[start:start + SHARD_SIZE])
+
+    def fetch(self, uids):
+        with self.pool.connection() as imap:
+            imap.select('"INBOX"', readonly=True)
+            for uid, raw_email in fetch_raw(imap, uids, FETCH_CHUNK_SIZE):
+                ref = f"imap:{EMAIL_ADDRESS}:INBOX:{self.folder_status['uidvalidity']}:{uid}"
+                yield Message(raw_email, key=uid, ref=ref, label='INBOX', account=EMAIL_ADDRESS, folder='INBOX')
+
+    def stored(self, message):
+        self.stored_uids.add(message.key)
+        if message.created:
+            save_text(self.store, message.digest, message.parsed)
+            self.new += 1
+
+    def close(self, complete):
+        self.pool.close()
+        if self.folder_status is None:
             return
+        # Checkpoint only up to the first UID that did not make it into the store
+        done = list(takewhile(lambda uid: uid in self.stored_uids, self.planned))
+        self.sync_state.commit(EMAIL_ADDRESS, 'INBOX', self.folder_status, done,
+                               complete=complete and len(done) == len(self.planned))
+        print(f"Fetched: {self.new} new emails ({len(self.stored_uids) - self.new} already stored)")
 
-        email_ids = message_ids[0].split()
-        total_emails = len(email_ids)
-        print(f"Found {total_emails} matching emails")
+def pipeline_source():
+    return InboxSource()
+
+def main():
+    parser = argparse.ArgumentParser(description="Fetch INBOX mail from FILTER_FROM into the mail store")
+    parser.add_argument('--watch', action='store_true',
+                        help="keep the connection open (IMAP IDLE, NOOP polling as fallback)")
+    parser.add_argument('--poll-interval', type=int, default=WATCH_POLL_INTERVAL,
+                        help="seconds between NOOP polls without IDLE")
+    args = parser.parse_args()
 
-        # Fetch emails
-        emails_fetched = 0
-        for i, email_id in enumerate(email_ids[-MAX_EMAILS:], 1):
-            print(f"Fetching {i}/{min(total_emails, MAX_EMAILS)}...", end='\r')
+    print("=== Email Fetcher (INBOX) ===")
+    print(f"Host: {IMAP_HOST}")
+    print(f"Email: {EMAIL_ADDRESS}")
+    print(f"Filter: FROM {FILTER_FROM}")
+    print(f"Output: {OUTPUT_DIR}")
+    print()
 
-            status, msg_data = imap.fetch(email_id, '(RFC822)')
-            if status != 'OK':
-                continue
+    store = MailStore(OUTPUT_DIR)
+    sync_state = SyncState(SYNC_STATE_FILE)
 
-            raw_email = msg_data[0][1]
-            msg = email.message_from_bytes(raw_email)
+    if args.watch:
+        watch(connect, lambda imap: sync_inbox(imap, store, sync_state),
+              idle_timeout=IDLE_TIMEOUT, poll_interval=args.poll_interval)
+        return
 
-            # Extract headers
-            subject = decode_header(msg.get('Subject', 'No Subject'))
-            date_str = msg.get('Date', '')
-            to_addr = decode_header(msg.get('To', ''))
-            from_addr = decode_header(msg.get('From', ''))
-            cc_addr = decode_header(msg.get('Cc', ''))
+    try:
+        print(f"Searching for new emails from '{FILTER_FROM}'...")
+        run_pipeline(InboxSource(), store)
 
-            # Parse date
-            try:
-                date_parsed = email.utils.parsedate_to_datetime(date_str)
-                date_formatted = date_parsed.strftime('%Y-%m-%d %H:%M:%S')
-                date_file = date_parsed.strftime('%Y%m%d')
-            except:
-                date_formatted = date_str
-                date_file = "unknown"
-
-            body = extract_email_body(msg)
-
-            # Create filename with INBOX prefix
-            safe_subject = sanitize_filename(subject)
-            filename = f"INBOX_{date_file}_{safe_subject}.txt"
-            filepath = os.path.join(OUTPUT_DIR, filename)
-
-            counter = 1
-            while os.path.exists(filepath):
-                filename = f"INBOX_{date_file}_{safe_subject}_{counter}.txt"
-                filepath = os.path.join(OUTPUT_DIR, filename)
-                counter += 1
-
-            # Save email
-            with open(filepath, 'w', encoding='utf-8') as f:
-                f.write(f"=== EMAIL (RECEIVED) ===\n")
-                f.write(f"Date: {date_formatted}\n")
-                f.write(f"From: {from_addr}\n")
-                f.write(f"To: {to_addr}\n")
-                if cc_addr:
-                    f.write(f"Cc: {cc_addr}\n")
-                f.write(f"Subject: {subject}\n")
-                f.write(f"\n--- BODY ---\n\n")
-                f.write(body)
-
-            emails_fetched += 1
-
-        print(f"\n\n=== Summary ===")
-        print(f"Fetched: {emails_fetched} emails")
+        print(f"\n=== Summary ===")
         print(f"Saved to: {OUTPUT_DIR}")
 
-        imap.logout()
-
     except Exception as e:
         print(f"\nError: {e}")
         import traceback
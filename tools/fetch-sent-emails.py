@@ -2,14 +2,21 @@
 """
 Email Fetcher - Retrieve Sent Emails via IMAP
 Fetches emails from Sent folder and saves them as text files
+
+Runs through mail_pipeline.py: fetching, parsing and storing overlap
+(also: python mail_pipeline.py sent).
 """
 
 import imaplib
 import email
 import os
-import re
-from datetime import datetime
-from pathlib import Path
+from itertools import takewhile
+
+from imap_fetch import FILTER_EXTRA, FILTER_FIELDS, HeaderFilter, fetch_headers, fetch_raw
+from imap_pool import ImapPool
+from imap_sync import SyncState, enable_condstore
+from mail_pipeline import Message, Source, run_pipeline
+from mail_store import MailStore
 
 # Configuration
 IMAP_HOST = "mail.zxcs.nl"
@@ -19,15 +26,14 @@ IMAP_PASSWORD = "hLPFy6MdUnfEDbYTwXps"
 OUTPUT_DIR = r"C:\scripts\correspondence\gemeente-meppel"
 FILTER_TO = "meppel.nl"  # Only emails sent TO this domain
 MAX_EMAILS = 100
-
-def sanitize_filename(text):
-    """Convert text to safe filename"""
-    # Remove or replace unsafe characters
-    text = re.sub(r'[<>:"/\\|?*]', '', text)
-    # Replace spaces with underscores
-    text = re.sub(r'\s+', '_', text)
-    # Limit length
-    return text[:100]
+FETCH_CHUNK_SIZE = 50  # Messages per UID FETCH round trip
+SYNC_STATE_FILE = os.path.join(OUTPUT_DIR, "imap_sync_state.json")
+TWO_PHASE = True  # Fetch headers first, download bodies only for messages that pass
+SINCE = None  # Optional date window start, e.g. "2024-01-01"
+MAX_MESSAGE_SIZE = None  # Optional size cap in bytes, e.g. 25 * 1024 * 1024
+SENT_FOLDERS = ["INBOX.Sent", "Sent", "Sent Items", "Verzonden"]  # Tried in this order
+FETCH_CONNECTIONS = 4  # Pipeline: parallel IMAP connections for the bodies
+SHARD_SIZE = 200  # Pipeline: UIDs per download task
 
 def decode_header(header):
     """Decode email header"""
@@ -48,34 +54,151 @@ def decode_header(header):
 
     return ''.join(result)
 
-def extract_email_body(msg):
-    """Extract email body from message"""
-    body = ""
-
-    if msg.is_multipart():
-        for part in msg.walk():
-            content_type = part.get_content_type()
-            content_disposition = str(part.get("Content-Disposition"))
-
-            # Get text/plain or text/html
-            if content_type == "text/plain" and "attachment" not in content_disposition:
-                try:
-                    body = part.get_payload(decode=True).decode('utf-8', errors='replace')
-                    break
-                except:
-                    pass
-            elif content_type == "text/html" and not body and "attachment" not in content_disposition:
-                try:
-                    body = part.get_payload(decode=True).decode('utf-8', errors='replace')
-                except:
-                    pass
-    else:
+def connect():
+    """Open and log in; CONDSTORE enabled so checkpoints can skip unchanged folders"""
+    # Connect to IMAP server
+    print("Connecting to IMAP server...")
+    imap = imaplib.IMAP4_SSL(IMAP_HOST, IMAP_PORT)
+
+    # Login
+    print("Logging in...")
+    imap.login(EMAIL_ADDRESS, IMAP_PASSWORD)
+    enable_condstore(imap)
+    return imap
+
+def select_sent(imap):
+    """Select the first Sent folder that exists; None (and the folder list) when there is none"""
+    for folder in SENT_FOLDERS:
         try:
-            body = msg.get_payload(decode=True).decode('utf-8', errors='replace')
+            status, messages = imap.select(f'"{folder}"', readonly=True)
+            if status == 'OK':
+                print(f"Selected folder: {folder}")
+                return folder
         except:
-            body = str(msg.get_payload())
+            continue
+
+    # List all folders
+    print("Could not find Sent folder. Available folders:")
+    status, folders = imap.list()
+    for folder in folders:
+        print(f"  {folder.decode()}")
+    return None
+
+def find_new(imap, sync_state):
+    """Select the Sent folder; UIDs of matching mail since the last checkpoint. Returns (folder, uids, folder_status)"""
+    selected_folder = select_sent(imap)
+    if not selected_folder:
+        return None, [], None
+
+    # Search only for mail that arrived since the last run
+    print(f"Searching for new emails to '{FILTER_TO}'...")
+    email_ids, folder_status = sync_state.search_new(imap, EMAIL_ADDRESS, selected_folder, f'TO "{FILTER_TO}"')
+
+    last_uid = sync_state.checkpoint(EMAIL_ADDRESS, selected_folder).get('last_uid', 0)
+    print(f"Found {len(email_ids)} new matching emails (after UID {last_uid})")
+
+    # Two-phase: headers + size first, full bodies only for what passes locally
+    if TWO_PHASE and email_ids:
+        header_filter = HeaderFilter(participants=[FILTER_TO], participant_headers=('To',),
+                                     since=SINCE, max_size=MAX_MESSAGE_SIZE)
+        candidates = list(fetch_headers(imap, email_ids, FILTER_FIELDS, extra=FILTER_EXTRA))
+        accepted, rejected = header_filter.split(candidates)
+        email_ids = [message.uid for message in accepted]
+        if rejected:
+            print(f"Filtered out locally: {rejected}")
+    return selected_folder, email_ids, folder_status
+
+def save_text(store, digest, parsed):
+    """Readable text version next to the raw message"""
+    msg = parsed.headers
+
+    # Extract headers
+    subject = decode_header(msg.get('Subject', 'No Subject'))
+    date_str = msg.get('Date', '')
+    to_addr = decode_header(msg.get('To', ''))
+    from_addr = decode_header(msg.get('From', ''))
+    cc_addr = decode_header(msg.get('Cc', ''))
+
+    # Parse date
+    try:
+        date_parsed = email.utils.parsedate_to_datetime(date_str)
+        date_formatted = date_parsed.strftime('%Y-%m-%d %H:%M:%S')
+    except:
+        date_formatted = date_str
+
+    # Extract body
+    body = parsed.body
+
+    lines = [
+        "=== EMAIL ===",
+        f"Date: {date_formatted}",
+        f"From: {from_addr}",
+        f"To: {to_addr}",
+    ]
+    if cc_addr:
+        lines.append(f"Cc: {cc_addr}")
+    lines.append(f"Subject: {subject}")
+    for attachment in parsed.attachments:
+        lines.append(f"Attachment: {attachment['filename']} ({attachment['size']} bytes)")
+    lines.append("\n--- BODY ---\n")
+    store.put_sidecar(digest, '.txt', "\n".join(lines) + "\n" + body)
+
+class SentSource(Source):
+    """
+    The Sent folder as a pipeline source (mail_pipeline.py): one search, then
+    UID shards downloaded over FETCH_CONNECTIONS connections while earlier
+    messages are parsed and stored.
+    """
+
+    name = 'fetch-sent-emails'
+
+    @property
+    def root(self):
+        return OUTPUT_DIR
+
+    def open(self, store):
+        super().open(store)
+        self.sync_state = SyncState(SYNC_STATE_FILE)
+        self.pool = ImapPool(connect, FETCH_CONNECTIONS, EMAIL_ADDRESS)
+        self.workers = {'fetch': FETCH_CONNECTIONS}
+        self.folder = None
+        self.folder_status = None
+        self.planned = []
+        self.stored_uids = set()
+        self.new = 0
+
+    def list(self, search):
+        with self.pool.connection() as imap:
+            self.folder, email_ids, self.folder_status = find_new(imap, self.sync_state)
+        self.planned = email_ids[-MAX_EMAILS:]
+        for start in range(0, len(self.planned), SHARD_SIZE):
+            yield tuple(self.planned[start:start + SHARD_SIZE])
+
+    def fetch(self, uids):
+        with self.pool.connection() as imap:
+            imap.select(f'"{self.folder}"', readonly=True)
+            for uid, raw_email in fetch_raw(imap, uids, FETCH_CHUNK_SIZE):
+                ref = f"imap:{EMAIL_ADDRESS}:{self.folder}:{self.folder_status['uidvalidity']}:{uid}"
+                yield Message(raw_email, key=uid, ref=ref, label=self.folder, account=EMAIL_ADDRESS, folder=self.folder)
+
+    def stored(self, message):
+        self.stored_uids.add(message.key)
+        if message.created:
+            save_text(self.store, message.digest, message.parsed)
+            self.new += 1
+
+    def close(self, complete):
+        self.pool.close()
+        if self.folder_status is None:
+            return
+        # Checkpoint only up to the first UID that did not make it into the store
+        done = list(takewhile(lambda uid: uid in self.stored_uids, self.planned))
+        self.sync_state.commit(EMAIL_ADDRESS, self.folder, self.folder_status, done,
+                               complete=complete and len(done) == len(self.planned))
+        print(f"\nFetched: {self.new} new emails ({len(self.stored_uids) - self.new} already stored)")
 
-    return body
+def pipeline_source():
+    return SentSource()
 
 def main():
     print("=== Email Fetcher ===")
@@ -85,119 +208,16 @@ def main():
     print(f"Output: {OUTPUT_DIR}")
     print()
 
-    # Create output directory
-    Path(OUTPUT_DIR).mkdir(parents=True, exist_ok=True)
+    # Open the mail store in the output directory
+    store = MailStore(OUTPUT_DIR)
 
     try:
-        # Connect to IMAP server
-        print("Connecting to IMAP server...")
-        imap = imaplib.IMAP4_SSL(IMAP_HOST, IMAP_PORT)
-
-        # Login
-        print("Logging in...")
-        imap.login(EMAIL_ADDRESS, IMAP_PASSWORD)
-
-        # Try different Sent folder names
-        sent_folders = ["INBOX.Sent", "Sent", "Sent Items", "Verzonden"]
-        selected_folder = None
-
-        for folder in sent_folders:
-            try:
-                status, messages = imap.select(f'"{folder}"', readonly=True)
-                if status == 'OK':
-                    selected_folder = folder
-                    print(f"Selected folder: {folder}")
-                    break
-            except:
-                continue
-
-        if not selected_folder:
-            # List all folders
-            print("Could not find Sent folder. Available folders:")
-            status, folders = imap.list()
-            for folder in folders:
-                print(f"  {folder.decode()}")
-            return
-
-        # Search for emails
-        print(f"Searching for emails to '{FILTER_TO}'...")
-        status, message_ids = imap.search(None, f'(TO "{FILTER_TO}")')
-
-        if status != 'OK':
-            print("No messages found.")
-            return
-
-        email_ids = message_ids[0].split()
-        total_emails = len(email_ids)
-        print(f"Found {total_emails} matching emails")
-
-        # Fetch emails
-        emails_fetched = 0
-        for i, email_id in enumerate(email_ids[-MAX_EMAILS:], 1):  # Get last MAX_EMAILS
-            print(f"Fetching {i}/{min(total_emails, MAX_EMAILS)}...", end='\r')
-
-            # Fetch email
-            status, msg_data = imap.fetch(email_id, '(RFC822)')
-
-            if status != 'OK':
-                continue
-
-            # Parse email
-            raw_email = msg_data[0][1]
-            msg = email.message_from_bytes(raw_email)
-
-            # Extract headers
-            subject = decode_header(msg.get('Subject', 'No Subject'))
-            date_str = msg.get('Date', '')
-            to_addr = decode_header(msg.get('To', ''))
-            from_addr = decode_header(msg.get('From', ''))
-            cc_addr = decode_header(msg.get('Cc', ''))
-
-            # Parse date
-            try:
-                date_parsed = email.utils.parsedate_to_datetime(date_str)
-                date_formatted = date_parsed.strftime('%Y-%m-%d %H:%M:%S')
-                date_file = date_parsed.strftime('%Y%m%d')
-            except:
-                date_formatted = date_str
-                date_file = "unknown"
-
-            # Extract body
-            body = extract_email_body(msg)
-
-            # Create filename
-            safe_subject = sanitize_filename(subject)
-            filename = f"{date_file}_{safe_subject}.txt"
-            filepath = os.path.join(OUTPUT_DIR, filename)
-
-            # Avoid duplicate filenames
-            counter = 1
-            while os.path.exists(filepath):
-                filename = f"{date_file}_{safe_subject}_{counter}.txt"
-                filepath = os.path.join(OUTPUT_DIR, filename)
-                counter += 1
-
-            # Save email
-            with open(filepath, 'w', encoding='utf-8') as f:
-                f.write(f"=== EMAIL ===\n")
-                f.write(f"Date: {date_formatted}\n")
-                f.write(f"From: {from_addr}\n")
-                f.write(f"To: {to_addr}\n")
-                if cc_addr:
-                    f.write(f"Cc: {cc_addr}\n")
-                f.write(f"Subject: {subject}\n")
-                f.write(f"\n--- BODY ---\n\n")
-                f.write(body)
-
-            emails_fetched += 1
+        # Search, fetch, parse and store overlap (mail_pipeline.py)
+        run_pipeline(SentSource(), store)
 
         print(f"\n\n=== Summary ===")
-        print(f"Fetched: {emails_fetched} emails")
         print(f"Saved to: {OUTPUT_DIR}")
 
-        # Logout
-        imap.logout()
-
     except Exception as e:
         print(f"\nError: {e}")
         import traceback
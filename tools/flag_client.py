@@ -0,0 +1,183 @@
+#!/usr/bin/env python3
+"""
+Flag Client - cached reads of /api/featureflags
+
+Keeps the last flags document on disk together with its ETag /
+Last-Modified and a content hash. Reads within TTL seconds come from the
+snapshot without any request; after that a conditional GET
+(If-None-Match / If-Modified-Since) costs a 304 when nothing changed. The
+hash detects changes for servers without validators.
+
+    client = FlagClient()
+    flags = client.get()                 # snapshot if fresh, else conditional GET
+    flags, changes = client.refresh()    # always ask the server (cheap 304)
+
+Usage:
+    python flag_client.py                    # print flags (from snapshot when fresh)
+    python flag_client.py --refresh          # force a conditional GET
+    python flag_client.py --watch 10         # report only changes, every 10s
+"""
+
+import argparse
+import hashlib
+import json
+import time
+from datetime import datetime
+from pathlib import Path
+
+import requests
+
+from atomic_file import atomic_write
+
+FLAGS_URL = "https://api.brand2boost.com/api/featureflags"
+SNAPSHOT_PATH = Path('C:/scripts/_machine/featureflags-snapshot.json')
+DEFAULT_TTL = 30          # seconden
+REQUEST_TIMEOUT = 15
+WATCH_INTERVAL = 10
+
+
+def content_hash(flags):
+    data = json.dumps(flags, sort_keys=True, separators=(',', ':')).encode('utf-8')
+    return hashlib.sha256(data).hexdigest()
+
+
+def diff(old, new):
+    """{flag: (oud, nieuw)} voor alles wat toegevoegd, gewijzigd of verwijderd is"""
+    old = old or {}
+    return {name: (old.get(name), new.get(name))
+            for name in sorted(set(old) | set(new)) if old.get(name) != new.get(name)}
+
+
+class FlagClient:
+    """Feature flags of one API endpoint with an on-disk snapshot (cache_path=None: memory only)"""
+
+    def __init__(self, url=FLAGS_URL, cache_path=SNAPSHOT_PATH, ttl=DEFAULT_TTL, session=None,
+                 timeout=REQUEST_TIMEOUT):
+        self.url = url
+        self.timeout = timeout
+        self.cache_path = Path(cache_path) if cache_path else None
+        self.ttl = ttl
+        self.session = session or requests.Session()
+        self.snapshot = self._load()
+        self.stats = {'requests': 0, 'not_modified': 0, 'bytes': 0}
+
+    def _load(self):
+        if self.cache_path and self.cache_path.exists():
+            try:
+                snapshot = json.loads(self.cache_path.read_text(encoding='utf-8'))
+                if snapshot.get('url') == self.url:
+                    return snapshot
+            except ValueError:
+                pass
+        return None
+
+    def _save(self):
+        if self.cache_path:
+            atomic_write(self.cache_path, json.dumps(self.snapshot, indent=2).encode('utf-8'))
+
+    @property
+    def flags(self):
+        return self.snapshot['flags'] if self.snapshot else None
+
+    def age(self):
+        """Seconden sinds de server de snapshot voor het laatst bevestigde (None zonder snapshot)"""
+        return time.time() - self.snapshot['checked_at'] if self.snapshot else None
+
+    def get(self, max_age=None):
+        """Flags uit de snapshot als die jonger is dan max_age (default: ttl), anders refresh()"""
+        max_age = self.ttl if max_age is None else max_age
+        age = self.age()
+        if age is not None and age < max_age:
+            return self.flags
+        return self.refresh()[0]
+
+    def refresh(self):
+        """Conditional GET; geeft (flags, changes) met changes als diff() t.o.v. de vorige snapshot"""
+        headers = {}
+        if self.snapshot:
+            if self.snapshot.get('etag'):
+                headers['If-None-Match'] = self.snapshot['etag']
+            if self.snapshot.get('last_modified'):
+                headers['If-Modified-Since'] = self.snapshot['last_modified']
+
+        response = self.session.get(self.url, headers=headers, timeout=self.timeout)
+        self.stats['requests'] += 1
+        self.stats['bytes'] += len(response.content)
+        if response.status_code == 304 and self.snapshot:
+            self.stats['not_modified'] += 1
+            self.snapshot['checked_at'] = time.time()
+            self._save()
+            return self.flags, {}
+        response.raise_for_status()
+
+        flags = response.json()
+        digest = content_hash(flags)
+        previous = self.flags
+        changes = {} if self.snapshot and self.snapshot.get('hash') == digest else diff(previous, flags)
+        self.snapshot = {
+            'url': self.url,
+            'etag': response.headers.get('ETag'),
+            'last_modified': response.headers.get('Last-Modified'),
+            'hash': digest,
+            'checked_at': time.time(),
+            'flags': flags,
+        }
+        self._save()
+        return flags, changes
+
+    def invalidate(self):
+        """Snapshot als verouderd markeren (bijv. na een eigen PUT); validators blijven bruikbaar"""
+        if self.snapshot:
+            self.snapshot['checked_at'] = 0
+            self._save()
+
+    def watch(self, interval=WATCH_INTERVAL, on_change=None):
+        """Refresh elke interval seconden en meld alleen wijzigingen; stopt met Ctrl+C"""
+        on_change = on_change or print_changes
+        try:
+            while True:
+                try:
+                    _, changes = self.refresh()
+                    if changes:
+                        on_change(changes)
+                except requests.RequestException as e:
+                    print(f"⚠ {datetime.now():%H:%M:%S} {e}")
+                time.sleep(interval)
+        except KeyboardInterrupt:
+            pass
+
+
+def print_changes(changes):
+    stamp = datetime.now().strftime('%H:%M:%S')
+    for name, (old, new) in changes.items():
+        print(f"{stamp}  {name}: {old} -> {new}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Cached reads of the feature flag API")
+    parser.add_argument('--url', default=FLAGS_URL)
+    parser.add_argument('--snapshot', default=str(SNAPSHOT_PATH), help="snapshot file ('' = none)")
+    parser.add_argument('--ttl', type=float, default=DEFAULT_TTL)
+    parser.add_argument('--refresh', action='store_true', help="always ask the server (conditional GET)")
+    parser.add_argument('--watch', type=float, nargs='?', const=WATCH_INTERVAL, metavar='SECONDS',
+                        help="keep polling and print only changes")
+    args = parser.parse_args()
+
+    client = FlagClient(args.url, args.snapshot or None, args.ttl)
+    if args.watch:
+        flags = client.get()
+        print(f"👀 {len(flags)} flags, elke {args.watch:g}s controleren (Ctrl+C om te stoppen)")
+        client.watch(args.watch)
+        return
+
+    flags = client.refresh()[0] if args.refresh else client.get()
+    print(json.dumps(flags, indent=2))
+    if client.stats['requests']:
+        status = '304 Not Modified' if client.stats['not_modified'] else f"{client.stats['bytes']} bytes"
+        print(f"\n(server: {status})")
+    else:
+        print(f"\n(snapshot, {client.age():.0f}s oud)")
+
+
+if __name__ == '__main__':
+    main()
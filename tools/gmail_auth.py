@@ -0,0 +1,164 @@
+#!/usr/bin/env python3
+"""
+Gmail Auth - shared OAuth credentials and Gmail API clients
+
+GmailAuth replaces the per-script get_gmail_service() boilerplate:
+
+    auth = GmailAuth(token_path, credentials_path)
+    if auth.authorize():          # token file, refresh or OAuth flow
+        service = auth.service()  # Gmail client of the current thread
+
+- The discovery document is cached on disk (DISCOVERY_CACHE, refreshed after
+  DISCOVERY_MAX_AGE) and parsed once per process; clients are built from the
+  parsed document with build_from_document, so no discovery fetch or JSON
+  parse on startup or per thread.
+- One Credentials object is shared by all threads. A background thread
+  refreshes the token REFRESH_MARGIN before it expires (earlier than
+  google-auth would itself) and writes the token file atomically, so worker
+  threads never hit a refresh in the middle of a download.
+- service() builds one client per thread, each with its own httplib2
+  connection (httplib2.Http is not thread-safe); thread_http() builds just
+  such a connection on the shared credentials for the fetch threads of
+  mail_pipeline.py, without a discovery client.
+"""
+
+import json
+import threading
+import time
+from datetime import datetime, timedelta, timezone
+from pathlib import Path
+
+import google_auth_httplib2
+import httplib2
+from google.auth.transport.requests import Request
+from google.oauth2.credentials import Credentials
+from google_auth_oauthlib.flow import InstalledAppFlow
+from googleapiclient.discovery import build, build_from_document
+
+from atomic_file import atomic_write
+
+SCOPES = ['https://www.googleapis.com/auth/gmail.readonly']
+DISCOVERY_CACHE = Path('C:/scripts/_machine/gmail-discovery-v1.json')
+DISCOVERY_MAX_AGE = 7 * 24 * 3600  # seconden
+
+# Token verversen ruim voor google-auth dat zelf doet (3m45s voor expiry)
+REFRESH_MARGIN = timedelta(minutes=10)
+REFRESH_RETRY = 30  # seconden na een mislukte refresh
+
+_documents = {}
+_documents_lock = threading.Lock()
+
+
+def discovery_document(cache_path=DISCOVERY_CACHE):
+    """Parsed Gmail v1 discovery document: in memory, else disk cache, else build() once"""
+    cache_path = Path(cache_path)
+    with _documents_lock:
+        document = _documents.get(cache_path)
+        if document is not None:
+            return document
+        fresh = cache_path.exists() and time.time() - cache_path.stat().st_mtime < DISCOVERY_MAX_AGE
+        if fresh:
+            try:
+                document = json.loads(cache_path.read_text(encoding='utf-8'))
+            except ValueError:
+                document = None
+        if document is None:
+            # Eénmalig: googleapiclient levert het document (statisch of via HTTP)
+            service = build('gmail', 'v1', http=httplib2.Http(), cache_discovery=False)
+            document = service._rootDesc
+            atomic_write(cache_path, json.dumps(document).encode('utf-8'))
+        _documents[cache_path] = document
+        return document
+
+
+class GmailAuth:
+    """OAuth credentials of one Gmail account, shared across threads"""
+
+    def __init__(self, token_path, credentials_path, scopes=SCOPES, discovery_cache=DISCOVERY_CACHE):
+        self.token_path = Path(token_path)
+        self.credentials_path = Path(credentials_path)
+        self.scopes = scopes
+        self.discovery_cache = discovery_cache
+        self.credentials = None
+        self._lock = threading.Lock()
+        self._local = threading.local()
+        self._stop = threading.Event()
+        self._refresher = None
+
+    def authorize(self):
+        """Token laden, verversen of OAuth flow starten. False als de client secrets ontbreken"""
+        creds = None
+        if self.token_path.exists():
+            creds = Credentials.from_authorized_user_file(str(self.token_path), self.scopes)
+
+        if not creds or not creds.valid:
+            if creds and creds.expired and creds.refresh_token:
+                print("   🔄 Refreshing token...")
+                creds.refresh(Request())
+            else:
+                if not self.credentials_path.exists():
+                    return False
+                flow = InstalledAppFlow.from_client_secrets_file(str(self.credentials_path), self.scopes)
+                creds = flow.run_local_server(port=0)
+            self._save(creds)
+
+        self.credentials = creds
+        self._start_refresher()
+        return True
+
+    def _save(self, creds):
+        atomic_write(self.token_path, creds.to_json().encode('utf-8'))
+
+    def _seconds_until_refresh(self):
+        expiry = self.credentials.expiry
+        if expiry is None:
+            return None  # verloopt niet
+        # google-auth gebruikt naive UTC datetimes
+        now = datetime.now(timezone.utc).replace(tzinfo=None)
+        return (expiry - REFRESH_MARGIN - now).total_seconds()
+
+    def refresh(self, force=False):
+        """Token verversen als het binnen REFRESH_MARGIN verloopt (of altijd met force)"""
+        with self._lock:
+            wait = self._seconds_until_refresh()
+            if not force and (wait is None or wait > 0):
+                return False
+            self.credentials.refresh(Request())
+            self._save(self.credentials)
+            return True
+
+    def _refresh_loop(self):
+        while not self._stop.is_set():
+            wait = self._seconds_until_refresh()
+            if wait is None or not self.credentials.refresh_token:
+                return
+            if self._stop.wait(max(0.0, wait)):
+                return
+            try:
+                self.refresh()
+            except Exception as e:
+                print(f"   ⚠ Token refresh mislukt, opnieuw over {REFRESH_RETRY}s: {e}")
+                self._stop.wait(REFRESH_RETRY)
+
+    def _start_refresher(self):
+        if self._refresher is None or not self._refresher.is_alive():
+            self._stop.clear()
+            self._refresher = threading.Thread(target=self._refresh_loop, name='gmail-token-refresh', daemon=True)
+            self._refresher.start()
+
+    def service(self):
+        """Gmail client of the current thread (built once per thread)"""
+        service = getattr(self._local, 'service', None)
+        if service is None:
+            document = discovery_document(self.discovery_cache)
+            service = build_from_document(document, http=self.thread_http())
+            self._local.service = service
+        return service
+
+    def thread_http(self):
+        """New authorized connection on the shared credentials (one per thread)"""
+        return google_auth_httplib2.AuthorizedHttp(self.credentials, http=httplib2.Http())
+
+    def close(self):
+        """Stop the background refresher"""
+        self._stop.set()
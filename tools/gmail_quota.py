@@ -0,0 +1,261 @@
+#!/usr/bin/env python3
+"""
+Gmail Quota - rate limiting and retries for Gmail API calls
+
+Gmail counts quota units per user: 250 units per second (moving average,
+short bursts allowed), and every method has its own price (messages.get and
+messages.list cost 5, getProfile 1, threads.get 10). GmailThrottle puts
+every call through three layers:
+
+    TokenBucket          - units per second, sized to the per-user quota;
+                           a 429 with Retry-After pauses the whole bucket
+    AdaptiveConcurrency  - calls in flight, AIMD: +1 per window of successes,
+                           halved on throttling (429/403 rate limit, 5xx)
+    retry                - truncated exponential backoff with full jitter,
+                           never shorter than Retry-After
+
+fetch_message() is one download; the fetch threads of mail_pipeline.py call
+it with one httplib2 connection per thread, and the throttle keeps them at
+the highest rate Gmail accepts without 429s.
+
+Works on googleapiclient requests (anything with .execute()) and reads
+HttpError by duck typing (.resp.status, .resp['retry-after'], .content).
+"""
+
+import random
+import threading
+import time
+from email.utils import parsedate_to_datetime
+
+# Per-user quota (units per seconde) en kosten per methode
+QUOTA_PER_SECOND = 250
+QUOTA_UNITS = {
+    'users.getProfile': 1,
+    'history.list': 2,
+    'messages.list': 5,
+    'messages.get': 5,
+    'messages.attachments.get': 5,
+    'threads.list': 10,
+    'threads.get': 10,
+    'messages.batchModify': 50,
+}
+DEFAULT_UNITS = 5
+
+# Retry: 1s, 2s, 4s ... max 64s, met full jitter
+MAX_RETRIES = 6
+BACKOFF_BASE = 1.0
+BACKOFF_MAX = 64.0
+RETRY_STATUSES = {429, 500, 502, 503, 504}
+RATE_LIMIT_REASONS = (b'ratelimitexceeded', b'userratelimitexceeded')
+
+# Gelijktijdige calls (AIMD)
+INITIAL_CONCURRENCY = 4
+MAX_CONCURRENCY = 16
+DECREASE_COOLDOWN = 1.0  # één halvering per golf van 429's, niet één per call
+
+LIST_PAGE_SIZE = 500
+
+
+class TokenBucket:
+    """Thread-safe token bucket; acquire(units) blocks until the units are available"""
+
+    def __init__(self, rate=QUOTA_PER_SECOND, capacity=None):
+        self.rate = rate
+        self.capacity = capacity or rate
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+        self.paused_until = 0.0
+        self.lock = threading.Lock()
+
+    def acquire(self, units=DEFAULT_UNITS):
+        units = min(units, self.capacity)
+        while True:
+            with self.lock:
+                now = time.monotonic()
+                if now < self.paused_until:
+                    delay = self.paused_until - now
+                else:
+                    self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+                    self.updated = now
+                    if self.tokens >= units:
+                        self.tokens -= units
+                        return
+                    delay = (units - self.tokens) / self.rate
+            time.sleep(delay)
+
+    def pause(self, seconds):
+        """Retry-After van de server: niemand doet een call tot die tijd voorbij is"""
+        with self.lock:
+            now = time.monotonic()
+            self.paused_until = max(self.paused_until, now + seconds)
+            self.tokens = 0
+            self.updated = max(self.updated, self.paused_until)
+
+
+class AdaptiveConcurrency:
+    """
+    Limit on calls in flight with additive increase / multiplicative decrease.
+    Use as a context manager around one call.
+    """
+
+    def __init__(self, initial=INITIAL_CONCURRENCY, minimum=1, maximum=MAX_CONCURRENCY):
+        self.minimum = minimum
+        self.maximum = maximum
+        self.limit = float(min(max(initial, minimum), maximum))
+        self.in_flight = 0
+        self.last_decrease = 0.0
+        self.condition = threading.Condition()
+
+    def __enter__(self):
+        with self.condition:
+            while self.in_flight >= int(self.limit):
+                self.condition.wait()
+            self.in_flight += 1
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        with self.condition:
+            self.in_flight -= 1
+            self.condition.notify_all()
+
+    def increase(self):
+        # +1 per volle ronde van `limit` geslaagde calls
+        with self.condition:
+            self.limit = min(self.maximum, self.limit + 1 / self.limit)
+            self.condition.notify_all()
+
+    def decrease(self):
+        with self.condition:
+            now = time.monotonic()
+            if now - self.last_decrease < DECREASE_COOLDOWN:
+                return
+            self.last_decrease = now
+            self.limit = max(self.minimum, self.limit / 2)
+
+
+def error_status(error):
+    """HTTP status of a googleapiclient HttpError (None for other errors)"""
+    resp = getattr(error, 'resp', None)
+    status = getattr(resp, 'status', None)
+    return int(status) if status is not None else None
+
+
+def is_rate_limited(error):
+    status = error_status(error)
+    if status == 429:
+        return True
+    content = (getattr(error, 'content', b'') or b'')
+    if isinstance(content, str):
+        content = content.encode('utf-8', 'replace')
+    return status == 403 and any(reason in content.lower() for reason in RATE_LIMIT_REASONS)
+
+
+def is_retryable(error):
+    if isinstance(error, (OSError, TimeoutError)):
+        return True  # netwerk: verbinding weg, timeout
+    return error_status(error) in RETRY_STATUSES or is_rate_limited(error)
+
+
+def retry_after(error):
+    """Seconds from a Retry-After header (delta-seconds or HTTP-date), or None"""
+    resp = getattr(error, 'resp', None)
+    value = resp.get('retry-after') if hasattr(resp, 'get') else None
+    if not value:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        return max(0.0, parsedate_to_datetime(value).timestamp() - time.time())
+    except (TypeError, ValueError):
+        return None
+
+
+def backoff_delay(attempt, minimum=None):
+    """Full jitter: uniform(0, min(max, base * 2^attempt)), niet korter dan Retry-After"""
+    delay = random.uniform(0, min(BACKOFF_MAX, BACKOFF_BASE * 2 ** attempt))
+    return max(delay, minimum or 0.0)
+
+
+class GmailThrottle:
+    """Shared limiter for one Gmail user; thread-safe"""
+
+    def __init__(self, rate=QUOTA_PER_SECOND, initial_concurrency=INITIAL_CONCURRENCY,
+                 max_concurrency=MAX_CONCURRENCY, max_retries=MAX_RETRIES):
+        self.bucket = TokenBucket(rate)
+        self.concurrency = AdaptiveConcurrency(initial_concurrency, maximum=max_concurrency)
+        self.max_retries = max_retries
+        self.stats = {'calls': 0, 'retries': 0, 'throttled': 0}
+        self.lock = threading.Lock()
+
+    def _count(self, key):
+        with self.lock:
+            self.stats[key] += 1
+
+    def execute(self, request, method='messages.get', http=None):
+        """request.execute() binnen quota, met retries; de laatste fout gaat door naar de caller"""
+        units = QUOTA_UNITS.get(method, DEFAULT_UNITS)
+        attempt = 0
+        while True:
+            with self.concurrency:
+                self.bucket.acquire(units)
+                self._count('calls')
+                try:
+                    result = request.execute(http=http) if http is not None else request.execute()
+                except Exception as e:
+                    if not is_retryable(e) or attempt >= self.max_retries:
+                        raise
+                    error = e
+                else:
+                    self.concurrency.increase()
+                    return result
+
+            # Terugschakelen en wachten buiten het slot, zodat andere calls doorlopen
+            server_delay = retry_after(error)
+            delay = backoff_delay(attempt, server_delay)
+            if is_rate_limited(error) or error_status(error) in RETRY_STATUSES:
+                self.concurrency.decrease()
+            if is_rate_limited(error):
+                self._count('throttled')
+                if server_delay is not None:
+                    self.bucket.pause(server_delay)
+            self._count('retries')
+            attempt += 1
+            time.sleep(delay)
+
+    def summary(self):
+        with self.lock:
+            stats = dict(self.stats)
+        return (f"{stats['calls']} API calls, {stats['retries']} retries "
+                f"({stats['throttled']} rate limited), concurrency {int(self.concurrency.limit)}")
+
+
+def list_message_ids(service, query, throttle, page_size=LIST_PAGE_SIZE, http=None):
+    """Alle message ids voor een query, pagina voor pagina"""
+    ids = []
+    page_token = None
+    while True:
+        request = service.users().messages().list(userId='me', q=query, maxResults=page_size, pageToken=page_token)
+        results = throttle.execute(request, 'messages.list', http=http)
+        ids.extend(m['id'] for m in results.get('messages', []))
+        page_token = results.get('nextPageToken')
+        if not page_token:
+            return ids
+
+
+def thread_http(service):
+    """Own httplib2 connection for a worker thread; httplib2.Http is not thread-safe"""
+    import httplib2
+    shared = service._http
+    if isinstance(shared, httplib2.Http):
+        return httplib2.Http(timeout=shared.timeout)
+    # google_auth_httplib2.AuthorizedHttp (httplib2.Http heeft zelf ook een .credentials, voor basic auth)
+    import google_auth_httplib2
+    return google_auth_httplib2.AuthorizedHttp(shared.credentials, http=httplib2.Http())
+
+
+def fetch_message(service, gmail_id, throttle, http=None, format='raw'):
+    """One messages.get within the quota; http: the calling thread's own connection"""
+    request = service.users().messages().get(userId='me', id=gmail_id, format=format)
+    return throttle.execute(request, 'messages.get', http=http)
@@ -0,0 +1,371 @@
+#!/usr/bin/env python3
+"""
+Async IMAP Engine - asyncio IMAP client with pipelined tagged commands
+
+imaplib blocks one OS thread per connection and waits for every tagged
+completion before the next command goes out. AsyncImap instead runs one
+reader task per connection that demultiplexes responses by tag, so several
+commands can be in flight at once. Untagged FETCH responses are routed to
+the UID FETCH whose UID set they belong to, which makes concurrent UID FETCH
+streams over one connection possible.
+
+Responses are handed out in imaplib's shape ((prefix, literal) tuples plus
+bytes), so imap_fetch.parse_fetch_response, imap_query and
+imap_sync.select_status work unchanged on top of it.
+
+LoopThread runs the event loop in one background thread, so threaded code
+(the mail_pipeline.py stages) can drive every connection from there.
+"""
+
+import asyncio
+import imaplib
+import re
+import ssl
+import threading
+from contextlib import asynccontextmanager
+
+import imap_query
+from imap_fetch import DEFAULT_CHUNK_SIZE, HEADER_CHUNK_SIZE, chunked, header_items, parse_fetch_response, uid_ranges
+
+PIPELINE_DEPTH = 4   # UID FETCH commando's tegelijk onderweg per stream
+CONNECT_TIMEOUT = 30
+
+LITERAL_RE = re.compile(rb'\{(\d+)\}\r?\n?$')
+NUMBERED_RE = re.compile(rb'^(\d+) ([A-Z-]+)(?: (.*))?$', re.S)
+TYPED_RE = re.compile(rb'^([A-Z-]+)(?: (.*))?$', re.S)
+CODE_RE = re.compile(rb'\[([A-Z-]+)(?: ([^\]]*))?\]')
+UID_RE = re.compile(rb'UID (\d+)')
+
+
+def _quote(text):
+    return '"' + text.replace('\\', '\\\\').replace('"', '\\"') + '"'
+
+
+class _Command:
+    def __init__(self, tag, name, uids=None, sink=None):
+        self.tag = tag
+        self.name = name
+        self.uids = uids
+        self.sink = sink
+        self.data = []
+        self.done = asyncio.get_running_loop().create_future()
+
+
+class AsyncImap:
+    """One IMAP connection; use AsyncImap.open() to connect"""
+
+    def __init__(self, reader, writer, name=''):
+        self.reader = reader
+        self.writer = writer
+        self.name = name
+        self.capabilities = ()
+        self.untagged_responses = {}
+        self._pending = {}
+        self._counter = 0
+        self._send_lock = asyncio.Lock()
+        self._reader_task = None
+
+    @classmethod
+    async def open(cls, host, port=993, use_ssl=True, timeout=CONNECT_TIMEOUT):
+        context = ssl.create_default_context() if use_ssl else None
+        reader, writer = await asyncio.wait_for(
+            asyncio.open_connection(host, port, ssl=context), timeout)
+        mail = cls(reader, writer, name=host)
+        greeting = await mail._read_response()
+        head = greeting[0] if isinstance(greeting[0], bytes) else greeting[0][0]
+        if not head.startswith(b'* OK') and not head.startswith(b'* PREAUTH'):
+            writer.close()
+            raise imaplib.IMAP4.error(f"Onverwachte begroeting: {head!r}")
+        mail._reader_task = asyncio.create_task(mail._read_loop())
+        await mail.capability()
+        return mail
+
+    # --- lezen ---
+
+    async def _read_response(self):
+        """One response: a line plus any literals, in imaplib's item format"""
+        items = []
+        line = await self.reader.readline()
+        if not line:
+            raise imaplib.IMAP4.abort("verbinding gesloten door server")
+        while True:
+            literal = LITERAL_RE.search(line)
+            if not literal:
+                items.append(line.rstrip(b'\r\n'))
+                return items
+            data = await self.reader.readexactly(int(literal.group(1)))
+            items.append((line.rstrip(b'\r\n'), data))
+            line = await self.reader.readline()
+            if not line:
+                raise imaplib.IMAP4.abort("verbinding gesloten midden in een response")
+
+    async def _read_loop(self):
+        try:
+            while True:
+                items = await self._read_response()
+                head = items[0] if isinstance(items[0], bytes) else items[0][0]
+                if head.startswith(b'* '):
+                    await self._untagged(items)
+                elif head.startswith(b'+'):
+                    continue
+                else:
+                    self._tagged(head)
+        except Exception as e:
+            error = e if isinstance(e, imaplib.IMAP4.abort) else imaplib.IMAP4.abort(str(e))
+            for command in self._pending.values():
+                if not command.done.done():
+                    command.done.set_exception(error)
+            self._pending.clear()
+
+    def _tagged(self, line):
+        tag, _, rest = line.partition(b' ')
+        command = self._pending.pop(tag.decode(), None)
+        if command is None:
+            return
+        status, _, text = rest.partition(b' ')
+        command.done.set_result((status.decode(), text))
+
+    async def _untagged(self, items):
+        """Route an untagged response: FETCH by UID, SEARCH to the oldest search, rest by type"""
+        first = items[0][0] if isinstance(items[0], tuple) else items[0]
+        body = first[2:]
+        numbered = NUMBERED_RE.match(body)
+        if numbered:
+            number, kind, rest = numbered.groups()
+            dat = number + b' ' + rest if rest else number
+        else:
+            typed = TYPED_RE.match(body)
+            kind, rest = typed.groups() if typed else (b'', body)
+            dat = rest or b''
+        kind = kind.decode()
+        data = [(dat, items[0][1])] + items[1:] if isinstance(items[0], tuple) else [dat] + items[1:]
+
+        if kind == 'FETCH':
+            command = self._fetch_command(data)
+            if command is not None:
+                if command.sink is not None:
+                    for message in parse_fetch_response(data):
+                        await command.sink.put(message)
+                else:
+                    command.data.extend(data)
+                return
+        elif kind == 'SEARCH':
+            command = next((c for c in self._pending.values() if c.name.endswith('SEARCH')), None)
+            if command is not None:
+                command.data.append(dat)
+                return
+        elif kind == 'CAPABILITY':
+            self.capabilities = tuple(dat.decode(errors='replace').upper().split())
+        elif kind == 'BYE':
+            raise imaplib.IMAP4.abort(dat.decode(errors='replace'))
+
+        code = CODE_RE.search(dat) if kind in ('OK', 'NO', 'BAD') else None
+        if code:
+            if code.group(1) == b'CAPABILITY':
+                self.capabilities = tuple((code.group(2) or b'').decode().upper().split())
+            self.untagged_responses.setdefault(code.group(1).decode(), []).append(code.group(2))
+        else:
+            self.untagged_responses.setdefault(kind, []).extend(data)
+
+    def _fetch_command(self, data):
+        meta = b' '.join(item[0] if isinstance(item, tuple) else item for item in data)
+        uid = UID_RE.search(meta)
+        fetches = [c for c in self._pending.values() if c.name.endswith('FETCH')]
+        if uid:
+            for command in fetches:
+                if command.uids is not None and int(uid.group(1)) in command.uids:
+                    return command
+        return fetches[0] if fetches else None
+
+    # --- commando's ---
+
+    async def command(self, name, *args, uids=None, sink=None):
+        """Send one tagged command and wait for its completion: (status, data)"""
+        if self._reader_task is not None and self._reader_task.done():
+            raise imaplib.IMAP4.abort(f"verbinding met {self.name} is gesloten")
+        self._counter += 1
+        tag = f"A{self._counter:04d}"
+        command = _Command(tag, name, uids, sink)
+        self._pending[tag] = command
+        line = ' '.join([tag, name] + [str(a) for a in args if a is not None])
+        async with self._send_lock:
+            self.writer.write(line.encode() + b'\r\n')
+            await self.writer.drain()
+        status, text = await command.done
+        if name.endswith('SEARCH'):
+            return status, [b' '.join(d.strip() for d in command.data if d.strip())]
+        return status, command.data or [text]
+
+    async def capability(self):
+        status, _ = await self.command('CAPABILITY')
+        return status, [' '.join(self.capabilities).encode()]
+
+    async def login(self, user, password):
+        status, data = await self.command('LOGIN', _quote(user), _quote(password))
+        if status != 'OK':
+            raise imaplib.IMAP4.error(data[-1].decode(errors='replace'))
+        # Capabilities kunnen na inloggen uitgebreider zijn
+        await self.capability()
+        return status, data
+
+    async def select(self, mailbox='INBOX', readonly=False):
+        self.untagged_responses = {}
+        status, data = await self.command('EXAMINE' if readonly else 'SELECT', mailbox)
+        return status, data
+
+    async def uid(self, command, *args, sink=None):
+        """UID SEARCH / UID FETCH; FETCH responses go to sink (asyncio.Queue) when given"""
+        command = command.upper()
+        uids = None
+        if command == 'FETCH':
+            uids = {number for part in args[0].split(',') for number in _expand(part)}
+        return await self.command(f'UID {command}', *args, uids=uids, sink=sink)
+
+    def response(self, code):
+        """Pop untagged data for code, like imaplib.IMAP4.response"""
+        return code, self.untagged_responses.pop(code.upper(), [None])
+
+    async def logout(self):
+        try:
+            await asyncio.wait_for(self.command('LOGOUT'), 10)
+        except Exception:
+            pass
+        await self.close()
+
+    async def close(self):
+        if self._reader_task is not None:
+            self._reader_task.cancel()
+        self.writer.close()
+        try:
+            await self.writer.wait_closed()
+        except Exception:
+            pass
+
+
+def _expand(part):
+    if ':' in part:
+        start, end = part.split(':')
+        return range(int(start), int(end) + 1)
+    return [int(part)]
+
+
+async def search(mail, terms):
+    """imap_query.search over an AsyncImap connection (UIDs)"""
+    query = imap_query.compile_gmail_raw(terms) if imap_query.is_gmail(mail) else imap_query.compile_search(terms)
+    status, data = await mail.uid('SEARCH', None, query)
+    if status != 'OK' or not data or not data[0]:
+        return []
+    return data[0].split()
+
+
+async def uid_fetch(mail, uids, items='(RFC822)', chunk_size=DEFAULT_CHUNK_SIZE, pipeline=PIPELINE_DEPTH):
+    """
+    Async generator of FetchedMessage. Up to `pipeline` UID FETCH commands are in
+    flight at once; messages are yielded as they arrive. Several streams may run
+    concurrently on one connection as long as each is consumed by its own task.
+    """
+    stream = asyncio.Queue(maxsize=chunk_size)
+    window = asyncio.Semaphore(pipeline)
+
+    async def fetch_chunk(chunk):
+        async with window:
+            status, data = await mail.uid('FETCH', uid_ranges(chunk), items, sink=stream)
+            if status != 'OK':
+                print(f"  ✗ UID FETCH mislukt voor {len(chunk)} emails: {data}")
+
+    async def run():
+        try:
+            await asyncio.gather(*(fetch_chunk(chunk) for chunk in chunked(uids, chunk_size)))
+        finally:
+            await stream.put(None)
+
+    producer = asyncio.create_task(run())
+    try:
+        while True:
+            message = await stream.get()
+            if message is None:
+                break
+            yield message
+        await producer
+    finally:
+        if not producer.done():
+            producer.cancel()
+
+
+async def fetch_raw(mail, uids, chunk_size=DEFAULT_CHUNK_SIZE, pipeline=PIPELINE_DEPTH):
+    """Async generator of (uid, raw RFC822 bytes), see uid_fetch"""
+    async for message in uid_fetch(mail, uids, '(UID RFC822)', chunk_size, pipeline):
+        raw = message.part('RFC822')
+        if raw is not None:
+            yield message.uid, raw
+
+
+async def fetch_headers(mail, uids, fields, gmail=False, extra=(), chunk_size=HEADER_CHUNK_SIZE):
+    """Header-only fetch (BODY.PEEK), collected in UID order"""
+    messages = [m async for m in uid_fetch(mail, uids, header_items(fields, gmail, extra), chunk_size)]
+    return sorted(messages, key=lambda m: m.uid or 0)
+
+
+class AsyncPool:
+    """Async counterpart of imap_pool.ImapPool: up to `size` connections from `connect()`"""
+
+    def __init__(self, connect, size=4, name=''):
+        self._connect = connect
+        self.size = size
+        self.name = name
+        self._idle = []
+        self._available = asyncio.Semaphore(size)
+
+    @asynccontextmanager
+    async def connection(self):
+        await self._available.acquire()
+        mail = None
+        try:
+            mail = self._idle.pop() if self._idle else await self._connect()
+            if mail is None:
+                raise ConnectionError(f"Kon geen IMAP verbinding maken voor {self.name}")
+            yield mail
+        except BaseException:
+            if mail is not None:
+                await mail.close()
+            raise
+        else:
+            self._idle.append(mail)
+        finally:
+            self._available.release()
+
+    async def close(self):
+        while self._idle:
+            await self._idle.pop().logout()
+
+
+class LoopThread:
+    """An event loop in its own thread; run() and iterate() are called from other threads"""
+
+    def __init__(self, name='imap-async'):
+        self.loop = asyncio.new_event_loop()
+        self.thread = threading.Thread(target=self.loop.run_forever, name=name, daemon=True)
+        self.thread.start()
+
+    def run(self, coroutine):
+        """Run a coroutine on the loop and wait for its result"""
+        return asyncio.run_coroutine_threadsafe(coroutine, self.loop).result()
+
+    def iterate(self, generator):
+        """Items of an async generator, one at a time (the generator only advances when asked)"""
+        async def next_item():
+            return await generator.__anext__()
+
+        try:
+            while True:
+                try:
+                    yield self.run(next_item())
+                except StopAsyncIteration:
+                    return
+        finally:
+            self.run(generator.aclose())
+
+    def close(self):
+        self.loop.call_soon_threadsafe(self.loop.stop)
+        self.thread.join()
+        self.loop.close()
@@ -0,0 +1,274 @@
+#!/usr/bin/env python3
+"""
+IMAP Fetch Engine - batched UID FETCH instead of one FETCH per sequence number
+
+Messages are addressed by UID (stable across sessions, unlike sequence
+numbers) and fetched with one UID FETCH per chunk of UIDs, sent as compact
+ranges ("101:150,153,160:170"). Results are yielded per message as each
+chunk arrives, so callers can parse and write while memory stays bounded by
+the chunk size.
+
+fetch_headers() does the same for a header-only BODY.PEEK fetch (plus
+RFC822.SIZE and FLAGS when asked). That is phase one of a two-phase fetch:
+DuplicateFilter and HeaderFilter decide locally which messages are worth a
+full RFC822 download in phase two.
+"""
+
+import email
+import re
+import threading
+from datetime import date, datetime
+from email import policy
+from email.utils import getaddresses, parsedate_to_datetime
+
+DEFAULT_CHUNK_SIZE = 50
+HEADER_CHUNK_SIZE = 500
+
+# Phase-one items voor HeaderFilter
+FILTER_FIELDS = ('FROM', 'TO', 'CC', 'BCC', 'DATE', 'SUBJECT', 'MESSAGE-ID')
+FILTER_EXTRA = ('RFC822.SIZE', 'FLAGS')
+
+MESSAGE_START_RE = re.compile(rb'^(\d+) \(')
+LITERAL_KEY_RE = re.compile(rb'([A-Z0-9.\-]+(?:\[[^\]]*\])?(?:<\d+>)?) \{\d+\}$')
+UID_RE = re.compile(rb'UID (\d+)')
+SIZE_RE = re.compile(rb'RFC822\.SIZE (\d+)')
+FLAGS_RE = re.compile(rb'FLAGS \(([^)]*)\)')
+GM_MSGID_RE = re.compile(rb'X-GM-MSGID (\d+)')
+
+
+def uid_ranges(uids):
+    """[1, 2, 3, 7, 9, 10] -> '1:3,7,9:10'"""
+    numbers = sorted({int(u) for u in uids})
+    ranges = []
+    start = previous = None
+    for number in numbers:
+        if start is None:
+            start = previous = number
+        elif number == previous + 1:
+            previous = number
+        else:
+            ranges.append(f"{start}:{previous}" if previous != start else str(start))
+            start = previous = number
+    if start is not None:
+        ranges.append(f"{start}:{previous}" if previous != start else str(start))
+    return ','.join(ranges)
+
+
+def chunked(items, size):
+    items = list(items)
+    for start in range(0, len(items), size):
+        yield items[start:start + size]
+
+
+class FetchedMessage:
+    """One message from a FETCH response: literals by item name plus the non-literal items"""
+
+    def __init__(self, seq):
+        self.seq = int(seq)
+        self.uid = None
+        self.parts = {}
+        self.meta = b''
+
+    @property
+    def size(self):
+        found = SIZE_RE.search(self.meta)
+        return int(found.group(1)) if found else None
+
+    @property
+    def flags(self):
+        found = FLAGS_RE.search(self.meta)
+        return found.group(1).decode(errors='replace').split() if found else []
+
+    @property
+    def gm_msgid(self):
+        found = GM_MSGID_RE.search(self.meta)
+        return found.group(1).decode() if found else None
+
+    @property
+    def headers(self):
+        """Parsed header block from a BODY[HEADER...] literal (empty message if absent)"""
+        return email.message_from_bytes(self.part('BODY[HEADER') or b'', policy=policy.default)
+
+    @property
+    def message_id(self):
+        try:
+            value = self.headers.get('Message-ID')
+        except Exception:
+            return None
+        return str(value).strip() if value else None
+
+    def part(self, prefix):
+        """First literal whose item name starts with prefix (e.g. 'RFC822', 'BODY[HEADER')"""
+        for key, value in self.parts.items():
+            if key.startswith(prefix):
+                return value
+        return None
+
+    def _finish(self):
+        found = UID_RE.search(self.meta)
+        if found:
+            self.uid = int(found.group(1))
+        return self
+
+
+def parse_fetch_response(data):
+    """Turn imaplib's FETCH data list into FetchedMessage objects"""
+    current = None
+    for item in data:
+        if isinstance(item, tuple):
+            prefix, literal = item
+            start = MESSAGE_START_RE.match(prefix)
+            if start:
+                if current is not None:
+                    yield current._finish()
+                current = FetchedMessage(start.group(1))
+            if current is None:
+                continue
+            current.meta += prefix + b' '
+            key = LITERAL_KEY_RE.search(prefix)
+            if key:
+                current.parts[key.group(1).decode()] = literal
+        elif isinstance(item, bytes):
+            start = MESSAGE_START_RE.match(item)
+            if start:
+                # Response zonder literals (bv. alleen FLAGS/RFC822.SIZE)
+                if current is not None:
+                    yield current._finish()
+                current = FetchedMessage(start.group(1))
+            if current is not None:
+                current.meta += item + b' '
+    if current is not None:
+        yield current._finish()
+
+
+def uid_fetch(mail, uids, items='(RFC822)', chunk_size=DEFAULT_CHUNK_SIZE):
+    """Yield a FetchedMessage per message, one UID FETCH round trip per chunk"""
+    for chunk in chunked(uids, chunk_size):
+        status, data = mail.uid('FETCH', uid_ranges(chunk), items)
+        if status != 'OK':
+            print(f"  ✗ UID FETCH mislukt voor {len(chunk)} emails: {data}")
+            continue
+        yield from parse_fetch_response(data)
+
+
+def fetch_raw(mail, uids, chunk_size=DEFAULT_CHUNK_SIZE):
+    """Yield (uid, raw RFC822 bytes) for the given UIDs in the selected folder"""
+    for message in uid_fetch(mail, uids, '(UID RFC822)', chunk_size):
+        raw = message.part('RFC822')
+        if raw is not None:
+            yield message.uid, raw
+
+
+def header_items(fields, gmail=False, extra=()):
+    """FETCH items for a header-only fetch; never sets \\Seen (BODY.PEEK)"""
+    items = ['UID'] + list(extra)
+    if gmail:
+        items.append('X-GM-MSGID')
+    items.append(f"BODY.PEEK[HEADER.FIELDS ({' '.join(fields)})]")
+    return f"({' '.join(items)})"
+
+
+def fetch_headers(mail, uids, fields, gmail=False, extra=(), chunk_size=HEADER_CHUNK_SIZE):
+    """Cheap header-only UID FETCH; yields FetchedMessage with .headers/.message_id"""
+    yield from uid_fetch(mail, uids, header_items(fields, gmail, extra), chunk_size)
+
+
+class DuplicateFilter:
+    """
+    Thread-safe first-come claim on messages across folders of one or more accounts.
+
+    A message is a duplicate when its (account, folder, UID), its Gmail X-GM-MSGID
+    or its Message-ID (per account) was claimed before. Seed it with what is
+    already in the mail store to skip those bodies on re-imports as well.
+    """
+
+    def __init__(self):
+        self._seen = set()
+        self._lock = threading.Lock()
+
+    def seed(self, account, message_id=None, gm_msgid=None):
+        with self._lock:
+            self._seen.update(self._keys(account, None, None, message_id, gm_msgid))
+
+    @staticmethod
+    def _keys(account, folder, uid, message_id, gm_msgid):
+        keys = []
+        if uid is not None:
+            keys.append(('uid', account, folder, int(uid)))
+        if gm_msgid:
+            keys.append(('gm', account, gm_msgid))
+        if message_id:
+            keys.append(('mid', account, message_id))
+        return keys
+
+    def claim(self, account, folder, message):
+        """True if this FetchedMessage is new; registers all of its identities"""
+        keys = self._keys(account, folder, message.uid, message.message_id, message.gm_msgid)
+        with self._lock:
+            if any(key in self._seen for key in keys):
+                self._seen.update(keys)
+                return False
+            self._seen.update(keys)
+            return True
+
+
+def _as_date(value):
+    if value is None or isinstance(value, date):
+        return value
+    return datetime.strptime(value, '%Y-%m-%d').date()
+
+
+class HeaderFilter:
+    """
+    Local phase-one filter over header-only FETCH results.
+
+    participants - address/domain fragments; at least one must occur in participant_headers
+    since/until  - date window ('YYYY-MM-DD' or date), inclusive; undated mail passes
+    max_size     - RFC822.SIZE cap in bytes
+    """
+
+    def __init__(self, participants=(), participant_headers=('From', 'To', 'Cc', 'Bcc'),
+                 since=None, until=None, max_size=None):
+        self.participants = [p.lower() for p in participants]
+        self.participant_headers = participant_headers
+        self.since = _as_date(since)
+        self.until = _as_date(until)
+        self.max_size = max_size
+
+    def reject_reason(self, message):
+        """None when the message passes, otherwise 'size', 'date' or 'participant'"""
+        if self.max_size and message.size and message.size > self.max_size:
+            return 'size'
+
+        headers = message.headers
+        if self.since or self.until:
+            try:
+                sent = parsedate_to_datetime(str(headers.get('Date', ''))).date()
+            except (TypeError, ValueError):
+                sent = None
+            if sent and ((self.since and sent < self.since) or (self.until and sent > self.until)):
+                return 'date'
+
+        if self.participants:
+            values = []
+            for name in self.participant_headers:
+                try:
+                    values.extend(str(v) for v in headers.get_all(name, []))
+                except Exception:
+                    continue
+            addresses = [address.lower() for _, address in getaddresses(values)]
+            if not any(p in address for p in self.participants for address in addresses):
+                return 'participant'
+        return None
+
+    def split(self, messages):
+        """(accepted messages, {reason: count}) for a list of FetchedMessage"""
+        accepted = []
+        rejected = {}
+        for message in messages:
+            reason = self.reject_reason(message)
+            if reason:
+                rejected[reason] = rejected.get(reason, 0) + 1
+            else:
+                accepted.append(message)
+        return accepted, rejected
@@ -0,0 +1,79 @@
+#!/usr/bin/env python3
+"""
+IMAP Connection Pool - authenticated connections shared by worker threads
+
+imaplib connections are not thread-safe, so every worker borrows its own
+connection for the duration of a task (select folder, search, fetch) and
+returns it afterwards. Connections are opened lazily up to the pool size and
+reused across tasks; a connection that raised is dropped instead of returned.
+"""
+
+import queue
+import threading
+from contextlib import contextmanager
+
+
+class ImapPool:
+    """Up to `size` logged-in connections created by `connect()`"""
+
+    def __init__(self, connect, size=4, name=''):
+        self._connect = connect
+        self.size = size
+        self.name = name
+        self._idle = queue.LifoQueue()
+        self._lock = threading.Lock()
+        self._created = 0
+        self._available = threading.Semaphore(size)
+
+    def _acquire(self):
+        self._available.acquire()
+        try:
+            return self._idle.get_nowait()
+        except queue.Empty:
+            pass
+        try:
+            mail = self._connect()
+        except BaseException:
+            self._available.release()
+            raise
+        if mail is None:
+            self._available.release()
+            raise ConnectionError(f"Kon geen IMAP verbinding maken voor {self.name}")
+        with self._lock:
+            self._created += 1
+        return mail
+
+    def _release(self, mail, broken=False):
+        if broken:
+            with self._lock:
+                self._created -= 1
+            try:
+                mail.shutdown()
+            except Exception:
+                pass
+        else:
+            self._idle.put(mail)
+        self._available.release()
+
+    @contextmanager
+    def connection(self):
+        """Borrow a connection: `with pool.connection() as mail: ...`"""
+        mail = self._acquire()
+        try:
+            yield mail
+        except BaseException:
+            self._release(mail, broken=True)
+            raise
+        else:
+            self._release(mail)
+
+    def close(self):
+        while True:
+            try:
+                mail = self._idle.get_nowait()
+            except queue.Empty:
+                break
+            try:
+                mail.logout()
+            except Exception:
+                pass
@@ -0,0 +1,104 @@
+#!/usr/bin/env python3
+"""
+IMAP Query Compiler - one server-side search per folder instead of per-term loops
+
+Turns a list of search terms into a single IMAP SEARCH: a balanced tree of
+nested OR criteria over FROM/TO/CC/BCC/SUBJECT/BODY, or one X-GM-RAW query
+on Gmail. Which term matched which message is worked out afterwards from the
+MATCH_FIELDS of a header-only FETCH, so the server scans each mailbox only once.
+"""
+
+import email
+from email import policy
+
+DEFAULT_FIELDS = ('FROM', 'TO', 'CC', 'BCC', 'SUBJECT', 'BODY')
+MATCH_HEADERS = ('From', 'To', 'Cc', 'Bcc', 'Subject')
+MATCH_FIELDS = ('FROM', 'TO', 'CC', 'BCC', 'SUBJECT')
+
+BODY_ONLY = '(body)'
+
+
+def quote(text):
+    """IMAP quoted string"""
+    if not text.isascii():
+        raise ValueError(f"Zoekterm moet ASCII zijn voor IMAP SEARCH: {text!r}")
+    return '"' + text.replace('\\', '\\\\').replace('"', '\\"') + '"'
+
+
+def quote_folder(folder):
+    """Mailbox name quoted when it contains spaces or specials (e.g. 'All Mail')"""
+    if folder.startswith('"'):
+        return folder
+    if any(c in folder for c in ' ()[]{}%*"\\'):
+        return quote(folder)
+    return folder
+
+
+def _balanced_or(criteria):
+    if len(criteria) == 1:
+        return criteria[0]
+    middle = len(criteria) // 2
+    return f"(OR {_balanced_or(criteria[:middle])} {_balanced_or(criteria[middle:])})"
+
+
+def compile_search(terms, fields=DEFAULT_FIELDS):
+    """One SEARCH criterion matching any term in any field (balanced nested OR)"""
+    criteria = [f"{field} {quote(term)}" for term in terms for field in fields]
+    if not criteria:
+        raise ValueError("Geen zoektermen opgegeven")
+    query = _balanced_or(criteria)
+    return query if query.startswith('(') else f"({query})"
+
+
+def compile_gmail_raw(terms):
+    """Gmail search syntax: plain words match headers and body, OR'ed together"""
+    parts = [f'"{term}"' if ' ' in term else term for term in terms]
+    return f"X-GM-RAW {quote(' OR '.join(parts))}"
+
+
+def is_gmail(mail):
+    """Gmail advertises X-GM-EXT-1 in its capabilities"""
+    return 'X-GM-EXT-1' in mail.capabilities
+
+
+def search(mail, terms, uid=False):
+    """Run a single search for all terms on the selected folder. Returns a list of ids"""
+    query = compile_gmail_raw(terms) if is_gmail(mail) else compile_search(terms)
+    if uid:
+        status, data = mail.uid('SEARCH', None, query)
+    else:
+        status, data = mail.search(None, query)
+    if status != 'OK' or not data or not data[0]:
+        return []
+    return data[0].split()
+
+
+def match_terms(headers, terms):
+    """Terms (case-insensitive) that occur in From/To/Cc/Bcc/Subject of a header block"""
+    msg = email.message_from_bytes(headers, policy=policy.default)
+    values = []
+    for name in MATCH_HEADERS:
+        try:
+            values.extend(str(v) for v in msg.get_all(name, []))
+        except Exception:
+            continue
+    haystack = ' '.join(values).lower()
+    return [term for term in terms if term.lower() in haystack]
+
+
+def attribute_matches(headers_by_id, terms):
+    """
+    {id: header bytes} from a header-only FETCH -> {id: [matched terms]}.
+    Messages without a header match got in via BODY and are tagged BODY_ONLY.
+    """
+    return {msg_id: match_terms(headers, terms) or [BODY_ONLY]
+            for msg_id, headers in headers_by_id.items()}
+
+
+def term_counts(matches):
+    """{term: count} over the output of attribute_matches"""
+    counts = {}
+    for terms in matches.values():
+        for term in terms:
+            counts[term] = counts.get(term, 0) + 1
+    return counts
@@ -0,0 +1,114 @@
+#!/usr/bin/env python3
+"""
+IMAP Sync State - incremental sync with UIDVALIDITY/UIDNEXT checkpoints
+
+Per account+folder we persist UIDVALIDITY, the highest UID already stored and
+(where the server supports CONDSTORE) HIGHESTMODSEQ. A later run only searches
+"UID <last+1>:*"; when UIDNEXT and HIGHESTMODSEQ are unchanged the search is
+skipped altogether. A changed UIDVALIDITY invalidates the checkpoint and
+triggers a full resync (the mail store keeps that a no-op for known mail).
+"""
+
+import json
+import re
+from pathlib import Path
+
+from atomic_file import atomic_write
+
+STATUS_RE = re.compile(rb'(\d+)')
+
+
+def enable_condstore(mail):
+    """Enable CONDSTORE before SELECT so the server reports HIGHESTMODSEQ"""
+    if 'CONDSTORE' not in mail.capabilities:
+        return False
+    try:
+        status, _ = mail.enable('CONDSTORE')
+        return status == 'OK'
+    except Exception:
+        return False
+
+
+def _response_number(mail, code):
+    _, data = mail.response(code)
+    for item in data or []:
+        if item is None:
+            continue
+        found = STATUS_RE.search(item if isinstance(item, bytes) else str(item).encode())
+        if found:
+            return int(found.group(1))
+    return None
+
+
+def select_status(mail):
+    """UIDVALIDITY, UIDNEXT and HIGHESTMODSEQ from the last SELECT/EXAMINE"""
+    return {
+        'uidvalidity': _response_number(mail, 'UIDVALIDITY'),
+        'uidnext': _response_number(mail, 'UIDNEXT'),
+        'highestmodseq': _response_number(mail, 'HIGHESTMODSEQ'),
+    }
+
+
+class SyncState:
+    """JSON file with one checkpoint per '<account>|<folder>'"""
+
+    def __init__(self, path):
+        self.path = Path(path)
+        self.folders = {}
+        if self.path.exists():
+            self.folders = json.loads(self.path.read_text(encoding='utf-8'))
+
+    @staticmethod
+    def _key(account, folder):
+        return f"{account}|{folder}"
+
+    def checkpoint(self, account, folder):
+        return self.folders.get(self._key(account, folder), {})
+
+    def commit(self, account, folder, status, stored_uids, complete=True):
+        """
+        Persist a checkpoint after stored_uids are safely stored. With complete=True
+        every match below UIDNEXT was handled, so the checkpoint moves up to UIDNEXT-1.
+        """
+        key = self._key(account, folder)
+        last_uid = max((int(uid) for uid in stored_uids), default=0)
+        if complete and status['uidnext']:
+            last_uid = max(last_uid, status['uidnext'] - 1)
+
+        previous = self.folders.get(key, {})
+        if previous.get('uidvalidity') == status['uidvalidity']:
+            last_uid = max(last_uid, previous.get('last_uid', 0))
+
+        self.folders[key] = {
+            'uidvalidity': status['uidvalidity'],
+            'last_uid': last_uid,
+            'uidnext': status['uidnext'],
+            'highestmodseq': status['highestmodseq'],
+        }
+        atomic_write(self.path, json.dumps(self.folders, indent=2).encode('utf-8'))
+
+    def search_new(self, mail, account, folder, criteria):
+        """
+        UIDs (ints) matching criteria that arrived since the last checkpoint.
+        Call right after selecting the folder. Returns (uids, status).
+        """
+        status = select_status(mail)
+        checkpoint = self.checkpoint(account, folder)
+        last_uid = 0
+
+        if checkpoint and checkpoint.get('uidvalidity') == status['uidvalidity']:
+            last_uid = checkpoint.get('last_uid', 0)
+            unchanged_next = status['uidnext'] is not None and status['uidnext'] == checkpoint.get('uidnext')
+            unchanged_modseq = (status['highestmodseq'] is None
+                                or status['highestmodseq'] == checkpoint.get('highestmodseq'))
+            if unchanged_next and unchanged_modseq:
+                return [], status
+        elif checkpoint:
+            print(f"  UIDVALIDITY van {folder} gewijzigd, volledige resync")
+
+        result, data = mail.uid('SEARCH', None, f'UID {last_uid + 1}:* {criteria}')
+        if result != 'OK' or not data or not data[0]:
+            return [], status
+        # "n:*" levert altijd de hoogste UID op, ook als die <= last_uid is
+        uids = [int(uid) for uid in data[0].split()]
+        return [uid for uid in uids if uid > last_uid], status
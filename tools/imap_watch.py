@@ -0,0 +1,149 @@
+#!/usr/bin/env python3
+"""
+IMAP Watcher - keep one authenticated connection open and react to new mail
+
+imaplib (before Python 3.14) has no IDLE support, so idle() speaks RFC 2177
+directly on the connection: send IDLE, wait for an untagged EXISTS/RECENT (or
+the timeout, well before the server's 30 minute cutoff), then DONE. Servers
+without IDLE are polled with NOOP instead. watch() runs a sync callback once
+and again after every change, and reconnects with backoff when the
+connection drops.
+"""
+
+import imaplib
+import re
+import select
+import ssl
+import time
+from datetime import datetime
+
+IDLE_TIMEOUT = 25 * 60  # RFC 2177: opnieuw IDLE voor de server na 30 min afbreekt
+POLL_INTERVAL = 60      # NOOP interval zonder IDLE
+RECONNECT_DELAY = 5     # eerste wachttijd na verbroken verbinding, verdubbelt tot MAX
+MAX_RECONNECT_DELAY = 300
+
+CHANGE_RE = re.compile(rb'^\* \d+ (EXISTS|RECENT)')
+
+
+def supports_idle(mail):
+    return 'IDLE' in mail.capabilities
+
+
+def _wait_readable(mail, timeout):
+    """
+    True when a response line is waiting. Checks imaplib's read buffer and the
+    TLS buffer (non-blocking peek) before falling back to select() on the socket.
+    """
+    sock = mail.sock
+    previous = sock.gettimeout()
+    sock.setblocking(False)
+    try:
+        if mail.file.peek(1):
+            return True
+    except (BlockingIOError, ssl.SSLWantReadError):
+        pass
+    finally:
+        sock.settimeout(previous)
+    readable, _, _ = select.select([sock], [], [], max(timeout, 0))
+    return bool(readable)
+
+
+def _readline(mail):
+    line = mail.readline()
+    if not line:
+        raise imaplib.IMAP4.abort("verbinding gesloten tijdens IDLE")
+    if line.startswith(b'* BYE'):
+        raise imaplib.IMAP4.abort(line.decode(errors='replace').strip())
+    return line
+
+
+def idle(mail, timeout=IDLE_TIMEOUT):
+    """
+    IDLE on the selected folder until new mail is announced or timeout passes.
+    Returns True when the server reported EXISTS/RECENT.
+    """
+    tag = mail._new_tag()
+    mail.send(tag + b' IDLE\r\n')
+    line = _readline(mail)
+    if not line.startswith(b'+'):
+        raise imaplib.IMAP4.error(f"IDLE geweigerd: {line.decode(errors='replace').strip()}")
+
+    changed = False
+    deadline = time.monotonic() + timeout
+    while not changed:
+        remaining = deadline - time.monotonic()
+        if remaining <= 0 or not _wait_readable(mail, remaining):
+            break
+        changed = bool(CHANGE_RE.match(_readline(mail)))
+
+    mail.send(b'DONE\r\n')
+    while True:
+        line = _readline(mail)
+        if line.startswith(tag):
+            if not line[len(tag):].lstrip().startswith(b'OK'):
+                raise imaplib.IMAP4.error(f"IDLE mislukt: {line.decode(errors='replace').strip()}")
+            return changed
+        changed = changed or bool(CHANGE_RE.match(line))
+
+
+def poll(mail, interval=POLL_INTERVAL):
+    """NOOP fallback: wait interval seconds, True when the server reported new mail"""
+    time.sleep(interval)
+    mail.noop()
+    _, exists = mail.response('EXISTS')
+    _, recent = mail.response('RECENT')
+    return any(exists) or any(recent)
+
+
+def wait_for_changes(mail, idle_timeout=IDLE_TIMEOUT, poll_interval=POLL_INTERVAL):
+    """
+    One wait cycle: IDLE when the server supports it, NOOP polling otherwise.
+    Returns True when a resync is due (new mail, or an IDLE timeout as safety net).
+    """
+    if supports_idle(mail):
+        idle(mail, idle_timeout)
+        return True
+    return poll(mail, poll_interval)
+
+
+def _now():
+    return datetime.now().strftime('%H:%M:%S')
+
+
+def watch(connect, sync, idle_timeout=IDLE_TIMEOUT, poll_interval=POLL_INTERVAL):
+    """
+    Run sync(mail) on a fresh connection, then again after every change.
+    connect() returns a logged-in connection; sync(mail) selects the folder
+    itself and leaves it selected. Stops on Ctrl+C.
+    """
+    delay = RECONNECT_DELAY
+    mail = None
+    try:
+        while True:
+            try:
+                if mail is None:
+                    mail = connect()
+                    mode = 'IDLE' if supports_idle(mail) else f'NOOP elke {poll_interval}s'
+                    print(f"[{_now()}] 👀 Verbonden, wacht op nieuwe mail ({mode})")
+                    sync(mail)
+                    delay = RECONNECT_DELAY
+                if wait_for_changes(mail, idle_timeout, poll_interval):
+                    sync(mail)
+            except (imaplib.IMAP4.abort, OSError) as e:
+                print(f"[{_now()}] ⚠️  Verbinding verbroken ({e}), opnieuw over {delay}s")
+                if mail is not None:
+                    try:
+                        mail.shutdown()
+                    except Exception:
+                        pass
+                mail = None
+                time.sleep(delay)
+                delay = min(delay * 2, MAX_RECONNECT_DELAY)
+    except KeyboardInterrupt:
+        print(f"\n[{_now()}] Watcher gestopt")
+    finally:
+        if mail is not None:
+            try:
+                mail.logout()
+            except Exception:
+                pass
@@ -2,24 +2,29 @@
 """
 Arjan Emails Import Tool - Versie 2
 Importeert emails van specifieke contacten uit beide mailboxen
-Output format: identiek aan gemeente_emails (EML + JSON)
+Output: gedeelde mail store (zie mail_store.py)
+
+Een afgebroken run (quota, netwerk, Ctrl+C) wordt bij de volgende start
+hervat via het journal in <store>/.journal (zie import_journal.py).
+
+Zoeken, downloaden, parsen en opslaan lopen tegelijk via mail_pipeline.py
+(ook: python mail_pipeline.py arjan-v2).
 """
 
-import os
-import sys
 import base64
-import json
+import threading
 from pathlib import Path
-from datetime import datetime
-from email.utils import parsedate_to_datetime
-from google.auth.transport.requests import Request
-from google.oauth2.credentials import Credentials
-from google_auth_oauthlib.flow import InstalledAppFlow
-from googleapiclient.discovery import build
-from googleapiclient.errors import HttpError
 
-# Gmail API scopes
-SCOPES = ['https://www.googleapis.com/auth/gmail.readonly']
+from gmail_auth import GmailAuth
+from gmail_quota import GmailThrottle, fetch_message, is_retryable, list_message_ids, thread_http
+from import_journal import ImportJournal
+from mail_pipeline import Message, Source, run_pipeline
+from mail_store import MailStore
+
+OUTPUT_DIR = Path('C:/arjan_emails')
+
+# Accounts om te importeren (kan later uitgebreid worden met info@martiendejong.nl)
+ACCOUNTS_TO_IMPORT = ['gmail']  # Later: 'martiendejong'
 
 # Email accounts configuratie
 EMAIL_ACCOUNTS = {
@@ -78,43 +83,22 @@ CONTACTS = {
     }
 }
 
-def get_gmail_service(account_key):
-    """Authenticeert en maakt Gmail service aan voor specifiek account"""
+def get_gmail_auth(account_key):
+    """Authenticeert voor specifiek account; de GmailAuth levert per thread een Gmail client"""
     config = EMAIL_ACCOUNTS[account_key]
-    creds = None
-    token_path = Path(config['token_path'])
     credentials_path = Path(config['credentials_path'])
 
     print(f"\n🔐 Authenticeren voor: {config['account']}")
 
-    # Token bestand bevat access en refresh tokens
-    if token_path.exists():
-        creds = Credentials.from_authorized_user_file(str(token_path), SCOPES)
-
-    # Als geen geldige credentials, login flow
-    if not creds or not creds.valid:
-        if creds and creds.expired and creds.refresh_token:
-            print("   🔄 Refreshing token...")
-            creds.refresh(Request())
-        else:
-            if not credentials_path.exists():
-                print(f"\n❌ Credentials niet gevonden: {credentials_path}")
-                print("\n📋 Setup vereist:")
-                print("1. https://console.cloud.google.com/")
-                print("2. Maak OAuth 2.0 credentials (Desktop app)")
-                print("3. Download JSON → sla op als:", credentials_path)
-                return None
-
-            print(f"   🌐 OAuth flow starten voor {config['account']}...")
-            flow = InstalledAppFlow.from_client_secrets_file(
-                str(credentials_path), SCOPES)
-            creds = flow.run_local_server(port=0)
-
-        # Sla token op
-        token_path.write_text(creds.to_json())
-        print("   ✅ Token opgeslagen")
-
-    return build('gmail', 'v1', credentials=creds)
+    auth = GmailAuth(config['token_path'], credentials_path)
+    if not auth.authorize():
+        print(f"\n❌ Credentials niet gevonden: {credentials_path}")
+        print("\n📋 Setup vereist:")
+        print("1. https://console.cloud.google.com/")
+        print("2. Maak OAuth 2.0 credentials (Desktop app)")
+        print("3. Download JSON → sla op als:", credentials_path)
+        return None
+    return auth
 
 def build_query(contact_group):
     """Bouwt Gmail search query voor contactgroep"""
@@ -128,164 +112,166 @@ def build_query(contact_group):
 
     return ' OR '.join(all_queries)
 
-def sanitize_filename_part(text, max_len=80):
-    """Maakt text veilig voor gebruik in filename"""
-    # Verwijder/vervang onveilige karakters
-    safe = text.replace('<', '_').replace('>', '_').replace('"', '')
-    safe = safe.replace('/', '_').replace('\\', '_').replace(':', '_')
-    safe = safe.replace('|', '_').replace('*', '_').replace('?', '_')
-    safe = "".join(c for c in safe if c.isalnum() or c in (' ', '-', '_', '@', '.'))
-    safe = safe.strip()[:max_len]
-    return safe
-
-def download_emails(service, account_name, contact_group, output_dir):
-    """Download emails voor een contactgroep"""
-    contact_info = CONTACTS[contact_group]
-    query = build_query(contact_group)
-
-    print(f"\n{'='*70}")
-    print(f"📂 Contact groep: {contact_info['name']}")
-    print(f"🔍 Query: {query[:100]}...")
-    print(f"{'='*70}")
+class ArjanV2Source(Source):
+    """
+    Every account and contact group as a pipeline source (mail_pipeline.py),
+    resumable through the journal. services maps an account name to its Gmail
+    service; without it open() authenticates.
+    """
+
+    name = 'import-arjan-emails-v2'
+    root = OUTPUT_DIR
+
+    def __init__(self, account_keys=ACCOUNTS_TO_IMPORT, services=None, new_http=thread_http):
+        self.accounts = [EMAIL_ACCOUNTS[key]['account'] for key in account_keys]
+        self.account_keys = account_keys
+        self.services = dict(services or {})
+        self.new_http = {account: new_http for account in self.services}
+        self.auths = []
+        self.local = threading.local()
+        self.lock = threading.Lock()
+        self.claimed = set()
+        self.extra_labels = []  # (ref, contactgroep, journal key) van emails die al onderweg waren
+        self.counts = {}
+        self.authenticated = True
+
+    def open(self, store):
+        super().open(store)
+        for account_key, account_name in zip(self.account_keys, self.accounts):
+            if account_name in self.services:
+                continue
+            auth = get_gmail_auth(account_key)
+            if not auth:
+                print(f"❌ Authenticatie mislukt voor {account_name}")
+                self.authenticated = False
+                continue
+            print(f"✅ Authenticatie succesvol voor {account_name}")
+            self.auths.append(auth)
+            self.services[account_name] = auth.service()
+            self.new_http[account_name] = lambda service, auth=auth: auth.thread_http()
+        # Eén gedeelde quota per account
+        self.throttles = {account_name: GmailThrottle() for account_name in self.services}
+        self.workers = {'fetch': sum(t.concurrency.maximum for t in self.throttles.values()) or 1}
+
+        # Zelfde accounts en contacten als een afgebroken run -> die hervatten
+        self.journal = ImportJournal(store.root, 'import-arjan-emails-v2', {
+            'accounts': self.accounts,
+            'contacts': CONTACTS,
+        })
+        if self.journal.resumed:
+            print(f"\n↻ Onderbroken run van {self.journal.started} wordt hervat ({len(self.journal.done)} emails klaar)")
+
+    def http(self, account_name):
+        connections = getattr(self.local, 'http', None)
+        if connections is None:
+            connections = self.local.http = {}
+        if account_name not in connections:
+            connections[account_name] = self.new_http[account_name](self.services[account_name])
+        return connections[account_name]
+
+    def searches(self):
+        return [(account_name, contact_group) for account_name in self.services for contact_group in CONTACTS]
+
+    def list(self, search):
+        account_name, contact_group = search
+        task = f"{account_name}|{contact_group}"
+        # In een hervatte run ligt de lijst al in het journal
+        plan = self.journal.planned(task)
+        if plan is not None:
+            message_ids = plan['ids']
+            print(f"📧 {contact_group}: hervat, {len(message_ids)} emails uit de onderbroken run")
+        else:
+            message_ids = list_message_ids(self.services[account_name], build_query(contact_group),
+                                           self.throttles[account_name], http=self.http(account_name))
+            self.journal.plan(task, message_ids)
+            print(f"📧 {contact_group}: {len(message_ids)} emails gevonden")
+
+        for gmail_id in message_ids:
+            ref = f"gmail:{account_name}:{gmail_id}"
+            done_key = f"{task}|{gmail_id}"
+            if self.journal.is_done(done_key):
+                continue
+            if self.store.has_ref(ref):
+                # Al eerder geïmporteerd (eventueel via andere contactgroep): alleen label bijwerken
+                self.store.tag(self.store.digest_for_ref(ref), label=contact_group)
+                self.journal.mark_done(done_key)
+                continue
+            with self.lock:
+                first = ref not in self.claimed
+                self.claimed.add(ref)
+            if first:
+                yield account_name, contact_group, gmail_id
+            else:
+                self.extra_labels.append((ref, contact_group, done_key))
+
+    def fetch(self, task):
+        account_name, contact_group, gmail_id = task
+        raw_msg = fetch_message(self.services[account_name], gmail_id, self.throttles[account_name],
+                                self.http(account_name))
+        yield Message(raw_msg['raw'], key=f"{account_name}|{contact_group}|{gmail_id}",
+                      ref=f"gmail:{account_name}:{gmail_id}", label=contact_group,
+                      account=account_name, gmail_id=gmail_id, thread_id=raw_msg.get('threadId'))
+
+    def decode(self, message):
+        return base64.urlsafe_b64decode(message.raw)
+
+    def stored(self, message):
+        # Pas als klaar markeren nu de email veilig in de store staat
+        self.journal.mark_done(message.key)
+        if message.created:
+            account_name = message.meta['account']
+            with self.lock:
+                self.counts[account_name] = self.counts.get(account_name, 0) + 1
+
+    def fatal(self, error):
+        # Quota op na alle retries: de rest gaat ook mis, de volgende run hervat hier
+        return is_retryable(error)
+
+    def close(self, complete):
+        for ref, contact_group, done_key in self.extra_labels:
+            if self.store.has_ref(ref):
+                self.store.tag(self.store.digest_for_ref(ref), label=contact_group)
+                self.journal.mark_done(done_key)
+        for account_name, throttle in self.throttles.items():
+            print(f"   Gmail API {account_name}: {throttle.summary()}")
+        for auth in self.auths:
+            auth.close()
+        # Alles gelukt: journal weg. Anders bewaren zodat de volgende run alleen de rest doet
+        if complete and self.authenticated and not self.journal.pending():
+            self.journal.finish()
+        else:
+            self.journal.close()
+            print(f"\n↻ Import onvolledig; de volgende run hervat vanaf {len(self.journal.done)} verwerkte emails")
 
-    try:
-        # Zoek emails
-        results = service.users().messages().list(
-            userId='me',
-            q=query,
-            maxResults=500
-        ).execute()
-
-        messages = results.get('messages', [])
-        print(f"📧 Gevonden: {len(messages)} emails")
-
-        if not messages:
-            print("   ℹ️  Geen emails gevonden voor deze contactgroep")
-            return 0
-
-        # Output directory
-        output_path = Path(output_dir) / contact_group
-        output_path.mkdir(parents=True, exist_ok=True)
-
-        # Download elke email
-        for idx, message in enumerate(messages, 1):
-            try:
-                # Get full message
-                msg = service.users().messages().get(
-                    userId='me',
-                    id=message['id'],
-                    format='full'
-                ).execute()
-
-                # Extract headers
-                headers = msg['payload']['headers']
-                subject = next((h['value'] for h in headers if h['name'].lower() == 'subject'), 'No Subject')
-                from_email = next((h['value'] for h in headers if h['name'].lower() == 'from'), 'Unknown')
-                to_email = next((h['value'] for h in headers if h['name'].lower() == 'to'), 'Unknown')
-                date = next((h['value'] for h in headers if h['name'].lower() == 'date'), 'Unknown')
-
-                # Parse date
-                try:
-                    date_obj = parsedate_to_datetime(date)
-                    date_str = date_obj.strftime('%Y-%m-%d')
-                except:
-                    date_str = '0000-00-00'
-
-                # Sanitize filename parts
-                from_clean = sanitize_filename_part(from_email, 60)
-                subject_clean = sanitize_filename_part(subject, 80)
-
-                # Filename format: {account}_{date}__{from}__{subject}
-                base_filename = f"{account_name}_{date_str}__{from_clean}__{subject_clean}"
-
-                # Save as .EML
-                eml_path = output_path / f"{base_filename}.eml"
-
-                # Get raw email
-                raw_msg = service.users().messages().get(
-                    userId='me',
-                    id=message['id'],
-                    format='raw'
-                ).execute()
-
-                msg_bytes = base64.urlsafe_b64decode(raw_msg['raw'])
-                eml_path.write_bytes(msg_bytes)
-
-                # Save metadata as JSON
-                email_metadata = {
-                    'id': message['id'],
-                    'subject': subject,
-                    'from': from_email,
-                    'to': to_email,
-                    'date': date
-                }
-
-                json_path = output_path / f"{base_filename}.json"
-                json_path.write_text(json.dumps(email_metadata, indent=2, ensure_ascii=False), encoding='utf-8')
-
-                print(f"  [{idx:3d}/{len(messages):3d}] ✅ {subject[:50]}")
-
-            except Exception as e:
-                print(f"  [{idx:3d}/{len(messages):3d}] ❌ Error: {e}")
-
-        print(f"\n✅ {len(messages)} emails opgeslagen in: {output_path}")
-        return len(messages)
-
-    except HttpError as error:
-        print(f'❌ HTTP Error bij ophalen emails: {error}')
-        return 0
+def pipeline_source():
+    return ArjanV2Source()
 
 def main():
     """Main functie"""
     print("=" * 70)
     print("  Arjan Emails Import Tool v2.0")
-    print("  Output format: EML + JSON (zoals gemeente_emails)")
+    print("  Output: content-addressed mail store (EML + manifest)")
     print("=" * 70)
 
-    output_dir = Path('C:/arjan_emails')
-    total_emails = 0
-    results = {}
-
-    # Accounts om te importeren (kan later uitgebreid worden met info@martiendejong.nl)
-    accounts_to_import = ['gmail']  # Later: 'martiendejong'
-
-    for account_key in accounts_to_import:
-        account_config = EMAIL_ACCOUNTS[account_key]
-        account_name = account_config['account']
-
-        print(f"\n{'#'*70}")
-        print(f"# Mailbox: {account_name}")
-        print(f"{'#'*70}")
-
-        # Authenticatie
-        service = get_gmail_service(account_key)
-
-        if not service:
-            print(f"❌ Authenticatie mislukt voor {account_name}")
-            results[account_name] = 'FAILED - Authentication'
-            continue
-
-        print(f"✅ Authenticatie succesvol voor {account_name}")
-
-        # Import voor elke contactgroep
-        account_total = 0
-        for contact_group in CONTACTS.keys():
-            count = download_emails(service, account_name, contact_group, output_dir)
-            account_total += count
-
-        total_emails += account_total
-        results[account_name] = f'{account_total} emails'
+    source = ArjanV2Source()
+    store = MailStore(OUTPUT_DIR)
+    try:
+        run_pipeline(source, store)
+    finally:
+        store.close()
 
     # Summary
     print(f"\n{'='*70}")
     print("  IMPORT SAMENVATTING")
     print(f"{'='*70}")
-    for account, result in results.items():
+    for account in source.accounts:
+        result = f"{source.counts.get(account, 0)} emails" if account in source.services \
+            else 'FAILED - Authentication'
         print(f"  {account:40s} : {result}")
     print(f"{'='*70}")
-    print(f"  TOTAAL: {total_emails} emails geïmporteerd")
+    print(f"  TOTAAL: {sum(source.counts.values())} emails geïmporteerd")
     print(f"{'='*70}")
-    print(f"\n📁 Locatie: {output_dir}")
+    print(f"\n📁 Locatie: {OUTPUT_DIR}")
     print("\n💡 Volgende stappen:")
     print("   1. Upload je ChatGPT conversations naar: chatgpt_conversations/")
     print("   2. Controleer de geïmporteerde emails per contactpersoon")
@@ -15,13 +15,25 @@ Van accounts:
 Output: C:\arjan_emails\emails\
 """
 
+import asyncio
 import imaplib
-import email
 from email.header import decode_header
 import os
 from datetime import datetime
 import getpass
 import re
+import threading
+import time
+
+import imap_async
+import imap_query
+from imap_fetch import FILTER_EXTRA, FILTER_FIELDS, DuplicateFilter, HeaderFilter, fetch_headers, fetch_raw
+from imap_pool import ImapPool
+from imap_sync import select_status
+from import_journal import ImportJournal
+from mail_index import MailIndex
+from mail_pipeline import Message, Source, run_pipeline
+from mail_store import MailStore
 
 # Configuratie
 OUTPUT_DIR = r"C:\arjan_emails\emails"
@@ -38,6 +50,29 @@ ACCOUNTS = [
     }
 ]
 
+# Folders om te doorzoeken (niet bestaande folders worden overgeslagen)
+FOLDERS_TO_SEARCH = ['INBOX', '[Gmail]/All Mail', 'All Mail']
+
+# Lokale filters op de headers (fase 1); alleen wat overblijft wordt volledig gedownload
+HEADER_FILTER = HeaderFilter(
+    since=None,                     # bv. "2020-01-01"
+    until=None,
+    max_size=25 * 1024 * 1024       # grotere emails overslaan
+)
+HEADER_MATCH_ONLY = False           # True: emails die alleen via BODY matchen overslaan
+
+# Aantal emails per UID FETCH round trip
+FETCH_CHUNK_SIZE = 50
+
+# Parallelle import (mail_pipeline.py: zoeken, downloaden, parsen en opslaan in eigen threads)
+# IMAP backend: 'threads' (imaplib, één download thread per verbinding) of 'asyncio'
+# (imap_async: alle verbindingen op één event loop, gepipelinede UID FETCH)
+IMPORT_BACKEND = 'threads'
+CONNECTIONS_PER_ACCOUNT = 4   # IMAP verbindingen per account
+MAX_WORKERS = 8               # Download threads (threads backend)
+SHARD_SIZE = 200              # UIDs per download taak
+PIPELINE_DEPTH = 4            # asyncio: UID FETCH commando's tegelijk onderweg per verbinding
+
 # Zoekfilters - mensen/bedrijven om te zoeken
 SEARCH_TERMS = [
     "arjan",
@@ -53,17 +88,6 @@ SEARCH_TERMS = [
     "cassandra"
 ]
 
-def sanitize_filename(filename):
-    """Maak bestandsnaam Windows-veilig"""
-    # Verwijder ongeldige karakters
-    invalid_chars = '<>:"/\\|?*'
-    for char in invalid_chars:
-        filename = filename.replace(char, '_')
-    # Beperk lengte
-    if len(filename) > 200:
-        filename = filename[:200]
-    return filename
-
 def decode_mime_words(s):
     """Decode MIME encoded strings"""
     decoded_string = ''
@@ -86,166 +110,375 @@ def connect_imap(email_address, password, imap_server, imap_port):
         print(f"✓ Succesvol ingelogd als {email_address}")
         return mail
     except imaplib.IMAP4.error as e:
-        print(f"✗ Login fout: {e}")
-        print("  Mogelijke oorzaken:")
-        print("  - Verkeerd wachtwoord")
-        print("  - 2FA ingeschakeld (gebruik app-specific password)")
-        print("  - IMAP niet ingeschakeld in account instellingen")
+        print_login_error(e)
         return None
 
-def search_emails(mail, search_terms):
-    """Zoek emails met OR query voor alle zoektermen"""
-    # Selecteer inbox en all mail
-    folders_to_search = ['INBOX', '[Gmail]/All Mail', 'All Mail']
-
-    all_email_ids = []
+async def connect_imap_async(email_address, password, imap_server, imap_port):
+    """Verbind met IMAP server (asyncio engine)"""
+    print(f"\nVerbinden met {imap_server} voor {email_address}...")
+    try:
+        mail = await imap_async.AsyncImap.open(imap_server, imap_port)
+        await mail.login(email_address, password)
+        print(f"✓ Succesvol ingelogd als {email_address}")
+        return mail
+    except imaplib.IMAP4.error as e:
+        print_login_error(e)
+        return None
 
-    for folder in folders_to_search:
-        try:
-            mail.select(folder)
-            print(f"\n  Zoeken in folder: {folder}")
-        except:
-            continue
-
-        # Zoek voor elke term
-        for term in search_terms:
-            queries = [
-                f'(OR FROM "{term}" TO "{term}")',
-                f'(OR CC "{term}" BCC "{term}")',
-                f'(SUBJECT "{term}")',
-                f'(BODY "{term}")'
-            ]
-
-            for query in queries:
-                try:
-                    status, messages = mail.search(None, query)
-                    if status == 'OK':
-                        msg_ids = messages[0].split()
-                        if msg_ids:
-                            all_email_ids.extend(msg_ids)
-                            print(f"    '{term}' ({query[:20]}...): {len(msg_ids)} emails")
-                except Exception as e:
-                    continue
-
-    # Verwijder duplicaten
-    unique_ids = list(set(all_email_ids))
-    print(f"\n  Totaal unieke emails gevonden: {len(unique_ids)}")
-    return unique_ids
-
-def download_email(mail, email_id, output_dir, account_email):
-    """Download en save een enkele email"""
+def print_login_error(e):
+    print(f"✗ Login fout: {e}")
+    print("  Mogelijke oorzaken:")
+    print("  - Verkeerd wachtwoord")
+    print("  - 2FA ingeschakeld (gebruik app-specific password)")
+    print("  - IMAP niet ingeschakeld in account instellingen")
+
+def search_folder(mail, folder, search_terms):
+    """
+    Zoek in één folder met één server-side OR query voor alle zoektermen.
+    Geeft de header-only FETCH resultaten terug (UID, Message-ID, X-GM-MSGID).
+    """
     try:
-        status, msg_data = mail.fetch(email_id, '(RFC822)')
+        status, _ = mail.select(imap_query.quote_folder(folder), readonly=True)
         if status != 'OK':
-            return False
-
-        # Parse email
-        email_body = msg_data[0][1]
-        message = email.message_from_bytes(email_body)
-
-        # Haal metadata op
-        subject = decode_mime_words(message.get('Subject', 'No Subject'))
-        from_addr = decode_mime_words(message.get('From', 'Unknown'))
-        date_str = message.get('Date', '')
-
-        # Parse datum voor bestandsnaam
-        try:
-            date_tuple = email.utils.parsedate_tz(date_str)
-            if date_tuple:
-                timestamp = email.utils.mktime_tz(date_tuple)
-                date_obj = datetime.fromtimestamp(timestamp)
-                date_formatted = date_obj.strftime('%Y-%m-%d_%H%M%S')
-            else:
-                date_formatted = datetime.now().strftime('%Y-%m-%d_%H%M%S')
-        except:
-            date_formatted = datetime.now().strftime('%Y-%m-%d_%H%M%S')
-
-        # Maak bestandsnaam
-        subject_clean = sanitize_filename(subject)
-        filename = f"{date_formatted}_{subject_clean[:80]}.eml"
-        filepath = os.path.join(output_dir, filename)
-
-        # Check of bestand al bestaat
-        counter = 1
-        original_filepath = filepath
-        while os.path.exists(filepath):
-            name, ext = os.path.splitext(original_filepath)
-            filepath = f"{name}_{counter}{ext}"
-            counter += 1
-
-        # Save email
-        with open(filepath, 'wb') as f:
-            f.write(email_body)
-
-        print(f"  ✓ {date_formatted} - {subject[:60]}")
-        return True
-
-    except Exception as e:
-        print(f"  ✗ Error downloading email {email_id}: {e}")
-        return False
-
-def import_from_account(account_config, search_terms, output_dir):
-    """Import emails from één account"""
-    email_address = account_config['email']
-
-    print(f"\n{'='*60}")
-    print(f"Account: {email_address}")
-    print(f"{'='*60}")
-
-    # Vraag wachtwoord
-    password = getpass.getpass(f"Wachtwoord voor {email_address}: ")
-
-    # Verbind
-    mail = connect_imap(
-        email_address,
-        password,
-        account_config['imap_server'],
-        account_config['imap_port']
-    )
-
-    if not mail:
-        print(f"✗ Kon niet verbinden met {email_address}")
-        return 0
-
-    # Zoek emails
-    email_ids = search_emails(mail, search_terms)
-
-    if not email_ids:
-        print(f"Geen emails gevonden voor {email_address}")
-        mail.logout()
-        return 0
-
-    # Download emails
-    print(f"\nDownloading {len(email_ids)} emails...")
-    success_count = 0
-
-    for i, email_id in enumerate(email_ids, 1):
-        print(f"\n[{i}/{len(email_ids)}]", end=" ")
-        if download_email(mail, email_id, output_dir, email_address):
-            success_count += 1
+            return None
+    except:
+        return None
 
-    mail.logout()
+    # Eén query voor alle termen (X-GM-RAW op Gmail, anders geneste OR)
+    started = time.perf_counter()
+    msg_ids = imap_query.search(mail, search_terms, uid=True)
+    elapsed = time.perf_counter() - started
 
-    print(f"\n✓ Succesvol gedownload: {success_count}/{len(email_ids)} emails")
-    return success_count
+    # Fase 1, alleen headers + grootte: term-statistiek, duplicaten en lokale filters
+    gmail = imap_query.is_gmail(mail)
+    messages = list(fetch_headers(mail, msg_ids, FILTER_FIELDS, gmail=gmail, extra=FILTER_EXTRA)) if msg_ids else []
+    return select_candidates(folder, len(msg_ids), elapsed, messages, search_terms)
 
-def create_index(output_dir):
-    """Maak index bestand van alle emails"""
-    emails = sorted([f for f in os.listdir(output_dir) if f.endswith('.eml')])
+async def search_folder_async(mail, folder, search_terms):
+    """search_folder over een AsyncImap verbinding"""
+    try:
+        status, _ = await mail.select(imap_query.quote_folder(folder), readonly=True)
+        if status != 'OK':
+            return None
+    except imaplib.IMAP4.abort:
+        raise
+    except Exception:
+        return None
 
-    index_file = os.path.join(output_dir, 'email_index.txt')
+    started = time.perf_counter()
+    msg_ids = await imap_async.search(mail, search_terms)
+    elapsed = time.perf_counter() - started
+
+    gmail = imap_query.is_gmail(mail)
+    messages = await imap_async.fetch_headers(mail, msg_ids, FILTER_FIELDS, gmail=gmail, extra=FILTER_EXTRA) if msg_ids else []
+    return select_candidates(folder, len(msg_ids), elapsed, messages, search_terms)
+
+def select_candidates(folder, found, elapsed, messages, search_terms):
+    """Lokaal deel van fase 1: welke term matchte en wat door de filters komt"""
+    lines = [f"  Zoeken in folder: {folder} - {found} emails ({elapsed:.1f}s)"]
+    if not messages:
+        print("\n".join(lines))
+        return []
+
+    # Welke term matchte: lokaal bepaald uit alleen de headers
+    headers = {m.uid: m.part('BODY[HEADER') or b'' for m in messages}
+    matches = imap_query.attribute_matches(headers, search_terms)
+    counts = imap_query.term_counts(matches)
+    for term, count in sorted(counts.items(), key=lambda item: -item[1]):
+        lines.append(f"    '{term}': {count} emails")
+
+    # Alleen wat door de filters komt gaat naar fase 2 (volledige download)
+    if HEADER_MATCH_ONLY:
+        messages = [m for m in messages if matches[m.uid] != [imap_query.BODY_ONLY]]
+    messages, rejected = HEADER_FILTER.split(messages)
+    if HEADER_MATCH_ONLY:
+        rejected['body-only'] = counts.get(imap_query.BODY_ONLY, 0)
+    if any(rejected.values()):
+        lines.append(f"    Lokaal gefilterd: {rejected}")
+    print("\n".join(lines))
+    return messages
+
+def collect_passwords(accounts):
+    """Vraag alle wachtwoorden vooraf, zodat de import daarna ongestoord parallel loopt"""
+    passwords = {}
+    for account in accounts:
+        passwords[account['email']] = getpass.getpass(f"Wachtwoord voor {account['email']}: ")
+    return passwords
+
+def make_pool(account_config, password):
+    """Connection pool met CONNECTIONS_PER_ACCOUNT verbindingen voor één account"""
+    def connect():
+        return connect_imap(
+            account_config['email'],
+            password,
+            account_config['imap_server'],
+            account_config['imap_port']
+        )
+    return ImapPool(connect, CONNECTIONS_PER_ACCOUNT, account_config['email'])
+
+def run_search(pool, folder, search_terms):
+    """Zoek-taak: leen een verbinding uit de pool en doorzoek één folder. Geeft (messages, uidvalidity)"""
+    with pool.connection() as mail:
+        messages = search_folder(mail, folder, search_terms)
+        return messages, select_status(mail)['uidvalidity']
+
+def uidvalidity_changed(pool, folder, uidvalidity):
+    """Een plan is alleen geldig zolang de folder bestaat en zijn UIDs niet zijn hernummerd"""
+    with pool.connection() as mail:
+        status, _ = mail.select(imap_query.quote_folder(folder), readonly=True)
+        return status != 'OK' or select_status(mail)['uidvalidity'] != uidvalidity
+
+def task_key(email_address, folder):
+    return f"{email_address}|{folder}"
+
+def message_key(email_address, folder, uid):
+    return f"{email_address}|{folder}|{uid}"
+
+def open_journal(accounts, search_terms, store):
+    """Journal van deze run; een onderbroken run met dezelfde instellingen wordt hervat"""
+    params = {
+        'accounts': [account['email'] for account in accounts],
+        'folders': FOLDERS_TO_SEARCH,
+        'terms': search_terms,
+        'filter': [HEADER_FILTER.since, HEADER_FILTER.until, HEADER_FILTER.max_size, HEADER_MATCH_ONLY],
+    }
+    journal = ImportJournal(store.root, 'import-arjan-emails', params)
+    if journal.resumed:
+        print(f"↻ Onderbroken run van {journal.started} wordt hervat "
+              f"({len(journal.plans)} folders doorzocht, {len(journal.done)} emails klaar)")
+    return journal
+
+def close_journal(journal, complete):
+    """Volledige run: journal weg. Anders bewaren zodat de volgende run alleen de rest doet"""
+    # Ook een email die niet opgeslagen kon worden maakt de run onvolledig
+    if complete and not journal.pending():
+        journal.finish()
+    else:
+        journal.close()
+        print(f"↻ Import onvolledig; de volgende run hervat vanaf {len(journal.done)} opgeslagen emails")
+
+def remaining_uids(journal, email_address, folder, uids):
+    return [uid for uid in uids if not journal.is_done(message_key(email_address, folder, uid))]
+
+def seed_duplicates(store):
+    """DuplicateFilter waarin wat al in de store staat ook als gezien telt"""
+    duplicate_filter = DuplicateFilter()
+    for entry in store.entries():
+        if entry.get('account') and entry.get('message_id'):
+            duplicate_filter.seed(entry['account'], message_id=entry['message_id'])
+    return duplicate_filter
+
+class ArjanSource(Source):
+    """
+    Both mailboxes as a pipeline source (mail_pipeline.py): folder searches in
+    the list stage, UID shards in the fetch stage, both over the IMAP pools;
+    parse and store run alongside instead of in the download loop.
+    """
+
+    name = 'import-arjan-emails'
+    root = OUTPUT_DIR
+    shard_size = SHARD_SIZE
+
+    def __init__(self, accounts=ACCOUNTS, passwords=None, search_terms=SEARCH_TERMS):
+        self.accounts = accounts
+        self.passwords = passwords
+        self.search_terms = search_terms
+        self.counts = {}
+        self.duplicates = 0
+        self.lock = threading.Lock()
+
+    def open(self, store):
+        super().open(store)
+        # Wachtwoorden vooraf, daarna loopt alles parallel
+        passwords = self.passwords or collect_passwords(self.accounts)
+        self.open_pools(passwords)
+        self.duplicate_filter = seed_duplicates(store)
+        self.journal = open_journal(self.accounts, self.search_terms, store)
+
+    def open_pools(self, passwords):
+        self.pools = {account['email']: make_pool(account, passwords[account['email']]) for account in self.accounts}
+        # Zoeken en downloaden lenen verbindingen uit dezelfde pools
+        self.workers = {'list': CONNECTIONS_PER_ACCOUNT, 'fetch': MAX_WORKERS}
+
+    def search(self, email_address, folder):
+        """(header-only messages die door de filters komen, uidvalidity) van één folder"""
+        return run_search(self.pools[email_address], folder, self.search_terms)
+
+    def plan_outdated(self, email_address, folder, uidvalidity):
+        return uidvalidity_changed(self.pools[email_address], folder, uidvalidity)
+
+    def download(self, email_address, folder, uids, uidvalidity):
+        """(uid, raw) van de gevraagde UIDs; wat niet meer bestaat ontbreekt"""
+        with self.pools[email_address].connection() as mail:
+            mail.select(imap_query.quote_folder(folder), readonly=True)
+            if select_status(mail)['uidvalidity'] != uidvalidity:
+                # Hernummerd sinds het zoeken: de volgende run ziet dat in list() en zoekt opnieuw
+                raise RuntimeError(f"UIDVALIDITY van {folder} gewijzigd tijdens de import")
+            yield from fetch_raw(mail, uids, FETCH_CHUNK_SIZE)
+
+    def close_pools(self):
+        for pool in self.pools.values():
+            pool.close()
+
+    def searches(self):
+        return [(email_address, folder) for email_address in self.pools for folder in FOLDERS_TO_SEARCH]
+
+    def list(self, search):
+        email_address, folder = search
+        # Al doorzocht in een onderbroken run -> plan hervatten, tenzij de UIDs niet meer kloppen
+        plan = self.journal.planned(task_key(email_address, folder))
+        uids = remaining_uids(self.journal, email_address, folder, plan['ids']) if plan is not None else []
+        if uids and self.plan_outdated(email_address, folder, plan.get('uidvalidity')):
+            print(f"⚠ UIDVALIDITY van {email_address}/{folder} gewijzigd sinds de onderbroken run: opnieuw zoeken")
+            self.journal.drop(task_key(email_address, folder))
+            plan = None
+        if plan is not None:
+            uidvalidity = plan.get('uidvalidity')
+        else:
+            messages, uidvalidity = self.search(email_address, folder)
+            # Zelfde email via een andere folder (of al in de store): body niet opnieuw halen
+            messages = messages or []
+            uids = [m.uid for m in messages if self.duplicate_filter.claim(email_address, folder, m)]
+            with self.lock:
+                self.duplicates += len(messages) - len(uids)
+            self.journal.plan(task_key(email_address, folder), uids, uidvalidity=uidvalidity)
+        size = self.shard_size or len(uids) or 1
+        for start in range(0, len(uids), size):
+            yield email_address, folder, uids[start:start + size], uidvalidity
+
+    def fetch(self, task):
+        email_address, folder, uids, uidvalidity = task
+        fetched = set()
+        for uid, raw_email in self.download(email_address, folder, uids, uidvalidity):
+            # Blokkeert als parse/opslaan achterloopt (begrensd geheugen)
+            yield Message(raw_email, key=message_key(email_address, folder, uid), account=email_address, folder=folder)
+            fetched.add(uid)
+        # Wat de server niet meer teruggeeft is verwijderd sinds het zoeken: klaar, anders blijft het plan openstaan
+        gone = [uid for uid in uids if uid not in fetched]
+        for uid in gone:
+            self.journal.mark_done(message_key(email_address, folder, uid))
+        if gone:
+            print(f"⚠ {email_address}/{folder}: {len(gone)} emails niet meer op de server, overgeslagen")
+
+    def stored(self, message):
+        # Pas na het opslaan als klaar markeren
+        self.journal.mark_done(message.key)
+        account_email = message.meta['account']
+        with self.lock:
+            self.counts[account_email] = self.counts.get(account_email, 0) + 1
+
+    def close(self, complete):
+        self.close_pools()
+        close_journal(self.journal, complete)
+        print(f"\n{self.duplicates} duplicaten overgeslagen (andere folder of al opgeslagen)")
+        for account in self.accounts:
+            print(f"✓ {account['email']}: {self.counts.get(account['email'], 0)} emails opgeslagen")
+
+class ArjanAsyncSource(ArjanSource):
+    """
+    ArjanSource on the asyncio engine (imap_async.py): every IMAP connection
+    lives on one event loop thread. A fetch task is a whole folder; its UID
+    shards download at once over all connections of the account, each with
+    pipelined UID FETCH, so a few pipeline threads keep every connection busy.
+    """
+
+    shard_size = None  # één taak per folder, de shards verdeelt download() over de pool
+
+    def open_pools(self, passwords):
+        self.loop = imap_async.LoopThread()
+
+        def make_connect(account):
+            return lambda: connect_imap_async(account['email'], passwords[account['email']],
+                                              account['imap_server'], account['imap_port'])
+        self.pools = {account['email']: imap_async.AsyncPool(make_connect(account), CONNECTIONS_PER_ACCOUNT,
+                                                             account['email'])
+                      for account in self.accounts}
+        # Threads wachten alleen op de event loop; het aantal verbindingen staat daar los van
+        self.workers = {'list': CONNECTIONS_PER_ACCOUNT, 'fetch': len(self.accounts)}
+
+    def search(self, email_address, folder):
+        async def run():
+            async with self.pools[email_address].connection() as mail:
+                messages = await search_folder_async(mail, folder, self.search_terms)
+                return messages, select_status(mail)['uidvalidity']
+        return self.loop.run(run())
+
+    def plan_outdated(self, email_address, folder, uidvalidity):
+        async def run():
+            async with self.pools[email_address].connection() as mail:
+                status, _ = await mail.select(imap_query.quote_folder(folder), readonly=True)
+                return status != 'OK' or select_status(mail)['uidvalidity'] != uidvalidity
+        return self.loop.run(run())
+
+    def download(self, email_address, folder, uids, uidvalidity):
+        return self.loop.iterate(self.download_async(email_address, folder, uids, uidvalidity))
+
+    async def download_async(self, email_address, folder, uids, uidvalidity):
+        """Alle shards van een folder tegelijk, elk over een eigen verbinding; (uid, raw) in aankomstvolgorde"""
+        pool = self.pools[email_address]
+        arrived = asyncio.Queue(maxsize=FETCH_CHUNK_SIZE)
+
+        async def fetch_shard(shard):
+            async with pool.connection() as mail:
+                await mail.select(imap_query.quote_folder(folder), readonly=True)
+                if select_status(mail)['uidvalidity'] != uidvalidity:
+                    raise RuntimeError(f"UIDVALIDITY van {folder} gewijzigd tijdens de import")
+                async for item in imap_async.fetch_raw(mail, shard, FETCH_CHUNK_SIZE, PIPELINE_DEPTH):
+                    await arrived.put(item)
+
+        producer = asyncio.gather(*(fetch_shard(uids[start:start + SHARD_SIZE])
+                                    for start in range(0, len(uids), SHARD_SIZE)))
+        try:
+            while True:
+                getter = asyncio.ensure_future(arrived.get())
+                await asyncio.wait({getter, producer}, return_when=asyncio.FIRST_COMPLETED)
+                if not getter.done():
+                    getter.cancel()
+                    break
+                yield getter.result()
+            # Alle shards klaar (of één mislukt): rest van de queue, dan de fout doorgeven
+            while not arrived.empty():
+                yield arrived.get_nowait()
+            producer.result()
+        finally:
+            # Ook bij een fout of afbreken: geen shard blijft op een volle queue wachten
+            producer.cancel()
+            await asyncio.gather(producer, return_exceptions=True)
+
+    def close_pools(self):
+        for pool in self.pools.values():
+            self.loop.run(pool.close())
+        self.loop.close()
+
+def pipeline_source():
+    return ArjanAsyncSource() if IMPORT_BACKEND == 'asyncio' else ArjanSource()
+
+def create_index(store):
+    """Maak index bestand van alle emails in de store"""
+    emails = sorted(store.entries(), key=lambda e: e.get('date', ''))
+
+    index_file = os.path.join(store.root, 'email_index.txt')
     with open(index_file, 'w', encoding='utf-8') as f:
         f.write(f"Email Index - Arjan Stroeve & Gerelateerde Contacten\n")
         f.write(f"Gegenereerd: {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}\n")
         f.write(f"Totaal emails: {len(emails)}\n")
         f.write("="*80 + "\n\n")
 
-        for email_file in emails:
-            f.write(f"{email_file}\n")
+        for entry in emails:
+            path = store.location(entry['h'])
+            f.write(f"{entry.get('date', '')[:19]}  {entry.get('subject', '')[:80]}\n")
+            f.write(f"    {path}\n")
 
     print(f"\n✓ Index aangemaakt: {index_file}")
     print(f"  Totaal emails in index: {len(emails)}")
 
+    # Doorzoekbare FTS index bijwerken (alleen nieuwe/gewijzigde emails)
+    index = MailIndex()
+    added, updated, removed, _ = index.update([store.root])
+    index.close()
+    print(f"✓ Zoekindex bijgewerkt: {added} nieuw, {updated} bijgewerkt, {removed} verwijderd")
+    print(f"  Zoeken: python mail_index.py search \"<term>\"")
+
 def main():
     """Main functie"""
     print("""
@@ -268,19 +501,22 @@ Van accounts:
 Output: {OUTPUT_DIR}
 """)
 
-    # Maak output directory
-    os.makedirs(OUTPUT_DIR, exist_ok=True)
-    print(f"✓ Output directory: {OUTPUT_DIR}\n")
+    # Open (of maak) de mail store in de output directory
+    store = MailStore(OUTPUT_DIR)
+    print(f"✓ Output directory: {OUTPUT_DIR} ({len(store)} emails al aanwezig)\n")
 
-    # Import van elk account
-    total_imported = 0
-    for account in ACCOUNTS:
-        count = import_from_account(account, SEARCH_TERMS, OUTPUT_DIR)
-        total_imported += count
+    # Wachtwoorden vooraf, daarna loopt alles parallel
+    passwords = collect_passwords(ACCOUNTS)
+    started = time.perf_counter()
+    source_class = ArjanAsyncSource if IMPORT_BACKEND == 'asyncio' else ArjanSource
+    source = source_class(ACCOUNTS, passwords, SEARCH_TERMS)
+    run_pipeline(source, store)
+    total_imported = sum(source.counts.values())
+    print(f"\nImport duurde {time.perf_counter() - started:.1f}s")
 
     # Maak index
     if total_imported > 0:
-        create_index(OUTPUT_DIR)
+        create_index(store)
 
     # Samenvatting
     print(f"\n{'='*60}")
@@ -292,7 +528,7 @@ Output: {OUTPUT_DIR}
     if total_imported > 0:
         print(f"\nVolgende stappen:")
         print(f"1. Check emails in: {OUTPUT_DIR}")
-        print(f"2. Lees email_index.txt voor overzicht")
+        print(f"2. Lees email_index.txt of zoek met mail_index.py")
         print(f"3. Update TIJDLIJN_ARJAN_STROEVE_COMPLEET.md")
         print(f"4. Vul OPENSTAANDE_VRAGEN.md in")
     else:
@@ -0,0 +1,208 @@
+#!/usr/bin/env python3
+"""
+Import Journal - resumable import runs
+
+A run writes <store>/.journal/<name>.jsonl: a start record with a fingerprint
+of the run parameters, the planned work per task (e.g. the UIDs found in one
+folder, the Gmail ids of one contact group) and one record per finished
+message. Records are appended and flushed one by one and fsync'ed every
+SYNC_EVERY records, so after a crash, quota error or Ctrl+C at most a torn
+last line is lost; that line is ignored and cut off on the next open.
+
+When the next run has the same fingerprint it resumes: planned tasks skip
+their search/list step and finished messages are skipped. A plan that no
+longer holds (e.g. the folder's UIDs were renumbered) is dropped and planned
+again. finish() removes the journal; the next run after a completed one
+starts fresh.
+
+Only mark a message done after it is safely in the mail store (objects are
+written via temp file + rename, see atomic_file.py). Done keys are
+"<task>|<id>" for an id of a planned task; pending() counts on that.
+
+Usage:
+    python import_journal.py <store root>     # show unfinished runs
+"""
+
+import hashlib
+import json
+import os
+import sys
+import threading
+from datetime import datetime
+from pathlib import Path
+
+from atomic_file import atomic_write
+
+JOURNAL_DIR = '.journal'
+SYNC_EVERY = 50
+
+
+def fingerprint(params):
+    """Stable short hash of the run parameters (JSON-serialisable)"""
+    data = json.dumps(params, sort_keys=True, default=str).encode('utf-8')
+    return hashlib.sha256(data).hexdigest()[:16]
+
+
+def _read_records(path):
+    """(records, length of the intact prefix in bytes)"""
+    records = []
+    good = 0
+    with open(path, 'rb') as f:
+        for line in f:
+            if not line.endswith(b'\n'):
+                break
+            try:
+                records.append(json.loads(line))
+            except ValueError:
+                break
+            good += len(line)
+    return records, good
+
+
+class ImportJournal:
+    """Journal of one named import run; thread-safe"""
+
+    def __init__(self, root, name, params=None):
+        self.path = Path(root) / JOURNAL_DIR / f"{name}.jsonl"
+        self.fingerprint = fingerprint(params)
+        self.plans = {}
+        self.done = set()
+        self.resumed = False
+        self._lock = threading.Lock()
+        self._unsynced = 0
+
+        if self.path.exists():
+            records, good = _read_records(self.path)
+            start = records[0] if records else {}
+            finished = any(r.get('type') == 'end' for r in records)
+            if start.get('type') == 'start' and start.get('fingerprint') == self.fingerprint and not finished:
+                self.resumed = True
+                self.started = start.get('started')
+                for record in records[1:]:
+                    self._apply(record)
+                if good < self.path.stat().st_size:
+                    # Afgebroken laatste regel weghalen voor we verder schrijven
+                    with open(self.path, 'r+b') as f:
+                        f.truncate(good)
+
+        if not self.resumed:
+            self.started = datetime.now().isoformat(timespec='seconds')
+            start = {'type': 'start', 'fingerprint': self.fingerprint, 'started': self.started}
+            atomic_write(self.path, (json.dumps(start) + '\n').encode('utf-8'))
+        self._file = open(self.path, 'a', encoding='utf-8')
+
+    def _apply(self, record):
+        kind = record.get('type')
+        if kind == 'plan':
+            self.plans[record['task']] = record
+        elif kind == 'done':
+            self.done.add(record['key'])
+        elif kind == 'drop':
+            self.plans.pop(record['task'], None)
+            prefix = f"{record['task']}|"
+            self.done = {key for key in self.done if not key.startswith(prefix)}
+
+    def _write(self, record):
+        self._file.write(json.dumps(record, ensure_ascii=False, separators=(',', ':')) + '\n')
+        self._file.flush()
+        self._unsynced += 1
+        if self._unsynced >= SYNC_EVERY:
+            self._sync()
+
+    def _sync(self):
+        os.fsync(self._file.fileno())
+        self._unsynced = 0
+
+    def plan(self, task, ids, **meta):
+        """Record the work list of a task (ids as found by search/list, plus e.g. uidvalidity)"""
+        record = {'type': 'plan', 'task': task, 'ids': list(ids), **meta}
+        with self._lock:
+            self.plans[task] = record
+            self._write(record)
+
+    def drop(self, task):
+        """Forget the plan of a task and its finished ids, so it can be planned again"""
+        record = {'type': 'drop', 'task': task}
+        with self._lock:
+            self._apply(record)
+            self._write(record)
+
+    def planned(self, task):
+        """Plan record of a task from the interrupted run, or None"""
+        return self.plans.get(task)
+
+    def pending(self):
+        """Number of planned ids that are not marked done yet"""
+        with self._lock:
+            return sum(1 for task, plan in self.plans.items()
+                       for item in plan['ids'] if f"{task}|{item}" not in self.done)
+
+    def is_done(self, key):
+        return key in self.done
+
+    def mark_done(self, key):
+        with self._lock:
+            if key in self.done:
+                return
+            self.done.add(key)
+            self._write({'type': 'done', 'key': key})
+
+    def close(self):
+        """Stop writing but keep the journal, so the next run resumes"""
+        with self._lock:
+            if self._file.closed:
+                return
+            self._sync()
+            self._file.close()
+
+    def finish(self):
+        """Run completed: the journal is no longer needed"""
+        with self._lock:
+            if not self._file.closed:
+                self._write({'type': 'end'})
+                self._file.close()
+            try:
+                self.path.unlink()
+            except OSError:
+                pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        # Zonder fout afgerond -> weg; anders bewaren om te hervatten
+        if exc_type is None:
+            self.finish()
+        else:
+            self.close()
+
+
+def main():
+    if len(sys.argv) < 2:
+        print(__doc__)
+        return
+    journal_dir = Path(sys.argv[1]) / JOURNAL_DIR
+    journals = sorted(journal_dir.glob('*.jsonl')) if journal_dir.exists() else []
+    if not journals:
+        print("Geen onderbroken imports")
+        return
+    for path in journals:
+        records, _ = _read_records(path)
+        plans = {}
+        done = set()
+        for record in records:
+            if record.get('type') == 'plan':
+                plans[record['task']] = record
+            elif record.get('type') == 'done':
+                done.add(record['key'])
+            elif record.get('type') == 'drop':
+                plans.pop(record['task'], None)
+                done = {key for key in done if not key.startswith(f"{record['task']}|")}
+        done = len(done)
+        planned = sum(len(r['ids']) for r in plans.values())
+        started = records[0].get('started', '?') if records else '?'
+        print(f"{path.stem:30s} gestart {started}  {len(plans)} taken, {done}/{planned} emails klaar")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,375 @@
+#!/usr/bin/env python3
+"""
+Mail Attachments - decoded attachments, stored once per content hash
+
+The importers keep whole .eml files, so a PDF that is forwarded ten times
+sits (base64 encoded) inside ten messages. This stage stream-parses each new
+message once (mail_parse), decodes every attachment straight into a spool
+file while hashing it, and moves it to a content-addressed blob - or drops
+the spool copy when the blob already exists. The base64 body in the stored
+message is then replaced by a one-line reference to the blob (stub); the
+MailStore re-encodes it on read and export, so the attachment is on disk
+once, decoded, and the message still comes back byte for byte:
+
+    <root>/attachments/ab/cd/abcd...<ext>   decoded attachment, stored once
+    <root>/attachments.jsonl                one line per message: its parts
+
+Lookups (per message, per hash, per filename) come from the manifest in
+memory; nothing is decoded again.
+
+Usage:
+    python mail_attachments.py <root>                        # summary (dedup)
+    python mail_attachments.py <root> --extract [--prune-parts]   # also stubs earlier extracted messages
+    python mail_attachments.py <root> --find offerte.pdf     # filename or hash prefix
+"""
+
+import argparse
+import json
+import os
+import shutil
+import threading
+import weakref
+from pathlib import Path
+
+from mail_parse import parse_bytes, parse_file
+from mail_store import PARTS_SUFFIX, MailStore, encode_base64
+
+ATTACHMENTS_DIR = 'attachments'
+MANIFEST_NAME = 'attachments.jsonl'
+SPOOL_DIR = '.spool'
+MAX_EXTENSION = 10
+STUB_LINE = '[attachment sha256:{}]'  # vervangt de base64 body in het opgeslagen bericht
+
+_stores = weakref.WeakKeyDictionary()
+
+
+def blob_extension(filename, content_type):
+    """Extensie voor een blob: uit de bestandsnaam, anders uit het content type"""
+    ext = os.path.splitext(filename or '')[1].lower()
+    if ext and len(ext) <= MAX_EXTENSION and ext[1:].isalnum():
+        return ext
+    subtype = (content_type or '').partition('/')[2]
+    return f".{subtype}" if subtype.isalnum() and len(subtype) <= 5 else '.bin'
+
+
+class AttachmentStore:
+    """Content-addressed attachments of a MailStore with a per-message manifest"""
+
+    def __init__(self, store):
+        self.store = store
+        self.root = Path(store.root) / ATTACHMENTS_DIR
+        self.manifest_path = Path(store.root) / MANIFEST_NAME
+
+        self._messages = {}   # message digest -> [part, ...]
+        self._blobs = {}      # sha256 -> {'sha256', 'size', 'content_type', 'ext', 'messages'}
+        self._load_manifest()
+
+    def _load_manifest(self):
+        if not self.manifest_path.exists():
+            return
+        good = 0
+        with open(self.manifest_path, 'rb') as f:
+            for line in f:
+                if not line.endswith(b'\n'):
+                    break
+                good += len(line)
+                try:
+                    record = json.loads(line)
+                except ValueError:
+                    continue
+                self._apply(record)
+        if good < self.manifest_path.stat().st_size:
+            # Afgebroken laatste regel na een crash: afkappen (zoals mail_store)
+            with open(self.manifest_path, 'r+b') as f:
+                f.truncate(good)
+
+    def _apply(self, record):
+        digest = record['m']
+        self._messages[digest] = record['parts']
+        for part in record['parts']:
+            blob = self._blobs.get(part['a'])
+            if blob is None:
+                blob = self._blobs[part['a']] = {
+                    'sha256': part['a'],
+                    'size': part['size'],
+                    'content_type': part.get('content_type'),
+                    'ext': blob_extension(part.get('filename'), part.get('content_type')),
+                    'messages': [],
+                }
+            if digest not in blob['messages']:
+                blob['messages'].append(digest)
+
+    def _append(self, record):
+        line = json.dumps(record, ensure_ascii=False, separators=(',', ':'))
+        with open(self.manifest_path, 'a', encoding='utf-8') as f:
+            f.write(line + '\n')
+        self._apply(record)
+
+    def __contains__(self, digest):
+        """True als de bijlagen van dit bericht al zijn uitgepakt"""
+        return digest in self._messages
+
+    def __len__(self):
+        return len(self._blobs)
+
+    def path(self, sha256):
+        """Blob path for an attachment hash, or None when unknown"""
+        blob = self._blobs.get(sha256)
+        if blob is None:
+            return None
+        return self.root / sha256[:2] / sha256[2:4] / f"{sha256}{blob['ext']}"
+
+    def attachments(self, digest):
+        """Parts of a message: [{'a', 'filename', 'content_type', 'size'}], [] if none, None if not extracted"""
+        return self._messages.get(digest)
+
+    def messages(self, sha256):
+        """Digests of every message that carries this attachment"""
+        blob = self._blobs.get(sha256)
+        return list(blob['messages']) if blob else []
+
+    def blobs(self):
+        return list(self._blobs.values())
+
+    def find(self, term):
+        """Parts whose filename contains term, or whose hash starts with it: [(message digest, part)]"""
+        term = term.lower()
+        return [(digest, part) for digest, parts in self._messages.items() for part in parts
+                if part['a'].startswith(term) or term in (part.get('filename') or '').lower()]
+
+    def extract(self, digest):
+        """
+        Decode the attachments of a stored message into blobs (once per message).
+        Returns the ParsedMail; its attachments carry 'sha256' and the blob 'path'.
+        """
+        if digest in self._messages:
+            # Al uitgepakt: alleen headers en tekst, bijlagen ongedecodeerd overslaan
+            with self.store.open(digest) as fp:
+                parsed = parse_file(fp)
+            parsed.attachments = [self._info(part) for part in self._messages[digest]]
+            return parsed
+
+        spool = self.root / SPOOL_DIR / digest
+        raw = self.store.read(digest)
+        parsed = self.commit(digest, parse_bytes(raw, spool_dir=str(spool)), spool)
+        self.tidy()
+        stripped = self.stub(raw, parsed.attachments)
+        if stripped:
+            self.store.strip(digest, *stripped)
+        return parsed
+
+    def spool(self, digest, raw):
+        """
+        Parse a message before it is stored and decode its attachments into a
+        spool directory of its own. Touches no shared state, so the parse
+        threads of mail_pipeline.py run it; returns (ParsedMail, spool) for
+        commit() - or discard() when the message turns out to exist already.
+        Call tidy() once no spool is in progress any more.
+        """
+        spool = self.root / SPOOL_DIR / f"{digest}-{threading.get_ident()}"
+        return parse_bytes(raw, spool_dir=str(spool)), spool
+
+    def commit(self, digest, parsed, spool):
+        """Move the spooled attachments of a parsed message into their blobs and record them"""
+        if digest in self._messages:
+            self.discard(spool)
+            parsed.attachments = [self._info(part) for part in self._messages[digest]]
+            return parsed
+        parts = []
+        for attachment in parsed.attachments:
+            part = {
+                'a': attachment['sha256'],
+                'filename': attachment.get('filename'),
+                'content_type': attachment.get('content_type'),
+                'size': attachment['size'],
+            }
+            target = self.path(part['a'])
+            if target is not None and target.exists():
+                # Zelfde inhoud al opgeslagen (ander bericht, andere naam): spool kopie weg
+                os.remove(attachment['path'])
+            else:
+                ext = blob_extension(part['filename'], part['content_type'])
+                target = target or self.root / part['a'][:2] / part['a'][2:4] / f"{part['a']}{ext}"
+                target.parent.mkdir(parents=True, exist_ok=True)
+                os.replace(attachment['path'], target)
+            attachment['path'] = str(target)
+            parts.append(part)
+        self.discard(spool)
+
+        self._append({'m': digest, 'parts': parts})
+        return parsed
+
+    def stub(self, raw, attachments):
+        """
+        The message with every base64 attachment body replaced by a one-line
+        reference to its blob: (object bytes, stubs) for MailStore.put/strip,
+        or None when there is nothing to stub. attachments are the committed
+        parts of parse_bytes(raw). A body is only stubbed when re-encoding the
+        blob gives exactly the same bytes back, otherwise it stays inline.
+        """
+        pieces, stubs = [], []
+        position = length = 0
+        for attachment in attachments:
+            if attachment.get('encoding') != 'base64' or not attachment.get('size') or 'span' not in attachment:
+                continue
+            start, end = attachment['span']
+            first = raw[start:raw.find(b'\n', start, end) + 1]
+            eol = b'\r\n' if first.endswith(b'\r\n') else b'\n'
+            width = len(first) - len(eol)
+            # Witregels voor de delimiter blijven in het bericht staan
+            body = raw[start:end].rstrip(b'\r\n') + eol
+            end = start + len(body)
+            if width <= 0 or width % 4 or raw[start:end] != body:
+                continue
+            encoded = -(-attachment['size'] // 3) * 4
+            if len(body) != encoded + -(-encoded // width) * len(eol):
+                continue  # andere regelopmaak (bijv. een korte regel halverwege): inline laten
+            path = self.path(attachment['sha256'])
+            if path is None or encode_base64(path.read_bytes(), width, eol) != body:
+                continue
+            line = STUB_LINE.format(attachment['sha256']).encode('ascii') + eol
+            pieces.append(raw[position:start])
+            length += start - position
+            stubs.append({'at': length, 'len': len(line), 'width': width, 'eol': eol.decode('ascii'),
+                          'blob': path.relative_to(self.store.root).as_posix()})
+            pieces.append(line)
+            length += len(line)
+            position = end
+        if not stubs:
+            return None
+        pieces.append(raw[position:])
+        return b''.join(pieces), stubs
+
+    def strip(self, digest):
+        """Stub the attachment bodies out of a message extracted before; True when it was rewritten"""
+        parts = self._messages.get(digest)
+        entry = self.store.get(digest)
+        if not parts or entry is None or entry.get('stubs'):
+            return False
+        raw = self.store.read(digest)
+        # Zonder spool: alleen de posities, niets decoderen; de parts staan in dezelfde volgorde
+        parsed = parse_bytes(raw)
+        if len(parsed.attachments) != len(parts):
+            return False
+        attachments = [dict(attachment, sha256=part['a'], size=part['size'])
+                       for attachment, part in zip(parsed.attachments, parts)]
+        stripped = self.stub(raw, attachments)
+        return bool(stripped) and self.store.strip(digest, *stripped)
+
+    @staticmethod
+    def discard(spool):
+        """Remove a spool directory"""
+        shutil.rmtree(spool, ignore_errors=True)
+
+    def tidy(self):
+        """Remove the spool root once it is empty"""
+        try:
+            (self.root / SPOOL_DIR).rmdir()
+        except OSError:
+            pass  # andere spool nog bezig (of er was er geen)
+
+    def _info(self, part):
+        return {'filename': part.get('filename'), 'content_type': part.get('content_type'),
+                'size': part['size'], 'sha256': part['a'], 'path': str(self.path(part['a']))}
+
+    def disk_size(self):
+        """Bytes the blobs take on disk"""
+        total = 0
+        for sha256 in self._blobs:
+            try:
+                total += self.path(sha256).stat().st_size
+            except OSError:
+                pass
+        return total
+
+    def summary(self):
+        """Verwerkte berichten en referenties; bytes zoals geïmporteerd tegenover echt op schijf"""
+        parts = [part for message_parts in self._messages.values() for part in message_parts]
+        entries = self.store.entries()
+        return {
+            'messages': len(self._messages),
+            'with_attachments': sum(1 for message_parts in self._messages.values() if message_parts),
+            'stubbed': sum(1 for entry in entries if entry.get('stubs')),
+            'references': len(parts),
+            'blobs': len(self._blobs),
+            'raw_bytes': sum(entry.get('size', 0) for entry in entries),
+            'message_bytes': self.store.disk_size(),
+            'blob_bytes': self.disk_size(),
+        }
+
+
+def attachment_store(store):
+    """Eén AttachmentStore per MailStore, zodat importers het manifest maar één keer laden"""
+    attachments = _stores.get(store)
+    if attachments is None:
+        attachments = _stores[store] = AttachmentStore(store)
+    return attachments
+
+
+def extract_all(store, prune_parts=False):
+    """
+    Pak de bijlagen uit van alle berichten die nog niet verwerkt zijn en haal
+    de base64 bodies uit berichten die eerder zonder stubs zijn uitgepakt.
+    Geeft (uitgepakt, gestript, fouten)
+    """
+    attachments = attachment_store(store)
+    extracted = stripped = failed = 0
+    for entry in store.entries():
+        digest = entry['h']
+        try:
+            if digest not in attachments:
+                attachments.extract(digest)
+                extracted += 1
+            elif attachments.strip(digest):
+                stripped += 1
+        except Exception as e:
+            print(f"  ✗ {digest[:12]}: {e}")
+            failed += 1
+            continue
+        parts_dir = store.path(digest, PARTS_SUFFIX)
+        if prune_parts and parts_dir.is_dir():
+            # Oude per-bericht spool directory (fetch-*-emails.py); de blobs vervangen die
+            shutil.rmtree(parts_dir, ignore_errors=True)
+    if store.packed:
+        # Gestripte berichten zijn opnieuw toegevoegd; de oude kopieën uit de segmenten halen
+        store.compact()
+    return extracted, stripped, failed
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Deduplicated attachments of a mail store")
+    parser.add_argument('root', help="mail store directory")
+    parser.add_argument('--extract', action='store_true', help="extract attachments of messages not yet processed")
+    parser.add_argument('--prune-parts', action='store_true', help="remove the old <digest>.parts directories")
+    parser.add_argument('--find', metavar='TERM', help="filename substring or hash prefix")
+    args = parser.parse_args()
+
+    store = MailStore(args.root)
+    attachments = attachment_store(store)
+
+    if args.extract:
+        print(f"Bijlagen uitpakken in {attachments.root}...")
+        extracted, stripped, failed = extract_all(store, args.prune_parts)
+        print(f"✓ {extracted} berichten verwerkt, {stripped} eerder verwerkte gestript, {failed} fouten")
+
+    if args.find:
+        for digest, part in attachments.find(args.find):
+            entry = store.get(digest) or {}
+            print(f"{part['a'][:12]}  {part['size']:>10}  {(part.get('filename') or '')[:40]:40s}  "
+                  f"{entry.get('date', '')[:10]}  {entry.get('subject', '')[:40]}")
+            print(f"              {attachments.path(part['a'])}")
+        return
+
+    summary = attachments.summary()
+    raw, messages, blobs = summary['raw_bytes'], summary['message_bytes'], summary['blob_bytes']
+    print(f"Attachments: {attachments.root}")
+    print(f"Messages processed: {summary['messages']} of {len(store)} ({summary['with_attachments']} with attachments, "
+          f"{summary['stubbed']} stored without their attachment bodies)")
+    print(f"References: {summary['references']} -> {summary['blobs']} unique blobs")
+    print(f"Size: {raw / 1024 / 1024:.1f} MB as imported, {(messages + blobs) / 1024 / 1024:.1f} MB on disk "
+          f"({messages / 1024 / 1024:.1f} MB messages + {blobs / 1024 / 1024:.1f} MB attachments, "
+          f"{(raw - messages - blobs) / 1024 / 1024:.1f} MB saved)")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,163 @@
+#!/usr/bin/env python3
+"""
+Mail Compress - per-message compression with a dictionary trained on the corpus
+
+Emails are small and alike (headers, signatures, quoted replies), so each
+message is compressed on its own - any single message decompresses without
+reading its neighbours - against a shared dictionary trained on a sample of
+the store. zstd (pip install zstandard) when available, otherwise zlib with a
+preset dictionary (stdlib). Dictionaries are files next to the pack segments
+and are never changed, so messages compressed with an older dictionary stay
+readable after retraining.
+
+Used by mail_store.py in packed mode; see `mail_store.py <root> --compress`.
+
+Usage:
+    python mail_compress.py <root> [--codec zstd|zlib] [--samples 2000] [--limit 5000]   # ratio per codec, read-only
+"""
+
+import argparse
+import random
+import threading
+import time
+import zlib
+from collections import Counter
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+CODECS = ('zstd', 'zlib')
+ZSTD_LEVEL = 9
+ZLIB_LEVEL = 9
+ZSTD_DICT_SIZE = 112 * 1024
+ZLIB_DICT_SIZE = 32 * 1024       # zlib kijkt maximaal 32 KB terug
+SAMPLE_COUNT = 2000
+MEASURE_COUNT = 5000
+SAMPLE_BYTES = 16 * 1024         # per bericht: het begin (headers en tekst) is wat berichten delen
+
+
+def default_codec():
+    return 'zstd' if zstandard is not None else 'zlib'
+
+
+def _train_zlib(samples, size):
+    """Preset dictionary: regels die in veel berichten terugkomen, de waardevolste achteraan"""
+    counts = Counter()
+    for sample in samples:
+        counts.update({line for line in sample.splitlines(keepends=True) if 8 <= len(line) <= 200})
+    scored = sorted(((count * len(line), line) for line, count in counts.items() if count > 1), reverse=True)
+    chosen = []
+    total = 0
+    for _, line in scored:
+        if total + len(line) > size:
+            continue
+        chosen.append(line)
+        total += len(line)
+    # zlib vindt dichtbije (late) dictionary bytes het goedkoopst
+    return b''.join(reversed(chosen))
+
+
+def train_dictionary(samples, codec):
+    """Dictionary bytes for codec, trained on raw message samples"""
+    samples = [sample[:SAMPLE_BYTES] for sample in samples if sample]
+    if codec == 'zstd':
+        if zstandard is None:
+            raise ImportError("zstd vereist het zstandard package", name='zstandard')
+        return zstandard.train_dictionary(ZSTD_DICT_SIZE, samples).as_bytes()
+    if codec == 'zlib':
+        return _train_zlib(samples, ZLIB_DICT_SIZE)
+    raise ValueError(f"Onbekende codec: {codec}")
+
+
+def sample_messages(items, count=SAMPLE_COUNT, seed=0):
+    """Reproduceerbare random steekproef (berichten of digests)"""
+    items = list(items)
+    return random.Random(seed).sample(items, count) if len(items) > count else items
+
+
+class Codec:
+    """Compress/decompress single messages with one dictionary; thread-safe"""
+
+    def __init__(self, name, dictionary=b''):
+        if name == 'zstd' and zstandard is None:
+            raise ImportError("zstd vereist het zstandard package", name='zstandard')
+        if name not in CODECS:
+            raise ValueError(f"Onbekende codec: {name}")
+        self.name = name
+        self.dictionary = dictionary
+        self._local = threading.local()
+        if name == 'zstd':
+            self._dict = zstandard.ZstdCompressionDict(dictionary) if dictionary else None
+
+    def _zstd(self):
+        # zstandard (de)compressors zijn niet thread-safe: één paar per thread
+        local = self._local
+        if not hasattr(local, 'compressor'):
+            local.compressor = zstandard.ZstdCompressor(level=ZSTD_LEVEL, dict_data=self._dict)
+            local.decompressor = zstandard.ZstdDecompressor(dict_data=self._dict)
+        return local.compressor, local.decompressor
+
+    def compress(self, raw):
+        if self.name == 'zstd':
+            return self._zstd()[0].compress(raw)
+        compressor = zlib.compressobj(ZLIB_LEVEL, zlib.DEFLATED, -15, zdict=self.dictionary) if self.dictionary \
+            else zlib.compressobj(ZLIB_LEVEL, zlib.DEFLATED, -15)
+        return compressor.compress(raw) + compressor.flush()
+
+    def decompress(self, data, size):
+        if self.name == 'zstd':
+            return self._zstd()[1].decompress(data, max_output_size=size)
+        decompressor = zlib.decompressobj(-15, zdict=self.dictionary) if self.dictionary else zlib.decompressobj(-15)
+        return decompressor.decompress(data) + decompressor.flush()
+
+
+def measure(codec, samples, messages):
+    """(ratio, compress MB/s, mean decompress µs) van een codec met getrainde dictionary"""
+    started = time.perf_counter()
+    dictionary = train_dictionary(samples, codec)
+    trained = time.perf_counter() - started
+    coder = Codec(codec, dictionary)
+    started = time.perf_counter()
+    compressed = [coder.compress(raw) for raw in messages]
+    compress_time = time.perf_counter() - started
+    started = time.perf_counter()
+    for raw, data in zip(messages, compressed):
+        coder.decompress(data, len(raw))
+    decompress_time = time.perf_counter() - started
+    raw_size = sum(len(raw) for raw in messages)
+    return {
+        'codec': codec,
+        'dictionary': len(dictionary),
+        'train_seconds': trained,
+        'ratio': raw_size / max(1, sum(len(data) for data in compressed)),
+        'compress_mb_s': raw_size / 1024 / 1024 / compress_time if compress_time else 0,
+        'decompress_us': decompress_time / max(1, len(messages)) * 1e6,
+    }
+
+
+def main():
+    from mail_store import MailStore
+
+    parser = argparse.ArgumentParser(description="Compression ratio of a mail store per codec (read-only)")
+    parser.add_argument('root', help="mail store directory")
+    parser.add_argument('--codec', choices=CODECS, action='append', help="default: every available codec")
+    parser.add_argument('--samples', type=int, default=SAMPLE_COUNT, help="messages used to train the dictionary")
+    parser.add_argument('--limit', type=int, default=MEASURE_COUNT, help="messages compressed for the measurement")
+    args = parser.parse_args()
+
+    store = MailStore(args.root)
+    digests = [entry['h'] for entry in store.entries() if store.exists(entry['h'])]
+    messages = [store.read(digest) for digest in sample_messages(digests, args.limit, seed=1)]
+    samples = sample_messages(messages, args.samples)
+    print(f"Store: {store.root} ({len(messages)} berichten, {sum(map(len, messages)) / 1024 / 1024:.1f} MB)")
+    for codec in args.codec or [c for c in CODECS if c != 'zstd' or zstandard is not None]:
+        r = measure(codec, samples, messages)
+        print(f"  {codec:5s} dict {r['dictionary'] / 1024:5.0f} KB  ratio {r['ratio']:5.2f}x  "
+              f"{r['compress_mb_s']:6.1f} MB/s  {r['decompress_us']:6.0f} µs/bericht")
+    store.close()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,168 @@
+#!/usr/bin/env python3
+"""
+Synthetic Mail Corpus - reproducible mbox for offline import tests and benchmarks
+
+Generates correspondence between the own accounts and the contacts the
+importers look for (Arjan Stroeve, Allan Drenth, Socranext, Social Media Hulp,
+gemeente Meppel) plus unrelated noise, with threads (In-Reply-To/References),
+optional attachments and a tunable body size. The same seed always gives the
+same mbox, so benchmark runs are comparable.
+
+Usage:
+    python mail_corpus.py corpus.mbox [--count 2000] [--body-size 4000]
+                          [--attachment-ratio 0.1] [--attachment-size 200000] [--seed 1]
+"""
+
+import argparse
+import mailbox
+import random
+from datetime import datetime, timedelta, timezone
+from email import policy
+from email.message import EmailMessage
+from email.utils import format_datetime
+
+OWN_ADDRESSES = ['info@martiendejong.nl', 'martiendejong2008@gmail.com']
+
+# Contacten waar de importers op zoeken
+CONTACTS = [
+    ('Arjan Stroeve', 'arjan@stroeve.nl'),
+    ('Allan Drenth', 'allan@drenth.nl'),
+    ('Rinus Huisman', 'rinus@socranext.nl'),
+    ('Social Media Hulp', 'info@socialmediahulp.nl'),
+    ('Gemeente Meppel', 'info@meppel.nl'),
+    ('Afdeling Vergunningen', 'vergunningen@meppel.nl'),
+]
+
+NOISE = [
+    ('Nieuwsbrief', 'nieuws@example.com'),
+    ('Webshop', 'orders@shop.example'),
+    ('Collega', 'jan@bedrijf.example'),
+    ('Leverancier', 'sales@leverancier.example'),
+]
+
+SUBJECTS = [
+    'Offerte website', 'Planning volgende week', 'Factuur {n}', 'Overleg social media',
+    'Vergunningaanvraag {n}', 'Eethuys de Steen', 'Cassandra project update',
+    'Vraag over contract', 'Notulen overleg', 'Bevestiging afspraak',
+]
+
+WORDS = ('de het een en van in is dat op te voor met zijn er niet aan ook als '
+         'project planning offerte website afspraak factuur overleg klant '
+         'voorstel bericht vraag antwoord week maand update document').split()
+
+# Aandeel mail met een gezochte contactpersoon (de rest is ruis)
+CONTACT_RATIO = 0.5
+THREAD_REPLY_RATIO = 0.3
+START_DATE = datetime(2022, 1, 1, 9, 0, tzinfo=timezone.utc)
+
+
+def _text(rng, size):
+    words = []
+    length = 0
+    while length < size:
+        word = rng.choice(WORDS)
+        words.append(word)
+        length += len(word) + 1
+    lines = [' '.join(words[i:i + 12]) for i in range(0, len(words), 12)]
+    return '\n'.join(lines) + '\n'
+
+
+def generate(count=2000, body_size=4000, attachment_ratio=0.1, attachment_size=200_000, seed=1):
+    """Yield (direction, EmailMessage) with direction 'in' or 'out', oldest first"""
+    rng = random.Random(seed)
+    sent = START_DATE
+    threads = []
+    for n in range(1, count + 1):
+        sent += timedelta(minutes=rng.randint(5, 600))
+        own = rng.choice(OWN_ADDRESSES)
+        name, address = rng.choice(CONTACTS) if rng.random() < CONTACT_RATIO else rng.choice(NOISE)
+        direction = 'out' if rng.random() < 0.35 else 'in'
+
+        msg = EmailMessage()
+        if direction == 'in':
+            msg['From'] = f"{name} <{address}>"
+            msg['To'] = own
+        else:
+            msg['From'] = f"Martien de Jong <{own}>"
+            msg['To'] = f"{name} <{address}>"
+        if rng.random() < 0.1:
+            msg['Cc'] = rng.choice(NOISE)[1]
+
+        message_id = f"<{n}.{seed}@corpus.local>"
+        reply_to = rng.choice(threads) if threads and rng.random() < THREAD_REPLY_RATIO else None
+        if reply_to:
+            subject, parent_id, references = reply_to
+            msg['Subject'] = f"Re: {subject}"
+            msg['In-Reply-To'] = parent_id
+            msg['References'] = ' '.join(references + [parent_id])
+            threads.append((subject, message_id, references + [parent_id]))
+        else:
+            subject = rng.choice(SUBJECTS).format(n=n)
+            msg['Subject'] = subject
+            threads.append((subject, message_id, []))
+        threads = threads[-200:]
+
+        msg['Date'] = format_datetime(sent)
+        msg['Message-ID'] = message_id
+        msg.set_content(f"Beste {name.split()[0]},\n\n{_text(rng, body_size)}\nGroet,\nMartien\n")
+
+        if rng.random() < attachment_ratio:
+            data = rng.randbytes(attachment_size)
+            msg.add_attachment(data, maintype='application', subtype='pdf', filename=f"document-{n}.pdf")
+        yield direction, msg
+
+
+def write_mbox(path, **options):
+    """Write a generated corpus to an mbox file; returns the message count"""
+    box = mailbox.mbox(path, create=True)
+    box.lock()
+    try:
+        box.clear()
+        count = 0
+        for direction, msg in generate(**options):
+            entry = mailbox.mboxMessage(msg)
+            entry.set_from(msg['From'].addresses[0].addr_spec)
+            # Richting bewaren voor de fake servers (INBOX vs Sent)
+            entry['X-Corpus-Direction'] = direction
+            box.add(entry)
+            count += 1
+        box.flush()
+    finally:
+        box.unlock()
+        box.close()
+    return count
+
+
+def load_mbox(path):
+    """[(direction, raw bytes with CRLF line endings)] from a corpus mbox"""
+    messages = []
+    box = mailbox.mbox(path, create=False)
+    try:
+        for entry in box:
+            direction = entry.get('X-Corpus-Direction', 'in')
+            del entry['X-Corpus-Direction']
+            raw = entry.as_bytes(policy=policy.SMTP)
+            messages.append((direction, raw))
+    finally:
+        box.close()
+    return messages
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Generate a synthetic mbox corpus")
+    parser.add_argument('path')
+    parser.add_argument('--count', type=int, default=2000)
+    parser.add_argument('--body-size', type=int, default=4000)
+    parser.add_argument('--attachment-ratio', type=float, default=0.1)
+    parser.add_argument('--attachment-size', type=int, default=200_000)
+    parser.add_argument('--seed', type=int, default=1)
+    args = parser.parse_args()
+
+    count = write_mbox(args.path, count=args.count, body_size=args.body_size,
+                       attachment_ratio=args.attachment_ratio,
+                       attachment_size=args.attachment_size, seed=args.seed)
+    print(f"✓ {count} emails geschreven naar {args.path}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,425 @@
+#!/usr/bin/env python3
+"""
+Mail Index - SQLite FTS5 index over imported correspondence
+
+Streams every stored message (mail store objects, loose .eml files and the
+.txt/.json output of older imports) into one SQLite database with an FTS5
+table over subject, participants and body, plus date and participant indexes.
+Updates are incremental: unchanged files (same mtime/size, or same content
+hash for mail store objects) are skipped.
+
+Usage:
+    python mail_index.py build [dir ...]                 # (re)index directories
+    python mail_index.py search "bestemmingsplan" [--from meppel.nl] [--since 2024-01-01]
+    python mail_index.py timeline meppel.nl [--since 2024-01-01] [--until 2024-12-31]
+    python mail_index.py show <id>
+"""
+
+import argparse
+import json
+import os
+import re
+import sqlite3
+import sys
+import time
+from datetime import timezone
+from email.utils import getaddresses, parsedate_to_datetime
+from pathlib import Path
+
+from mail_attachments import ATTACHMENTS_DIR
+from mail_parse import parse_file
+from mail_store import MANIFEST_NAME, OBJECTS_DIR, PACKS_DIR, PARTS_SUFFIX, MailStore
+
+DEFAULT_DB = r"C:\scripts\correspondence\mail_index.sqlite"
+DEFAULT_SOURCES = [
+    r"C:\scripts\correspondence\gemeente-meppel",
+    r"C:\arjan_emails",
+    r"C:\scripts\arjan_emails",
+]
+
+COMMIT_EVERY = 500
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS messages (
+    id INTEGER PRIMARY KEY,
+    path TEXT UNIQUE NOT NULL,
+    digest TEXT,
+    mtime REAL,
+    size INTEGER,
+    message_id TEXT,
+    subject TEXT,
+    sender TEXT,
+    recipients TEXT,
+    date TEXT,
+    folder TEXT
+);
+CREATE INDEX IF NOT EXISTS idx_messages_date ON messages(date);
+CREATE INDEX IF NOT EXISTS idx_messages_message_id ON messages(message_id);
+
+CREATE TABLE IF NOT EXISTS participants (
+    message INTEGER NOT NULL REFERENCES messages(id) ON DELETE CASCADE,
+    address TEXT NOT NULL,
+    name TEXT,
+    role TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_participants_address ON participants(address);
+CREATE INDEX IF NOT EXISTS idx_participants_message ON participants(message);
+
+CREATE VIRTUAL TABLE IF NOT EXISTS messages_fts USING fts5(
+    subject, participants, body, tokenize='unicode61 remove_diacritics 2'
+);
+"""
+
+ADDRESS_ROLES = (('From', 'from'), ('To', 'to'), ('Cc', 'cc'), ('Bcc', 'bcc'))
+
+# Kopregels van de .txt output van fetch-*-emails.py
+TXT_HEADER_RE = re.compile(r'^(Date|From|To|Cc|Subject): ?(.*)$')
+TXT_BODY_MARKER = '--- BODY ---'
+
+TAG_RE = re.compile(r'<[^>]+>')
+
+
+def normalize_date(value):
+    """Date header -> 'YYYY-MM-DD HH:MM:SS' in UTC (sortable), or None"""
+    if not value:
+        return None
+    try:
+        parsed = parsedate_to_datetime(value)
+    except (TypeError, ValueError):
+        # Al geformatteerde datum (bv. uit .txt of manifest)
+        match = re.match(r'(\d{4}-\d{2}-\d{2})[ T]?(\d{2}:\d{2}:\d{2})?', value)
+        if not match:
+            return None
+        return f"{match.group(1)} {match.group(2) or '00:00:00'}"
+    if parsed.tzinfo is not None:
+        parsed = parsed.astimezone(timezone.utc)
+    return parsed.strftime('%Y-%m-%d %H:%M:%S')
+
+
+def parse_eml(path):
+    """.eml file (path or binary file) -> index record (streamed; attachments are skipped undecoded)"""
+    parsed = parse_file(path)
+    msg = parsed.headers
+    participants = []
+    for header, role in ADDRESS_ROLES:
+        try:
+            values = msg.get_all(header, [])
+        except Exception:
+            values = []
+        for name, address in getaddresses([str(v) for v in values]):
+            if address:
+                participants.append((address.lower(), name, role))
+
+    def header(name):
+        try:
+            return str(msg.get(name, '') or '').strip()
+        except Exception:
+            return ''
+
+    return {
+        'message_id': header('Message-ID') or None,
+        'subject': header('Subject'),
+        'sender': header('From'),
+        'recipients': ', '.join(filter(None, [header('To'), header('Cc')])),
+        'date': normalize_date(header('Date')),
+        'participants': participants,
+        'body': parsed.text if parsed.text is not None else TAG_RE.sub(' ', parsed.html or ''),
+    }
+
+
+def parse_txt(text):
+    """fetch-*-emails.py text export -> index record"""
+    head, _, body = text.partition(TXT_BODY_MARKER)
+    fields = {}
+    for line in head.splitlines():
+        match = TXT_HEADER_RE.match(line)
+        if match:
+            fields[match.group(1)] = match.group(2).strip()
+
+    participants = []
+    for header, role in ADDRESS_ROLES:
+        for name, address in getaddresses([fields.get(header, '')]):
+            if address:
+                participants.append((address.lower(), name, role))
+
+    return {
+        'message_id': None,
+        'subject': fields.get('Subject', ''),
+        'sender': fields.get('From', ''),
+        'recipients': ', '.join(filter(None, [fields.get('To'), fields.get('Cc')])),
+        'date': normalize_date(fields.get('Date')),
+        'participants': participants,
+        'body': body.strip(),
+    }
+
+
+def parse_json(data):
+    """Legacy Gmail .json metadata (without matching .eml) -> index record"""
+    meta = json.loads(data)
+    participants = []
+    for key, role in (('from', 'from'), ('to', 'to')):
+        for name, address in getaddresses([meta.get(key, '')]):
+            if address:
+                participants.append((address.lower(), name, role))
+    return {
+        'message_id': None,
+        'subject': meta.get('subject', ''),
+        'sender': meta.get('from', ''),
+        'recipients': meta.get('to', ''),
+        'date': normalize_date(meta.get('date')),
+        'participants': participants,
+        'body': '',
+    }
+
+
+def iter_source_files(root):
+    """
+    Yield (path, kind, digest, store) for every indexable file below root.
+    Packed mail stores are found while walking (manifest + packs directory,
+    also below root); their messages come as kind 'packed' with the open
+    MailStore to read them from, path = segment@offset.
+    """
+    root = Path(root)
+    for dirpath, dirnames, filenames in os.walk(root):
+        dirnames[:] = [d for d in dirnames
+                       if not d.startswith('.') and not d.endswith(PARTS_SUFFIX) and d != ATTACHMENTS_DIR]
+        if MANIFEST_NAME in filenames and PACKS_DIR in dirnames:
+            dirnames.remove(PACKS_DIR)
+            yield from _packed_entries(Path(dirpath))
+        in_store = OBJECTS_DIR in Path(dirpath).relative_to(root).parts
+        names = set(filenames)
+        for filename in filenames:
+            if filename.startswith('.') or filename == MANIFEST_NAME:
+                continue
+            stem, ext = os.path.splitext(filename)
+            ext = ext.lower()
+            path = os.path.join(dirpath, filename)
+            if ext == '.eml':
+                yield path, 'eml', stem if in_store else None, None
+            elif ext == '.txt' and f"{stem}.eml" not in names:
+                # Sidecars naast een .eml zijn afgeleid; alleen losse .txt exports
+                yield path, 'txt', None, None
+            elif ext == '.json' and f"{stem}.eml" not in names:
+                yield path, 'json', None, None
+
+
+def _packed_entries(store_root):
+    """Berichten in de segmenten van een packed mail store; het manifest zegt waar"""
+    store = MailStore(store_root)
+    try:
+        for entry in store.entries():
+            if entry.get('pack'):
+                yield str(store_root / store.location(entry['h'])), 'packed', entry['h'], store
+    finally:
+        store.close()
+
+
+class MailIndex:
+    """SQLite FTS5 index with incremental updates"""
+
+    def __init__(self, db_path=DEFAULT_DB):
+        Path(db_path).parent.mkdir(parents=True, exist_ok=True)
+        self.db = sqlite3.connect(str(db_path))
+        self.db.row_factory = sqlite3.Row
+        self.db.execute('PRAGMA journal_mode=WAL')
+        self.db.execute('PRAGMA synchronous=NORMAL')
+        self.db.execute('PRAGMA foreign_keys=ON')
+        self.db.executescript(SCHEMA)
+
+    def close(self):
+        self.db.close()
+
+    def _known(self):
+        return {row['path']: (row['id'], row['digest'], row['mtime'], row['size'])
+                for row in self.db.execute('SELECT id, path, digest, mtime, size FROM messages')}
+
+    def _remove(self, message_id):
+        self.db.execute('DELETE FROM messages_fts WHERE rowid = ?', (message_id,))
+        self.db.execute('DELETE FROM messages WHERE id = ?', (message_id,))
+
+    def _insert(self, path, digest, stat, folder, record):
+        cursor = self.db.execute(
+            'INSERT INTO messages (path, digest, mtime, size, message_id, subject, sender,'
+            ' recipients, date, folder) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)',
+            (path, digest, stat.st_mtime, stat.st_size, record['message_id'], record['subject'],
+             record['sender'], record['recipients'], record['date'], folder))
+        row_id = cursor.lastrowid
+        self.db.executemany(
+            'INSERT INTO participants (message, address, name, role) VALUES (?, ?, ?, ?)',
+            [(row_id, address, name, role) for address, name, role in record['participants']])
+        participants_text = ' '.join(f"{name} {address}" for address, name, _ in record['participants'])
+        self.db.execute(
+            'INSERT INTO messages_fts (rowid, subject, participants, body) VALUES (?, ?, ?, ?)',
+            (row_id, record['subject'], participants_text, record['body']))
+
+    def update(self, roots, prune=True):
+        """Index new/changed files under roots. Returns (added, updated, removed, unchanged)"""
+        known = self._known()
+        seen = set()
+        added = updated = unchanged = 0
+        pending = 0
+
+        for root in roots:
+            if not Path(root).exists():
+                print(f"  ⚠ Bron bestaat niet: {root}")
+                continue
+            folder = Path(root).name
+            for path, kind, digest, store in iter_source_files(root):
+                seen.add(path)
+                stat = os.stat(path.rpartition('@')[0] if kind == 'packed' else path)
+                existing = known.get(path)
+                if existing:
+                    _, old_digest, old_mtime, old_size = existing
+                    # Content-addressed objecten veranderen nooit
+                    if digest and old_digest == digest:
+                        unchanged += 1
+                        continue
+                    if not digest and old_mtime == stat.st_mtime and old_size == stat.st_size:
+                        unchanged += 1
+                        continue
+
+                try:
+                    if kind == 'eml':
+                        record = parse_eml(path)
+                    elif kind == 'packed':
+                        record = parse_eml(store.open(digest))
+                    elif kind == 'txt':
+                        record = parse_txt(Path(path).read_text(encoding='utf-8', errors='replace'))
+                    else:
+                        record = parse_json(Path(path).read_text(encoding='utf-8'))
+                except Exception as e:
+                    print(f"  ✗ Overgeslagen {path}: {e}")
+                    continue
+
+                if existing:
+                    self._remove(existing[0])
+                    updated += 1
+                else:
+                    added += 1
+                self._insert(path, digest, stat, folder, record)
+
+                pending += 1
+                if pending >= COMMIT_EVERY:
+                    self.db.commit()
+                    pending = 0
+
+        removed = 0
+        if prune:
+            for path, (row_id, *_rest) in known.items():
+                # Per pad-component: .../gemeente is geen prefix van .../gemeente-meppel
+                if path not in seen and any(Path(path).is_relative_to(r) for r in roots):
+                    self._remove(row_id)
+                    removed += 1
+
+        self.db.commit()
+        return added, updated, removed, unchanged
+
+    def search(self, query, participant=None, since=None, until=None, limit=50):
+        """Full-text search, newest first"""
+        sql = ['SELECT m.id, m.date, m.sender, m.subject, m.path,'
+               " snippet(messages_fts, 2, '[', ']', '…', 12) AS snippet"
+               ' FROM messages_fts JOIN messages m ON m.id = messages_fts.rowid'
+               ' WHERE messages_fts MATCH ?']
+        params = [query]
+        self._filters(sql, params, participant, since, until)
+        sql.append('ORDER BY m.date DESC LIMIT ?')
+        params.append(limit)
+        return self.db.execute(' '.join(sql), params).fetchall()
+
+    def timeline(self, participant=None, since=None, until=None, limit=None):
+        """Messages in chronological order, served from the date/participant indexes"""
+        sql = ['SELECT m.id, m.date, m.sender, m.recipients, m.subject, m.path FROM messages m WHERE 1=1']
+        params = []
+        self._filters(sql, params, participant, since, until)
+        sql.append('ORDER BY m.date')
+        if limit:
+            sql.append('LIMIT ?')
+            params.append(limit)
+        return self.db.execute(' '.join(sql), params).fetchall()
+
+    def get(self, message_id):
+        row = self.db.execute('SELECT * FROM messages WHERE id = ?', (message_id,)).fetchone()
+        if not row:
+            return None, None
+        body = self.db.execute('SELECT body FROM messages_fts WHERE rowid = ?', (message_id,)).fetchone()
+        return row, body['body'] if body else ''
+
+    @staticmethod
+    def _filters(sql, params, participant, since, until):
+        if participant:
+            # Volledig adres of domein/deel daarvan (bv. 'meppel.nl')
+            sql.append('AND m.id IN (SELECT message FROM participants WHERE address = ? OR address LIKE ?)')
+            params.extend([participant.lower(), f"%{participant.lower()}"])
+        if since:
+            sql.append('AND m.date >= ?')
+            params.append(since)
+        if until:
+            sql.append('AND m.date <= ?')
+            params.append(f"{until} 23:59:59" if len(until) == 10 else until)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='SQLite FTS index over imported correspondence')
+    parser.add_argument('--db', default=DEFAULT_DB, help=f'index database (default: {DEFAULT_DB})')
+    sub = parser.add_subparsers(dest='command', required=True)
+
+    build = sub.add_parser('build', help='index new/changed messages')
+    build.add_argument('sources', nargs='*', default=DEFAULT_SOURCES)
+    build.add_argument('--no-prune', action='store_true', help='keep rows for deleted files')
+
+    search = sub.add_parser('search', help='full-text search (FTS5 query syntax)')
+    search.add_argument('query')
+    search.add_argument('--from', dest='participant', help='address or domain of a participant')
+    search.add_argument('--since')
+    search.add_argument('--until')
+    search.add_argument('--limit', type=int, default=50)
+
+    timeline = sub.add_parser('timeline', help='chronological list for a participant')
+    timeline.add_argument('participant', nargs='?')
+    timeline.add_argument('--since')
+    timeline.add_argument('--until')
+    timeline.add_argument('--limit', type=int)
+
+    show = sub.add_parser('show', help='print one indexed message')
+    show.add_argument('id', type=int)
+
+    args = parser.parse_args()
+    index = MailIndex(args.db)
+    started = time.perf_counter()
+
+    if args.command == 'build':
+        print(f"Indexeren naar {args.db}...")
+        added, updated, removed, unchanged = index.update(args.sources, prune=not args.no_prune)
+        print(f"✓ {added} nieuw, {updated} bijgewerkt, {removed} verwijderd, {unchanged} ongewijzigd")
+
+    elif args.command == 'search':
+        rows = index.search(args.query, args.participant, args.since, args.until, args.limit)
+        for row in rows:
+            print(f"[{row['id']}] {row['date'] or '?':19s}  {row['sender'][:35]:35s}  {row['subject'][:60]}")
+            print(f"      {row['snippet']}")
+        print(f"\n{len(rows)} resultaten")
+
+    elif args.command == 'timeline':
+        rows = index.timeline(args.participant, args.since, args.until, args.limit)
+        for row in rows:
+            print(f"[{row['id']}] {row['date'] or '?':19s}  {row['sender'][:35]:35s}  {row['subject'][:60]}")
+        print(f"\n{len(rows)} emails")
+
+    elif args.command == 'show':
+        row, body = index.get(args.id)
+        if not row:
+            print(f"Niet gevonden: {args.id}")
+            sys.exit(1)
+        print(f"Date: {row['date']}")
+        print(f"From: {row['sender']}")
+        print(f"To: {row['recipients']}")
+        print(f"Subject: {row['subject']}")
+        print(f"Path: {row['path']}")
+        print(f"\n{body}")
+
+    index.close()
+    print(f"({(time.perf_counter() - started) * 1000:.0f} ms)", file=sys.stderr)
+
+
+if __name__ == '__main__':
+    main()
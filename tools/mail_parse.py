@@ -0,0 +1,340 @@
+#!/usr/bin/env python3
+"""
+Streaming MIME parser - text body and attachments without loading the message
+
+email.message_from_bytes() keeps the whole message plus every decoded part in
+memory. This parser reads the message line by line instead: each header block
+goes through email.parser.BytesFeedParser (policy.default, header values are
+decoded lazily on access), text parts are decoded into the body, and every
+other part is either decoded straight into a spool file or skipped without
+decoding at all. Memory use stays flat regardless of attachment size.
+
+Usage:
+    python mail_parse.py message.eml [spool_dir]
+"""
+
+import binascii
+import hashlib
+import io
+import os
+import re
+import sys
+from email import policy
+from email.parser import BytesFeedParser
+
+READ_LIMIT = 64 * 1024          # max bytes per readline (lange 8bit regels)
+MAX_TEXT_BYTES = 5 * 1024 * 1024  # body tekst wordt hierna afgekapt
+
+SAFE_NAME_RE = re.compile(r'[^\w.\- ]+')
+
+
+class ParsedMail:
+    """Result of parse_file/parse_bytes"""
+
+    def __init__(self, headers):
+        self.headers = headers
+        self.text = None
+        self.html = None
+        self.attachments = []
+
+    @property
+    def body(self):
+        """text/plain when present, otherwise the HTML part (like extract_email_body)"""
+        return self.text if self.text is not None else (self.html or '')
+
+
+class _Lines:
+    """readline() wrapper that knows whether a chunk starts at a line start"""
+
+    def __init__(self, fp):
+        self.fp = fp
+        self.at_line_start = True
+        self.position = 0   # bytes gelezen tot en met de laatst teruggegeven regel
+        self._pushed = None
+
+    def next(self):
+        if self._pushed is not None:
+            item, self._pushed = self._pushed, None
+            self.position += len(item[0])
+            return item
+        line = self.fp.readline(READ_LIMIT)
+        if not line:
+            return None
+        starts_line = self.at_line_start
+        self.at_line_start = line.endswith(b'\n')
+        self.position += len(line)
+        return line, starts_line
+
+    def push(self, item):
+        self._pushed = item
+        self.position -= len(item[0])
+
+
+class _Base64Decoder:
+    def __init__(self):
+        self._rest = b''
+
+    def feed(self, data):
+        data = self._rest + b''.join(data.split())
+        usable = len(data) - len(data) % 4
+        self._rest = data[usable:]
+        try:
+            return binascii.a2b_base64(data[:usable]) if usable else b''
+        except binascii.Error:
+            return b''
+
+    def flush(self):
+        rest, self._rest = self._rest, b''
+        if not rest:
+            return b''
+        try:
+            return binascii.a2b_base64(rest + b'=' * (-len(rest) % 4))
+        except binascii.Error:
+            return b''
+
+
+class _QuotedPrintableDecoder:
+    def feed(self, data):
+        return binascii.a2b_qp(data)
+
+    def flush(self):
+        return b''
+
+
+class _IdentityDecoder:
+    def feed(self, data):
+        return data
+
+    def flush(self):
+        return b''
+
+
+def _transfer_encoding(headers):
+    return str(headers.get('Content-Transfer-Encoding', '')).strip().lower()
+
+
+def _decoder(headers):
+    encoding = _transfer_encoding(headers)
+    if encoding == 'base64':
+        return _Base64Decoder()
+    if encoding == 'quoted-printable':
+        return _QuotedPrintableDecoder()
+    return _IdentityDecoder()
+
+
+class _TextSink:
+    def __init__(self, headers):
+        self.decoder = _decoder(headers)
+        self.charset = headers.get_content_charset() or 'utf-8'
+        self.buffer = io.BytesIO()
+
+    def write(self, data):
+        if self.buffer.tell() < MAX_TEXT_BYTES:
+            self.buffer.write(self.decoder.feed(data))
+
+    def close(self):
+        self.buffer.write(self.decoder.flush())
+        try:
+            return self.buffer.getvalue().decode(self.charset, errors='replace')
+        except LookupError:
+            return self.buffer.getvalue().decode('utf-8', errors='replace')
+
+
+class _SpoolSink:
+    """Decodes a part straight into a file, hashing while it writes"""
+
+    def __init__(self, headers, spool_dir, index):
+        self.decoder = _decoder(headers)
+        self.sha256 = hashlib.sha256()
+        self.size = 0
+        filename = headers.get_filename() or f"part-{index}{_extension(headers)}"
+        self.info = {
+            'filename': filename,
+            'content_type': headers.get_content_type(),
+            'encoding': _transfer_encoding(headers),
+        }
+        os.makedirs(spool_dir, exist_ok=True)
+        safe = SAFE_NAME_RE.sub('_', filename).strip() or f"part-{index}"
+        self.path = os.path.join(spool_dir, f"{index:02d}_{safe}")
+        self.file = open(self.path, 'wb')
+
+    def _out(self, data):
+        if data:
+            self.file.write(data)
+            self.sha256.update(data)
+            self.size += len(data)
+
+    def write(self, data):
+        self._out(self.decoder.feed(data))
+
+    def close(self):
+        self._out(self.decoder.flush())
+        self.file.close()
+        self.info.update({'path': self.path, 'size': self.size, 'sha256': self.sha256.hexdigest()})
+        return self.info
+
+
+class _SkipSink:
+    """Binary part that is not wanted: no decoding, only the encoded size"""
+
+    def __init__(self, headers):
+        self.info = {
+            'filename': headers.get_filename(),
+            'content_type': headers.get_content_type(),
+            'encoding': _transfer_encoding(headers),
+            'encoded_size': 0,
+        }
+
+    def write(self, data):
+        self.info['encoded_size'] += len(data)
+
+    def close(self):
+        return self.info
+
+
+def _extension(headers):
+    subtype = headers.get_content_subtype()
+    return f".{subtype}" if subtype and len(subtype) <= 5 else '.bin'
+
+
+def _read_headers(lines):
+    parser = BytesFeedParser(policy=policy.default)
+    while True:
+        item = lines.next()
+        if item is None:
+            break
+        line, _ = item
+        parser.feed(line)
+        if line in (b'\r\n', b'\n'):
+            break
+    return parser.close()
+
+
+def _boundary_match(line, starts_line, boundaries):
+    """(boundary, is_close) when line is a delimiter for one of the open boundaries"""
+    if not starts_line or not line.startswith(b'--'):
+        return None
+    stripped = line.rstrip(b' \t\r\n')
+    for boundary in reversed(boundaries):
+        if stripped == b'--' + boundary:
+            return boundary, False
+        if stripped == b'--' + boundary + b'--':
+            return boundary, True
+    return None
+
+
+class _Parser:
+    def __init__(self, fp, spool_dir):
+        self.lines = _Lines(fp)
+        self.spool_dir = spool_dir
+        self.result = None
+        self.part_index = 0
+
+    def parse(self):
+        headers = _read_headers(self.lines)
+        self.result = ParsedMail(headers)
+        self._part(headers, [])
+        return self.result
+
+    def _sink(self, headers):
+        self.part_index += 1
+        disposition = headers.get_content_disposition()
+        content_type = headers.get_content_type()
+        if disposition != 'attachment' and content_type in ('text/plain', 'text/html'):
+            if content_type == 'text/plain' and self.result.text is None:
+                return _TextSink(headers), 'text'
+            if content_type == 'text/html' and self.result.html is None:
+                return _TextSink(headers), 'html'
+        if self.spool_dir:
+            return _SpoolSink(headers, self.spool_dir, self.part_index), 'attachment'
+        return _SkipSink(headers), 'attachment'
+
+    def _part(self, headers, boundaries):
+        """Consume one part; returns the delimiter that ended it (or None at EOF)"""
+        if headers.get_content_maintype() == 'multipart' and headers.get_boundary():
+            boundary = headers.get_boundary().encode('ascii', errors='replace')
+            inner = boundaries + [boundary]
+            # Preamble overslaan tot de eerste delimiter
+            delimiter = self._skip(inner)
+            while delimiter and delimiter[0] == boundary and not delimiter[1]:
+                delimiter = self._part(_read_headers(self.lines), inner)
+            if delimiter and delimiter[0] == boundary:
+                # Epilogue overslaan tot de delimiter van de ouder
+                return self._skip(boundaries)
+            return delimiter
+
+        sink, kind = self._sink(headers)
+        start = end = self.lines.position
+        previous = None
+        delimiter = None
+        while True:
+            item = self.lines.next()
+            if item is None:
+                end = self.lines.position
+                break
+            line, starts_line = item
+            delimiter = _boundary_match(line, starts_line, boundaries)
+            if delimiter:
+                end = self.lines.position - len(line)
+                break
+            if previous is not None:
+                sink.write(previous)
+            previous = line
+        if previous is not None:
+            # De regelovergang voor een delimiter hoort bij de delimiter
+            sink.write(previous.rstrip(b'\r\n') if delimiter else previous)
+
+        value = sink.close()
+        if kind == 'text':
+            self.result.text = value
+        elif kind == 'html':
+            self.result.html = value
+        else:
+            # Gecodeerde body in het bronbericht, inclusief de regelovergang voor de delimiter
+            value['span'] = (start, end)
+            self.result.attachments.append(value)
+        return delimiter
+
+    def _skip(self, boundaries):
+        while True:
+            item = self.lines.next()
+            if item is None:
+                return None
+            delimiter = _boundary_match(item[0], item[1], boundaries)
+            if delimiter:
+                return delimiter
+
+
+def parse_file(path, spool_dir=None):
+    """
+    Stream-parse a stored .eml (path or open binary file). Attachments are
+    decoded into spool_dir when given, otherwise skipped without decoding.
+    Every attachment carries 'span': (start, end) of its encoded body in the
+    message bytes.
+    """
+    if hasattr(path, 'readline'):
+        return _Parser(path, spool_dir).parse()
+    with open(path, 'rb') as fp:
+        return _Parser(fp, spool_dir).parse()
+
+
+def parse_bytes(raw, spool_dir=None):
+    """Same as parse_file for a message that is already in memory (no extra copies)"""
+    return _Parser(io.BytesIO(raw), spool_dir).parse()
+
+
+def main():
+    if len(sys.argv) < 2:
+        print(__doc__)
+        return
+    parsed = parse_file(sys.argv[1], sys.argv[2] if len(sys.argv) > 2 else None)
+    print(f"Subject: {parsed.headers.get('Subject', '')}")
+    print(f"From: {parsed.headers.get('From', '')}")
+    print(f"Body: {len(parsed.body)} chars")
+    for attachment in parsed.attachments:
+        size = attachment.get('size', attachment.get('encoded_size'))
+        print(f"  {attachment['content_type']:30s} {size:>10}  {attachment.get('filename') or ''}")
+
+
+if __name__ == '__main__':
+    main()
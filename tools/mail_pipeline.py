@@ -0,0 +1,405 @@
+#!/usr/bin/env python3
+"""
+Mail Pipeline - staged streaming import: list -> fetch -> parse -> write
+
+The importers used to search, download, parse and store in one loop, so the
+network sat idle while the disk wrote and the other way round. Here every
+stage runs in its own threads and the stages are connected by bounded queues:
+
+    list   (searches)      search a folder / list the ids of a query -> fetch tasks
+    fetch  (tasks)         download over one IMAP connection / HTTP client per thread
+    parse  (raw messages)  decode, SHA-256, header summary, compression (MailStore.prepare),
+                           MIME parse with attachments decoded into a spool (AttachmentStore.spool)
+    write  (one thread)    spooled attachments into blobs, MailStore.put without their base64
+                           bodies (AttachmentStore.stub), thread graph, source.stored()
+
+A full queue blocks the stage in front of it (backpressure): whatever the
+speed of the network or the disk, at most queue_size items wait per queue,
+so memory stays bounded while all stages run at the same time.
+
+Every importer defines a Source (see Source below) and runs it with
+run_pipeline(); this CLI runs any of them by name:
+
+    gmail      gmail-import.py            contact groups in Gmail (API)
+    arjan      import-arjan-emails.py     both mailboxes over IMAP
+    arjan-v2   import-arjan-emails-v2.py  contact groups per account (API)
+    inbox      fetch-inbox-emails.py      INBOX from meppel.nl (IMAP)
+    sent       fetch-sent-emails.py       Sent to meppel.nl (IMAP)
+
+Usage:
+    python mail_pipeline.py <source> [--out DIR] [--list-workers 2] [--fetch-workers 8]
+                            [--parse-workers 2] [--queue-size 100]
+"""
+
+import argparse
+import importlib.util
+import queue
+import sys
+import threading
+import time
+from pathlib import Path
+
+from mail_attachments import attachment_store
+from mail_store import MailStore
+from mail_threads import thread_index
+
+TOOLS_DIR = Path(__file__).resolve().parent
+
+STAGES = ('list', 'fetch', 'parse', 'write')
+STAGE_WORKERS = {'list': 1, 'fetch': 8, 'parse': 2, 'write': 1}
+QUEUE_SIZE = 100     # items per queue tussen twee stages
+POLL_INTERVAL = 0.1  # seconden; zo snel reageren threads op stop/Ctrl+C
+
+SOURCES = {
+    'gmail': 'gmail-import.py',
+    'arjan': 'import-arjan-emails.py',
+    'arjan-v2': 'import-arjan-emails-v2.py',
+    'inbox': 'fetch-inbox-emails.py',
+    'sent': 'fetch-sent-emails.py',
+}
+
+_DONE = object()
+
+
+class _Stopped(Exception):
+    """Stage thread stops early (stop() of abort())"""
+
+
+class Message:
+    """One message on its way from fetch to write"""
+
+    def __init__(self, raw, key=None, ref=None, label=None, **meta):
+        self.raw = raw          # wat fetch leverde; na parse de raw RFC822 bytes
+        self.key = key          # id binnen de bron (UID, Gmail id, journal key)
+        self.ref = ref
+        self.label = label
+        self.meta = meta        # extra manifest velden (account, folder, ...)
+        self.prepared = None    # MailStore.prepare(raw), in de parse stage
+        self.digest = None
+        self.created = False
+        self.parsed = None      # ParsedMail met de bijlagen (alleen nieuwe berichten)
+        self.spool = None       # spool directory van de parse stage, tot write hem opruimt
+
+
+class Source:
+    """
+    An import source for the pipeline; subclasses override what applies.
+
+    searches()       list stage input: one item per folder, contact group, ...
+    list(search)     yields fetch tasks; may tag what the store already holds
+    fetch(task)      yields Messages; runs in several threads (own connection each)
+    decode(message)  raw RFC822 bytes from what fetch delivered (parse stage)
+    stored(message)  after MailStore.put, in the writer thread (journal, sidecar)
+    fatal(error)     True: stop listing and fetching, e.g. when the quota is exhausted
+    close(complete)  after the run; complete when nothing failed or was stopped
+    """
+
+    name = 'source'
+    root = None     # standaard mail store van deze bron
+    workers = {}    # stage -> threads, zet open() bv. op het aantal verbindingen
+
+    def open(self, store):
+        self.store = store
+
+    def searches(self):
+        return [None]
+
+    def list(self, search):
+        return []
+
+    def fetch(self, task):
+        return []
+
+    def decode(self, message):
+        return message.raw
+
+    def stored(self, message):
+        pass
+
+    def fatal(self, error):
+        return False
+
+    def close(self, complete):
+        pass
+
+
+def describe(item):
+    """Korte omschrijving van een taak of bericht voor foutmeldingen"""
+    if isinstance(item, Message):
+        return str(item.key or item.ref or '?')
+    if isinstance(item, tuple):
+        return '/'.join(str(part) for part in item if isinstance(part, (str, int)))
+    return str(item)
+
+
+class Pipeline:
+    """Four stages with their own threads, connected by bounded queues"""
+
+    def __init__(self, source, store, workers=None, queue_size=QUEUE_SIZE, extract=True):
+        self.source = source
+        self.store = store
+        self.extract = extract
+        # Aanmaken vóór de threads starten: parse en write gebruiken dezelfde instanties
+        self.attachments = attachment_store(store) if extract else None
+        self.threads = thread_index(store) if extract else None
+        self.workers = {**STAGE_WORKERS, **source.workers, **(workers or {})}
+        self.workers['write'] = 1  # MailStore, bijlagen en thread graph: één schrijver
+        # De zoektaken staan er vooraf in; daarna begrensd
+        self.queues = {'list': queue.Queue()}
+        for stage in STAGES[1:]:
+            self.queues[stage] = queue.Queue(maxsize=queue_size)
+        self.handlers = {'list': source.list, 'fetch': source.fetch, 'parse': self._parse, 'write': self._write}
+
+        self.stopping = threading.Event()  # list + fetch stoppen, parse + write maken af
+        self.aborted = threading.Event()   # alles stopt (Ctrl+C)
+        self.lock = threading.Lock()
+        self.running = {}
+        self.stats = {stage: {'items': 0, 'errors': 0, 'idle': 0.0, 'blocked': 0.0, 'peak': 0} for stage in STAGES}
+        self.counts = {'new': 0, 'existing': 0}
+
+    def _halted(self, stage):
+        return self.aborted.is_set() or (self.stopping.is_set() and stage in ('list', 'fetch'))
+
+    def _add(self, stage, key, value=1):
+        with self.lock:
+            self.stats[stage][key] += value
+
+    def _get(self, stage):
+        inbox = self.queues[stage]
+        started = time.perf_counter()
+        try:
+            while True:
+                if self._halted(stage):
+                    raise _Stopped
+                try:
+                    return inbox.get(timeout=POLL_INTERVAL)
+                except queue.Empty:
+                    continue
+        finally:
+            self._add(stage, 'idle', time.perf_counter() - started)
+
+    def _put(self, stage, item):
+        """Item naar de volgende stage; blokkeert zolang die queue vol is (backpressure)"""
+        target = STAGES[STAGES.index(stage) + 1]
+        outbox = self.queues[target]
+        started = time.perf_counter()
+        try:
+            while True:
+                # Het einde-teken gaat ook na stop() nog door: parse en write maken af
+                if self.aborted.is_set() or (item is not _DONE and self._halted(stage)):
+                    raise _Stopped
+                try:
+                    outbox.put(item, timeout=POLL_INTERVAL)
+                    break
+                except queue.Full:
+                    continue
+        finally:
+            self._add(stage, 'blocked', time.perf_counter() - started)
+        with self.lock:
+            self.stats[target]['peak'] = max(self.stats[target]['peak'], outbox.qsize())
+
+    def _worker(self, stage):
+        handle = self.handlers[stage]
+        try:
+            while True:
+                item = self._get(stage)
+                if item is _DONE:
+                    break
+                results = ()
+                try:
+                    results = handle(item)
+                    for result in results:
+                        self._put(stage, result)
+                except _Stopped:
+                    raise
+                except Exception as e:
+                    self._failed(stage, item, e)
+                else:
+                    self._add(stage, 'items')
+                finally:
+                    close = getattr(results, 'close', None)
+                    if close:
+                        close()  # generator die halverwege stopt: verbinding teruggeven
+        except _Stopped:
+            pass
+        finally:
+            self._finished(stage)
+
+    def _finished(self, stage):
+        with self.lock:
+            self.running[stage] -= 1
+            last = self.running[stage] == 0
+        if last and stage != STAGES[-1]:
+            # Laatste thread van deze stage: elke thread van de volgende stage een einde-teken
+            try:
+                for _ in range(self.workers[STAGES[STAGES.index(stage) + 1]]):
+                    self._put(stage, _DONE)
+            except _Stopped:
+                pass
+
+    def _failed(self, stage, item, error):
+        self._add(stage, 'errors')
+        print(f"  ✗ {stage} {describe(item)}: {error}")
+        if self.source.fatal(error) and not self.stopping.is_set():
+            print("  ⏹ Stoppen met zoeken en downloaden; wat al binnen is wordt nog opgeslagen")
+            self.stopping.set()
+
+    def _parse(self, message):
+        message.raw = self.source.decode(message)
+        message.prepared = self.store.prepare(message.raw)
+        digest = message.prepared['digest']
+        if self.extract and digest not in self.store:
+            # Het dure MIME werk hier, parallel; de schrijver verplaatst alleen nog bestanden
+            message.parsed, message.spool = self.attachments.spool(digest, message.raw)
+        try:
+            yield message
+        except GeneratorExit:
+            self._discard(message)  # gestopt voordat write hem kreeg
+            raise
+
+    def _write(self, message):
+        stripped, committed = None, False
+        try:
+            if message.spool is not None and message.prepared['digest'] not in self.store:
+                # Eerst de bijlagen naar de blobs (één keer per content hash), dan gaat het
+                # bericht zonder hun base64 bodies de store in: geen tweede, volle kopie op schijf
+                message.parsed = self.attachments.commit(message.prepared['digest'], message.parsed, message.spool)
+                message.spool, committed = None, True
+                stripped = self.attachments.stub(message.raw, message.parsed.attachments)
+            digest, created = self.store.put(message.raw, ref=message.ref, label=message.label,
+                                             prepared=message.prepared, stripped=stripped, **message.meta)
+        except Exception:
+            self._discard(message)
+            raise
+        message.digest, message.created = digest, created
+        if created and self.extract:
+            if not committed:
+                message.parsed = self.attachments.extract(digest)
+            self.threads.add(self.store, digest)
+        else:
+            self._discard(message)  # bestond al (ook: zelfde bericht twee keer onderweg)
+        self.source.stored(message)
+        with self.lock:
+            self.counts['new' if created else 'existing'] += 1
+        entry = self.store.get(digest)
+        print(f"  {'✓' if created else '='} {entry.get('date', '')[:10]} - {entry.get('subject', 'No Subject')[:60]}")
+        return ()
+
+    def _discard(self, message):
+        if message.spool is not None:
+            self.attachments.discard(message.spool)
+            message.parsed = message.spool = None
+
+    def run(self):
+        """Run until every stage is done; returns the result dict (see run_pipeline)"""
+        started = time.perf_counter()
+        for search in self.source.searches():
+            self.queues['list'].put(search)
+        for _ in range(self.workers['list']):
+            self.queues['list'].put(_DONE)
+
+        threads = []
+        for stage in STAGES:
+            self.running[stage] = self.workers[stage]
+            for number in range(self.workers[stage]):
+                thread = threading.Thread(target=self._worker, args=(stage,), name=f"{stage}-{number}", daemon=True)
+                thread.start()
+                threads.append(thread)
+        try:
+            for thread in threads:
+                while thread.is_alive():
+                    thread.join(POLL_INTERVAL)
+        except KeyboardInterrupt:
+            self.aborted.set()
+            for thread in threads:
+                thread.join()
+            while not self.queues['write'].empty():
+                message = self.queues['write'].get()
+                if message is not _DONE:
+                    self._discard(message)
+            raise
+        finally:
+            if self.attachments is not None:
+                self.attachments.tidy()
+
+        errors = sum(stats['errors'] for stats in self.stats.values())
+        return {
+            **self.counts,
+            'errors': errors,
+            'stopped': self.stopping.is_set(),
+            'complete': errors == 0 and not self.stopping.is_set(),
+            'seconds': time.perf_counter() - started,
+            'workers': dict(self.workers),
+            'stages': {stage: dict(stats) for stage, stats in self.stats.items()},
+        }
+
+
+def run_pipeline(source, store=None, workers=None, queue_size=QUEUE_SIZE, extract=True):
+    """
+    Open the source, run the four stages and close the source.
+    Returns {'new', 'existing', 'errors', 'stopped', 'complete', 'seconds', 'workers', 'stages'}.
+    """
+    store = store if store is not None else MailStore(source.root)
+    source.open(store)
+    complete = False
+    try:
+        result = Pipeline(source, store, workers, queue_size, extract).run()
+        complete = result['complete']
+    finally:
+        source.close(complete)
+    return result
+
+
+def print_stages(result):
+    """Per stage: threads, items, errors, wachten op werk (idle) en op ruimte verderop (blocked)"""
+    print(f"\n{'Stage':<7} {'Threads':>7} {'Items':>7} {'Fouten':>7} {'Idle (s)':>9} {'Blocked (s)':>12} {'Queue piek':>11}")
+    print('-' * 66)
+    for stage in STAGES:
+        stats = result['stages'][stage]
+        print(f"{stage:<7} {result['workers'][stage]:>7} {stats['items']:>7} {stats['errors']:>7} "
+              f"{stats['idle']:>9.1f} {stats['blocked']:>12.1f} {stats['peak']:>11}")
+
+
+def load_source(name):
+    """pipeline_source() uit het importer script van een bron"""
+    script = SOURCES[name]
+    spec = importlib.util.spec_from_file_location(script[:-3].replace('-', '_'), TOOLS_DIR / script)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module.pipeline_source()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Import mail through the staged pipeline (list -> fetch -> parse -> write)")
+    parser.add_argument('source', choices=sorted(SOURCES), help="importer to run")
+    parser.add_argument('--out', help="mail store directory (default: the importer's own)")
+    for stage in STAGES[:3]:
+        parser.add_argument(f'--{stage}-workers', type=int, help=f"threads in the {stage} stage")
+    parser.add_argument('--queue-size', type=int, default=QUEUE_SIZE, help="items per queue between two stages")
+    args = parser.parse_args()
+
+    workers = {stage: getattr(args, f'{stage}_workers') for stage in STAGES[:3]
+               if getattr(args, f'{stage}_workers')}
+    source = load_source(args.source)
+    store = MailStore(args.out or source.root)
+    print(f"=== Mail Pipeline: {args.source} -> {store.root} ({len(store)} emails aanwezig) ===")
+
+    try:
+        result = run_pipeline(source, store, workers, args.queue_size)
+    except KeyboardInterrupt:
+        print("\n\nAfgebroken door gebruiker.")
+        sys.exit(1)
+    finally:
+        store.close()
+
+    print_stages(result)
+    rate = (result['new'] + result['existing']) / result['seconds'] if result['seconds'] else 0
+    print(f"\n✓ {result['new']} nieuw, {result['existing']} al aanwezig, {result['errors']} fouten "
+          f"in {result['seconds']:.1f}s ({rate:.1f} emails/s)")
+    if not result['complete']:
+        print("⚠ Import onvolledig; de volgende run haalt de rest op")
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
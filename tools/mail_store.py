@@ -0,0 +1,656 @@
+#!/usr/bin/env python3
+"""
+Mail Store - content-addressed local storage for imported emails
+
+Shared by gmail-import.py, import-arjan-emails.py, import-arjan-emails-v2.py
+and the fetch-*-emails.py scripts. Raw messages are stored once under their
+SHA-256 hash with two levels of fan-out directories, so a re-import of the
+same message is a no-op and every path lookup is constant-time:
+
+    <root>/objects/ab/cd/abcd...eml   raw RFC822 bytes
+    <root>/objects/ab/cd/abcd...txt   optional sidecar (e.g. rendered text)
+    <root>/manifest.jsonl             one compact JSON line per change
+
+Packed mode (a <root>/packs directory) appends raw messages to size-capped
+segment files instead of one file per message; the manifest records segment
+and offset, and reads go through mmap without touching neighbours:
+
+    <root>/packs/segment-00001.pack   [header][raw][header][raw]...
+
+With compression enabled (--compress) every message in a segment is
+compressed on its own against a dictionary trained on the store
+(mail_compress.py), so a single message still decompresses without its
+neighbours:
+
+    <root>/packs/compression.json     active codec + dictionary
+    <root>/packs/dict-0001.zstd       trained dictionary (never changed)
+
+Base64 attachment bodies can be stubbed out: mail_attachments.py keeps the
+decoded attachment once as a blob and the stored object only a one-line
+reference in its place. The manifest records where the stubs are; read(),
+open() and --export re-encode the blobs, so callers always get the original
+bytes (and the digest still matches):
+
+    <root>/attachments/ab/cd/abcd...pdf   decoded attachment (mail_attachments.py)
+
+Usage:
+    python mail_store.py <root>                  # summary
+    python mail_store.py <root> --list           # one line per stored message
+    python mail_store.py <root> --pack           # switch to packed mode, pack loose objects
+    python mail_store.py <root> --export <dest>  # copy to the one-file-per-message layout
+    python mail_store.py <root> --compress [zstd|zlib]  # train a dictionary, recompress the packs
+    python mail_store.py <root> --compact        # rewrite segments that hold replaced copies
+"""
+
+import binascii
+import hashlib
+import io
+import json
+import mmap
+import re
+import shutil
+import struct
+import sys
+import threading
+from email import policy
+from email.parser import BytesHeaderParser
+from email.utils import parsedate_to_datetime
+from pathlib import Path
+
+from atomic_file import atomic_write
+from mail_compress import SAMPLE_COUNT, Codec, default_codec, sample_messages, train_dictionary
+
+MANIFEST_NAME = 'manifest.jsonl'
+OBJECTS_DIR = 'objects'
+RAW_SUFFIX = '.eml'
+PARTS_SUFFIX = '.parts'  # directory with spooled attachments of a message
+PACKS_DIR = 'packs'
+SEGMENT_SIZE = 256 * 1024 * 1024  # bytes per pack segment
+SEGMENT_PATTERN = 'segment-{:05d}.pack'
+# Elke raw message in een segment: magic, lengte, digest (herstel zonder manifest mogelijk)
+SEGMENT_HEADER = struct.Struct('>4sQ32s')
+SEGMENT_MAGIC = b'MSG1'
+SEGMENT_MAGIC_COMPRESSED = b'MSGZ'
+COMPRESSION_CONFIG = 'compression.json'
+DICT_PATTERN = 'dict-{:04d}.{}'
+MIN_DICT_SAMPLES = 20  # minder berichten: comprimeren zonder dictionary
+# Manifest velden die alleen over de opslag gaan (niet mee bij export)
+STORAGE_FIELDS = ('pack', 'offset', 'codec', 'dict', 'stored', 'stubs', 'object_size')
+
+# Header velden die in het manifest terechtkomen
+SUMMARY_HEADERS = {
+    'message_id': 'Message-ID',
+    'subject': 'Subject',
+    'from': 'From',
+    'to': 'To',
+    'cc': 'Cc',
+}
+
+MESSAGE_ID_RE = re.compile(r'<[^<>\s]+>')
+
+
+def message_digest(raw):
+    """SHA-256 hex digest of the raw message bytes"""
+    return hashlib.sha256(raw).hexdigest()
+
+
+def encode_base64(data, width, eol):
+    """Base64 in lines of width characters, each ending in eol (as in a MIME body)"""
+    step = width // 4 * 3
+    return b''.join(binascii.b2a_base64(data[i:i + step], newline=False) + eol
+                    for i in range(0, len(data), step))
+
+
+def header_summary(raw):
+    """Parse only the header block of a raw message into manifest fields"""
+    # Body niet aan de parser geven: die zou hem anders helemaal inlezen als payload
+    ends = [i for i in (raw.find(b'\r\n\r\n'), raw.find(b'\n\n')) if i >= 0]
+    if ends:
+        raw = raw[:min(ends) + 2]
+    headers = BytesHeaderParser(policy=policy.default).parsebytes(raw)
+    summary = {}
+    for key, name in SUMMARY_HEADERS.items():
+        try:
+            value = headers.get(name)
+        except Exception:
+            value = None
+        if value:
+            summary[key] = str(value).strip()
+
+    # Thread headers (mail_threads.py); alleen de ids, zonder commentaar of whitespace.
+    # references staat er altijd (ook leeg): zo weet mail_threads dat de headers al gelezen zijn
+    for key, name in (('in_reply_to', 'In-Reply-To'), ('references', 'References')):
+        try:
+            ids = MESSAGE_ID_RE.findall(str(headers.get(name) or ''))
+        except Exception:
+            ids = []
+        if key == 'references':
+            summary[key] = ids
+        elif ids:
+            summary[key] = ids[0]
+    date_header = headers.get('Date', '')
+    try:
+        summary['date'] = parsedate_to_datetime(str(date_header)).isoformat()
+    except Exception:
+        if date_header:
+            summary['date'] = str(date_header)
+    return summary
+
+
+class MailStore:
+    """Content-addressed message store with an append-only manifest; writes are thread-safe"""
+
+    def __init__(self, root, packed=None):
+        """packed=None: packed mode when the store already has a packs directory"""
+        self.root = Path(root)
+        self.objects_dir = self.root / OBJECTS_DIR
+        self.manifest_path = self.root / MANIFEST_NAME
+        self.packs_dir = self.root / PACKS_DIR
+        self.root.mkdir(parents=True, exist_ok=True)
+        self.packed = self.packs_dir.is_dir() if packed is None else packed
+        if self.packed:
+            self.packs_dir.mkdir(exist_ok=True)
+
+        self._entries = {}
+        self._refs = {}
+        self._manifest = None
+        self._segment = None   # (naam, file) van het segment waaraan toegevoegd wordt
+        self._maps = {}
+        self._maps_lock = threading.Lock()
+        self._codecs = {}
+        self._lock = threading.RLock()
+        self.compression = self._load_compression()
+        self._load_manifest()
+
+    def _load_manifest(self):
+        if not self.manifest_path.exists():
+            return
+        good = 0
+        with open(self.manifest_path, 'rb') as f:
+            for line in f:
+                if not line.endswith(b'\n'):
+                    break
+                good += len(line)
+                line = line.strip()
+                if not line:
+                    continue
+                try:
+                    record = json.loads(line)
+                except ValueError:
+                    continue
+                self._apply(record)
+        if good < self.manifest_path.stat().st_size:
+            # Afgebroken laatste regel na een crash: afkappen, anders plakt de volgende append eraan vast
+            with open(self.manifest_path, 'r+b') as f:
+                f.truncate(good)
+
+    def _apply(self, record):
+        digest = record['h']
+        entry = self._entries.setdefault(digest, {'h': digest, 'refs': [], 'labels': []})
+        for key, value in record.items():
+            if key in ('refs', 'labels'):
+                for item in value:
+                    if item not in entry[key]:
+                        entry[key].append(item)
+            else:
+                entry[key] = value
+        for ref in record.get('refs', []):
+            self._refs[ref] = digest
+
+    def _append(self, record):
+        line = json.dumps(record, ensure_ascii=False, separators=(',', ':'))
+        if self._manifest is None:
+            self._manifest = open(self.manifest_path, 'a', encoding='utf-8')
+        # Open blijven, flush per regel: een crash verliest hooguit de laatste (afgebroken) regel
+        self._manifest.write(line + '\n')
+        self._manifest.flush()
+        self._apply(record)
+
+    def __contains__(self, digest):
+        return digest in self._entries
+
+    def __len__(self):
+        return len(self._entries)
+
+    def path(self, digest, suffix=RAW_SUFFIX):
+        """Fan-out path for a digest: objects/ab/cd/<digest><suffix>"""
+        return self.objects_dir / digest[:2] / digest[2:4] / f"{digest}{suffix}"
+
+    def has_ref(self, ref):
+        """True if a source reference (e.g. 'gmail:<account>:<id>') is already stored"""
+        return ref in self._refs
+
+    def digest_for_ref(self, ref):
+        return self._refs.get(ref)
+
+    def prepare(self, raw):
+        """
+        What put() derives from the raw bytes alone: digest, header summary and,
+        with compression on, the compressed payload. Thread-safe and outside the
+        store lock, so an import pipeline can do it before the writer thread.
+        """
+        prepared = {'digest': message_digest(raw), 'summary': header_summary(raw)}
+        if self.packed and self.compression:
+            codec, dictionary = self.compression['codec'], self.compression['dictionary']
+            prepared['compressed'] = (codec, dictionary, self._codec(codec, dictionary).compress(raw))
+        return prepared
+
+    def put(self, raw, ref=None, label=None, prepared=None, stripped=None, **meta):
+        """
+        Store a raw message. Returns (digest, created).
+
+        ref      - stable source id, lets importers skip known messages before download
+        label    - grouping such as a contact group or folder; a message can carry several
+        prepared - result of prepare(raw), computed earlier (e.g. in a parse thread)
+        stripped - (object bytes, stubs) from AttachmentStore.stub(): store the message
+                   with its attachment bodies stubbed out
+        meta     - extra manifest fields (account, folder, ...)
+        """
+        prepared = prepared or {}
+        digest = prepared.get('digest') or message_digest(raw)
+        refs = [ref] if ref else []
+        labels = [label] if label else []
+
+        with self._lock:
+            if digest in self._entries:
+                self.tag(digest, ref=ref, label=label)
+                return digest, False
+
+            record = {'h': digest, 'size': len(raw)}
+            data, compressed = raw, prepared.get('compressed')
+            if stripped:
+                data, record['stubs'] = stripped
+                record['object_size'], compressed = len(data), None
+            if self.packed:
+                record.update(self._pack(digest, data, compressed))
+            else:
+                path = self.path(digest)
+                if not path.exists():
+                    atomic_write(path, data)
+            record.update(prepared['summary'] if 'summary' in prepared else header_summary(raw))
+            record.update({k: v for k, v in meta.items() if v is not None})
+            record['refs'] = refs
+            record['labels'] = labels
+            self._append(record)
+        return digest, True
+
+    def tag(self, digest, ref=None, label=None):
+        """Attach an extra source reference and/or label to a stored message"""
+        with self._lock:
+            entry = self._entries[digest]
+            new_refs = [ref] if ref and ref not in entry['refs'] else []
+            new_labels = [label] if label and label not in entry['labels'] else []
+            if new_refs or new_labels:
+                self._append({'h': digest, 'refs': new_refs, 'labels': new_labels})
+
+    def strip(self, digest, data, stubs):
+        """
+        Replace the stored object of a message by data, the same message with
+        its attachment bodies stubbed out (AttachmentStore.stub). In packed mode
+        the old copy stays in its segment until compact(). Returns False when
+        the message was stubbed already.
+        """
+        with self._lock:
+            entry = self._entries[digest]
+            if entry.get('stubs'):
+                return False
+            record = {'h': digest, 'stubs': stubs, 'object_size': len(data), 'refs': [], 'labels': []}
+            if entry.get('pack'):
+                record.update(self._pack(digest, data))
+                self._append(record)
+            else:
+                # Eerst het manifest: tot het bestand vervangen is heeft het nog de volle lengte (zie _expand)
+                self._append(record)
+                atomic_write(self.path(digest), data)
+        return True
+
+    def put_sidecar(self, digest, suffix, data):
+        """Store a derived file next to the raw message (e.g. '.txt')"""
+        if isinstance(data, str):
+            data = data.encode('utf-8')
+        path = self.path(digest, suffix)
+        atomic_write(path, data)
+        return path
+
+    def _open_segment(self, size):
+        """Segment met ruimte voor size bytes (een nieuw segment als het huidige vol is)"""
+        if self._segment is None:
+            names = sorted(self.packs_dir.glob('segment-*.pack'))
+            name = names[-1].name if names else SEGMENT_PATTERN.format(1)
+            self._segment = (name, open(self.packs_dir / name, 'ab'))
+        name, f = self._segment
+        if f.tell() and f.tell() + size > SEGMENT_SIZE:
+            f.close()
+            name = SEGMENT_PATTERN.format(int(name[8:13]) + 1)
+            self._segment = (name, open(self.packs_dir / name, 'ab'))
+        return self._segment
+
+    def _pack_append(self, digest, data, magic=SEGMENT_MAGIC):
+        """Append data to the current segment; returns (segment name, offset of the data)"""
+        name, f = self._open_segment(SEGMENT_HEADER.size + len(data))
+        f.write(SEGMENT_HEADER.pack(magic, len(data), bytes.fromhex(digest)))
+        offset = f.tell()
+        f.write(data)
+        # Eerst het segment, dan de manifest regel: een crash laat hooguit ongebruikte bytes achter
+        f.flush()
+        return name, offset
+
+    def _pack(self, digest, raw, compressed=None):
+        """Raw message into a segment, compressed when enabled; returns the manifest storage fields"""
+        if self.compression:
+            codec, dictionary = self.compression['codec'], self.compression['dictionary']
+            if compressed is not None and compressed[:2] == (codec, dictionary):
+                data = compressed[2]
+            else:
+                data = self._codec(codec, dictionary).compress(raw)
+            if len(data) < len(raw):
+                name, offset = self._pack_append(digest, data, SEGMENT_MAGIC_COMPRESSED)
+                return {'pack': name, 'offset': offset, 'codec': codec, 'dict': dictionary, 'stored': len(data)}
+        name, offset = self._pack_append(digest, raw)
+        if self.compression:
+            # Herschreven bericht: eerdere codec velden in het manifest overschrijven
+            return {'pack': name, 'offset': offset, 'codec': None, 'dict': None, 'stored': None}
+        return {'pack': name, 'offset': offset}
+
+    def _load_compression(self):
+        config = self.packs_dir / COMPRESSION_CONFIG
+        if self.packed and config.exists():
+            return json.loads(config.read_text(encoding='utf-8'))
+        return None
+
+    def _codec(self, name, dictionary):
+        key = (name, dictionary)
+        codec = self._codecs.get(key)
+        if codec is None:
+            data = (self.packs_dir / dictionary).read_bytes() if dictionary else b''
+            codec = self._codecs[key] = Codec(name, data)
+        return codec
+
+    def _view(self, name, offset, size):
+        with self._maps_lock:
+            mapped = self._maps.get(name)
+            if mapped is None or offset + size > len(mapped):
+                # Segment is gegroeid sinds de vorige map
+                if mapped is not None:
+                    mapped.close()
+                if self._segment and self._segment[0] == name:
+                    self._segment[1].flush()
+                with open(self.packs_dir / name, 'rb') as f:
+                    mapped = self._maps[name] = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+            return mapped[offset:offset + size]
+
+    def _object(self, digest):
+        """Bytes as stored: the raw message, or the version with its attachment bodies stubbed out"""
+        entry = self._entries.get(digest)
+        if entry and entry.get('pack'):
+            size = entry.get('object_size') or entry['size']
+            if entry.get('codec'):
+                data = self._view(entry['pack'], entry['offset'], entry['stored'])
+                return self._codec(entry['codec'], entry.get('dict')).decompress(data, size)
+            return self._view(entry['pack'], entry['offset'], size)
+        return self.path(digest).read_bytes()
+
+    def _expand(self, entry, data):
+        """Stubbed attachment bodies back to base64 from their blobs"""
+        if not entry or not entry.get('stubs') or len(data) == entry['size']:
+            # Geen stubs, of een crash tussen manifest regel en herschreven object: nog het origineel
+            return data
+        pieces, position = [], 0
+        for stub in entry['stubs']:
+            pieces.append(data[position:stub['at']])
+            blob = (self.root / stub['blob']).read_bytes()
+            pieces.append(encode_base64(blob, stub['width'], stub['eol'].encode('ascii')))
+            position = stub['at'] + stub['len']
+        pieces.append(data[position:])
+        return b''.join(pieces)
+
+    def read(self, digest):
+        """Raw bytes of a stored message"""
+        return self._expand(self._entries.get(digest), self._object(digest))
+
+    def open(self, digest):
+        """Binary file object with the raw message (for streaming parsers)"""
+        entry = self._entries.get(digest)
+        if entry and (entry.get('pack') or entry.get('stubs')):
+            return io.BytesIO(self.read(digest))
+        return open(self.path(digest), 'rb')
+
+    def exists(self, digest):
+        """True when the raw bytes are available (packed or as a loose object)"""
+        entry = self._entries.get(digest)
+        return bool(entry and entry.get('pack')) or self.path(digest).exists()
+
+    def location(self, digest):
+        """Where the raw message lives, relative to root: objects/... or packs/<segment>@<offset>"""
+        entry = self._entries.get(digest)
+        if entry and entry.get('pack'):
+            return f"{PACKS_DIR}/{entry['pack']}@{entry['offset']}"
+        return self.path(digest).relative_to(self.root).as_posix()
+
+    def _iter_objects(self):
+        """(entry, stored bytes) for every message; packed messages in segment order (sequential reads)"""
+        entries = sorted(self._entries.values(), key=lambda e: (e.get('pack') or '', e.get('offset') or 0))
+        for entry in entries:
+            try:
+                yield entry, self._object(entry['h'])
+            except OSError:
+                continue
+
+    def iter_raw(self):
+        """(entry, raw) for every message; packed messages in segment order (sequential reads)"""
+        for entry, data in self._iter_objects():
+            try:
+                yield entry, self._expand(entry, data)
+            except OSError:
+                continue
+
+    def pack_loose(self):
+        """Move loose objects into segments (switches the store to packed mode). Returns the count"""
+        self.packed = True
+        self.packs_dir.mkdir(exist_ok=True)
+        packed = 0
+        for entry in list(self._entries.values()):
+            path = self.path(entry['h'])
+            if entry.get('pack') or not path.exists():
+                continue
+            self._append({'h': entry['h'], **self._pack(entry['h'], path.read_bytes()), 'refs': [], 'labels': []})
+            path.unlink()
+            packed += 1
+        return packed
+
+    def enable_compression(self, codec=None, samples=SAMPLE_COUNT):
+        """Train a dictionary on a sample of the store and compress new messages with it"""
+        codec = codec or default_codec()
+        self.packed = True
+        self.packs_dir.mkdir(exist_ok=True)
+        # Alleen de steekproef inlezen, niet de hele store
+        digests = [digest for digest in self._entries if self.exists(digest)]
+        sample = [self._object(digest) for digest in sample_messages(digests, samples)] if samples else []
+        dictionary = None
+        if len(sample) >= MIN_DICT_SAMPLES:
+            number = len(list(self.packs_dir.glob('dict-*'))) + 1
+            dictionary = DICT_PATTERN.format(number, codec)
+            atomic_write(self.packs_dir / dictionary, train_dictionary(sample, codec))
+        self.compression = {'codec': codec, 'dictionary': dictionary}
+        atomic_write(self.packs_dir / COMPRESSION_CONFIG, json.dumps(self.compression, indent=2).encode('utf-8'))
+        return self.compression
+
+    def recompress(self):
+        """
+        Rewrite every message that is not stored with the active codec/dictionary
+        into fresh segments and delete the segments (and loose objects) that are no
+        longer referenced. Returns (rewritten, segments removed).
+        """
+        current = (self.compression or {}).get('codec'), (self.compression or {}).get('dictionary')
+        return self._rewrite(lambda entry: not entry.get('pack') or (entry.get('codec'), entry.get('dict')) != current)
+
+    def compact(self):
+        """
+        Rewrite the messages of segments that also hold copies nobody references
+        any more (e.g. the originals of strip()) into fresh segments and delete
+        the old ones. Returns (rewritten, segments removed).
+        """
+        live = {}
+        for entry in self._entries.values():
+            if entry.get('pack'):
+                size = entry.get('stored') or entry.get('object_size') or entry['size']
+                live[entry['pack']] = live.get(entry['pack'], 0) + SEGMENT_HEADER.size + size
+        if self._segment:
+            self._segment[1].flush()
+        dirty = {path.name for path in self.packs_dir.glob('segment-*.pack')
+                 if path.stat().st_size > live.get(path.name, 0)}
+        if not dirty:
+            return 0, 0
+        return self._rewrite(lambda entry: entry.get('pack') in dirty)
+
+    def _rewrite(self, select):
+        """Move the messages for which select(entry) holds to a fresh segment, delete unreferenced segments"""
+        old_segments = {p.name for p in self.packs_dir.glob('segment-*.pack')}
+        # Nieuwe berichten niet in een oud segment: die moet weg kunnen
+        if self._segment:
+            self._segment[1].close()
+        last = max((int(name[8:13]) for name in old_segments), default=0)
+        name = SEGMENT_PATTERN.format(last + 1)
+        self._segment = (name, open(self.packs_dir / name, 'ab'))
+
+        rewritten = 0
+        for entry, data in self._iter_objects():
+            if not select(entry):
+                continue
+            loose = None if entry.get('pack') else self.path(entry['h'])
+            self._append({'h': entry['h'], **self._pack(entry['h'], data), 'refs': [], 'labels': []})
+            if loose is not None and loose.exists():
+                loose.unlink()
+            rewritten += 1
+
+        referenced = {e['pack'] for e in self._entries.values() if e.get('pack')}
+        removed = 0
+        with self._maps_lock:
+            for name in sorted(old_segments - referenced):
+                mapped = self._maps.pop(name, None)
+                if mapped is not None:
+                    mapped.close()
+                (self.packs_dir / name).unlink()
+                removed += 1
+        return rewritten, removed
+
+    def stored_size(self):
+        """Bytes on disk for the raw messages (compressed size where compressed, without stubbed attachments)"""
+        return sum((e.get('stored') or e.get('object_size') or e.get('size', 0)) for e in self._entries.values())
+
+    def disk_size(self):
+        """Bytes the messages really take on disk: loose objects plus whole pack segments"""
+        total = sum(path.stat().st_size for path in self.packs_dir.glob('segment-*.pack')) if self.packed else 0
+        for entry in self._entries.values():
+            if not entry.get('pack'):
+                try:
+                    total += self.path(entry['h']).stat().st_size
+                except OSError:
+                    pass
+        return total
+
+    def export(self, dest):
+        """Copy the store to dest in the one-file-per-message layout (sidecars included)"""
+        target = MailStore(dest, packed=False)
+        lines = []
+        for entry, raw in self.iter_raw():
+            atomic_write(target.path(entry['h']), raw)
+            for sidecar in self.path(entry['h']).parent.glob(f"{entry['h']}.*"):
+                if sidecar.suffix != RAW_SUFFIX and sidecar.is_file():
+                    shutil.copy2(sidecar, target.path(entry['h'], sidecar.suffix))
+            record = {k: v for k, v in entry.items() if k not in STORAGE_FIELDS}
+            lines.append(json.dumps(record, ensure_ascii=False, separators=(',', ':')) + '\n')
+        atomic_write(target.manifest_path, ''.join(lines).encode('utf-8'))
+        return len(lines)
+
+    def close(self):
+        if self._manifest:
+            self._manifest.close()
+            self._manifest = None
+        if self._segment:
+            self._segment[1].close()
+            self._segment = None
+        with self._maps_lock:
+            for mapped in self._maps.values():
+                mapped.close()
+            self._maps.clear()
+
+    def get(self, digest):
+        """Manifest entry for a digest, or None"""
+        return self._entries.get(digest)
+
+    def entries(self):
+        """All manifest entries, in insertion order"""
+        return list(self._entries.values())
+
+
+def main():
+    if len(sys.argv) < 2:
+        print(__doc__)
+        return
+
+    store = MailStore(sys.argv[1])
+    entries = sorted(store.entries(), key=lambda e: e.get('date', ''))
+
+    if '--pack' in sys.argv[2:]:
+        packed = store.pack_loose()
+        print(f"✓ {packed} losse berichten verplaatst naar {store.packs_dir}")
+        store.close()
+        return
+
+    if '--compress' in sys.argv[2:]:
+        position = sys.argv.index('--compress') + 1
+        codec = sys.argv[position] if position < len(sys.argv) and not sys.argv[position].startswith('--') else None
+        before = store.stored_size()
+        config = store.enable_compression(codec)
+        print(f"✓ Codec {config['codec']}, dictionary {config['dictionary'] or '(geen, te weinig berichten)'}")
+        rewritten, removed = store.recompress()
+        after = store.stored_size()
+        print(f"✓ {rewritten} berichten herschreven, {removed} oude segmenten verwijderd")
+        print(f"  {before / 1024 / 1024:.1f} MB -> {after / 1024 / 1024:.1f} MB ({before / max(after, 1):.2f}x)")
+        store.close()
+        return
+
+    if '--compact' in sys.argv[2:]:
+        before = store.disk_size()
+        rewritten, removed = store.compact()
+        after = store.disk_size()
+        print(f"✓ {rewritten} berichten herschreven, {removed} oude segmenten verwijderd")
+        print(f"  {before / 1024 / 1024:.1f} MB -> {after / 1024 / 1024:.1f} MB")
+        store.close()
+        return
+
+    if '--export' in sys.argv[2:]:
+        dest = sys.argv[sys.argv.index('--export') + 1]
+        count = store.export(dest)
+        print(f"✓ {count} berichten geëxporteerd naar {dest}")
+        store.close()
+        return
+
+    if '--list' in sys.argv[2:]:
+        for entry in entries:
+            print(f"{entry['h'][:12]}  {entry.get('date', '')[:10]:10s}  "
+                  f"{entry.get('from', '')[:30]:30s}  {entry.get('subject', '')[:60]}")
+        return
+
+    total_size = sum(e.get('size', 0) for e in entries)
+    labels = {}
+    for entry in entries:
+        for label in entry['labels'] or ['-']:
+            labels[label] = labels.get(label, 0) + 1
+
+    print(f"Store: {store.root}")
+    print(f"Messages: {len(entries)} ({total_size / 1024 / 1024:.1f} MB)")
+    if store.packed:
+        packed = sum(1 for e in entries if e.get('pack'))
+        print(f"Layout: packed, {len(list(store.packs_dir.glob('segment-*.pack')))} segments "
+              f"({packed} packed, {len(entries) - packed} loose)")
+        if store.compression:
+            print(f"Compression: {store.compression['codec']} ({store.compression['dictionary'] or 'no dictionary'}), "
+                  f"{store.stored_size() / 1024 / 1024:.1f} MB on disk")
+    for label, count in sorted(labels.items()):
+        print(f"  {label:40s} : {count}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,270 @@
+#!/usr/bin/env python3
+"""
+Mail Threads - persistent conversation index over a mail store
+
+Groups messages into threads using Message-ID, In-Reply-To, References and
+the Gmail threadId. Everything comes from the store manifest (mail_store
+records the thread headers at import), so no message body is opened; older
+manifest entries fall back to reading only the header block once.
+
+The graph lives in <root>/threads.sqlite. Every message key (its own
+Message-ID, every referenced id, gmail:<threadId>) points at one thread;
+adding a message that links two known threads merges them. Updates are
+incremental per message, and a thread comes back in date order straight
+from the (thread, date) index.
+
+Usage:
+    python mail_threads.py <root> build                  # index new messages
+    python mail_threads.py <root> list [--participant meppel.nl] [--limit 20]
+    python mail_threads.py <root> show <thread | message digest | Message-ID>
+"""
+
+import argparse
+import sqlite3
+import sys
+import threading
+import time
+import weakref
+from datetime import datetime, timezone
+from pathlib import Path
+
+from mail_index import normalize_date
+from mail_store import MailStore, header_summary
+
+DB_NAME = 'threads.sqlite'
+COMMIT_EVERY = 500
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS messages (
+    digest TEXT PRIMARY KEY,
+    message_id TEXT,
+    parent TEXT,
+    thread INTEGER NOT NULL,
+    date TEXT,
+    sender TEXT,
+    subject TEXT
+);
+CREATE INDEX IF NOT EXISTS idx_messages_thread_date ON messages(thread, date);
+CREATE INDEX IF NOT EXISTS idx_messages_message_id ON messages(message_id);
+
+CREATE TABLE IF NOT EXISTS links (
+    key TEXT PRIMARY KEY,
+    thread INTEGER NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_links_thread ON links(thread);
+"""
+
+_indexes = weakref.WeakKeyDictionary()
+
+
+def sort_date(value):
+    """Manifest datum -> 'YYYY-MM-DD HH:MM:SS' in UTC, zoals mail_index"""
+    if not value:
+        return None
+    try:
+        parsed = datetime.fromisoformat(value)
+    except ValueError:
+        return normalize_date(value)
+    if parsed.tzinfo is not None:
+        parsed = parsed.astimezone(timezone.utc)
+    return parsed.strftime('%Y-%m-%d %H:%M:%S')
+
+
+def read_header_block(fp):
+    """Alleen de headers van een opgeslagen bericht (voor manifest regels van voor de thread headers)"""
+    lines = []
+    with fp as f:
+        for line in f:
+            if line in (b'\r\n', b'\n'):
+                break
+            lines.append(line)
+    return header_summary(b''.join(lines) + b'\r\n')
+
+
+def thread_keys(digest, entry):
+    """Alle sleutels waarmee een bericht aan een thread hangt"""
+    keys = []
+    for message_id in [entry.get('message_id')] + list(entry.get('references') or []) + [entry.get('in_reply_to')]:
+        if message_id and message_id not in keys:
+            keys.append(message_id)
+    if entry.get('thread_id'):
+        keys.append(f"gmail:{entry.get('account', '')}:{entry['thread_id']}")
+    if not entry.get('message_id'):
+        keys.append(f"digest:{digest}")
+    return keys
+
+
+class ThreadIndex:
+    """Thread graph in SQLite, updated one message at a time; thread-safe"""
+
+    def __init__(self, db_path):
+        self.db = sqlite3.connect(str(db_path), check_same_thread=False)
+        self.db.row_factory = sqlite3.Row
+        self.db.execute('PRAGMA journal_mode=WAL')
+        self.db.execute('PRAGMA synchronous=NORMAL')
+        self.db.executescript(SCHEMA)
+        self.lock = threading.Lock()
+
+    def close(self):
+        with self.lock:
+            self.db.commit()
+            self.db.close()
+
+    def __contains__(self, digest):
+        with self.lock:
+            return self.db.execute('SELECT 1 FROM messages WHERE digest = ?', (digest,)).fetchone() is not None
+
+    def _add(self, digest, entry):
+        keys = thread_keys(digest, entry)
+        placeholders = ','.join('?' * len(keys))
+        threads = sorted({row[0] for row in self.db.execute(
+            f'SELECT thread FROM links WHERE key IN ({placeholders})', keys)})
+        if threads:
+            thread = threads[0]
+            for other in threads[1:]:
+                # Dit bericht verbindt twee bekende threads: samenvoegen in de oudste
+                self.db.execute('UPDATE links SET thread = ? WHERE thread = ?', (thread, other))
+                self.db.execute('UPDATE messages SET thread = ? WHERE thread = ?', (thread, other))
+        else:
+            thread = self.db.execute('SELECT COALESCE(MAX(thread), 0) + 1 FROM links').fetchone()[0]
+        self.db.executemany('INSERT OR REPLACE INTO links (key, thread) VALUES (?, ?)',
+                            [(key, thread) for key in keys])
+        references = entry.get('references') or []
+        parent = entry.get('in_reply_to') or (references[-1] if references else None)
+        self.db.execute(
+            'INSERT OR REPLACE INTO messages (digest, message_id, parent, thread, date, sender, subject)'
+            ' VALUES (?, ?, ?, ?, ?, ?, ?)',
+            (digest, entry.get('message_id'), parent, thread, sort_date(entry.get('date')),
+             entry.get('from'), entry.get('subject')))
+        return thread
+
+    def add(self, store, digest):
+        """Eén (nieuw) bericht uit de store in de graph opnemen; geeft het thread nummer"""
+        entry = self._entry(store, digest)
+        with self.lock:
+            thread = self._add(digest, entry)
+            self.db.commit()
+        return thread
+
+    @staticmethod
+    def _entry(store, digest):
+        entry = store.get(digest) or {}
+        if 'references' not in entry and 'in_reply_to' not in entry and store.exists(digest):
+            # Manifest van voor de thread headers: alleen het header blok lezen
+            entry = dict(entry, **read_header_block(store.open(digest)))
+        return entry
+
+    def update(self, store):
+        """Alle berichten van de store die nog niet in de graph staan. Geeft het aantal toegevoegd"""
+        with self.lock:
+            known = {row[0] for row in self.db.execute('SELECT digest FROM messages')}
+        added = 0
+        for entry in store.entries():
+            if entry['h'] in known:
+                continue
+            record = self._entry(store, entry['h'])
+            with self.lock:
+                self._add(entry['h'], record)
+                added += 1
+                if added % COMMIT_EVERY == 0:
+                    self.db.commit()
+        with self.lock:
+            self.db.commit()
+        return added
+
+    def resolve(self, ref):
+        """Thread nummer voor een thread nummer, (prefix van een) digest of Message-ID"""
+        with self.lock:
+            if str(ref).isdigit():
+                row = self.db.execute('SELECT thread FROM messages WHERE thread = ? LIMIT 1', (int(ref),)).fetchone()
+                if row:
+                    return row[0]
+            row = self.db.execute('SELECT thread FROM links WHERE key = ?', (ref,)).fetchone()
+            if row is None and not ref.startswith('<'):
+                row = self.db.execute('SELECT thread FROM links WHERE key = ?', (f"<{ref}>",)).fetchone()
+            if row is None:
+                row = self.db.execute('SELECT thread FROM messages WHERE digest LIKE ? LIMIT 1',
+                                      (f"{ref}%",)).fetchone()
+            return row[0] if row else None
+
+    def thread(self, thread):
+        """Berichten van een thread op datum, met diepte in de reply boom"""
+        with self.lock:
+            rows = [dict(row) for row in self.db.execute(
+                'SELECT digest, message_id, parent, date, sender, subject FROM messages'
+                ' WHERE thread = ? ORDER BY date, digest', (thread,))]
+        depth = {}
+        for row in rows:
+            # Ouder staat (op datum) eerder in de lijst; onbekende ouder -> wortel
+            row['depth'] = depth[row['message_id']] = depth.get(row['parent'], -1) + 1 if row['parent'] else 0
+        return rows
+
+    def threads(self, participant=None, limit=None):
+        """Threads met aantal berichten en eerste/laatste datum, laatst actief eerst"""
+        sql = ['SELECT thread, COUNT(*) AS count, MIN(date) AS first, MAX(date) AS last,'
+               ' MIN(subject) AS subject FROM messages']
+        params = []
+        if participant:
+            sql.append('WHERE thread IN (SELECT thread FROM messages WHERE sender LIKE ?)')
+            params.append(f"%{participant}%")
+        sql.append('GROUP BY thread ORDER BY last DESC')
+        if limit:
+            sql.append('LIMIT ?')
+            params.append(limit)
+        with self.lock:
+            return [dict(row) for row in self.db.execute(' '.join(sql), params)]
+
+
+def thread_index(store):
+    """Eén ThreadIndex per MailStore (<root>/threads.sqlite), gedeeld door de importers"""
+    index = _indexes.get(store)
+    if index is None:
+        index = _indexes[store] = ThreadIndex(Path(store.root) / DB_NAME)
+    return index
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Conversation threads of a mail store")
+    parser.add_argument('root', help="mail store directory")
+    sub = parser.add_subparsers(dest='command', required=True)
+    sub.add_parser('build', help="add messages that are not indexed yet")
+    listing = sub.add_parser('list', help="threads, most recently active first")
+    listing.add_argument('--participant', help="part of a sender address, e.g. meppel.nl")
+    listing.add_argument('--limit', type=int, default=50)
+    show = sub.add_parser('show', help="one thread in date order")
+    show.add_argument('ref', help="thread number, message digest (prefix) or Message-ID")
+    args = parser.parse_args()
+
+    store = MailStore(args.root)
+    index = thread_index(store)
+    started = time.perf_counter()
+
+    if args.command == 'build':
+        added = index.update(store)
+        print(f"✓ {added} berichten toegevoegd aan {Path(store.root) / DB_NAME}")
+
+    elif args.command == 'list':
+        rows = index.threads(args.participant, args.limit)
+        for row in rows:
+            print(f"[{row['thread']:>5}] {row['count']:>4}x  {(row['first'] or '?')[:10]} - "
+                  f"{(row['last'] or '?')[:10]}  {(row['subject'] or '')[:60]}")
+        print(f"\n{len(rows)} threads")
+
+    elif args.command == 'show':
+        thread = index.resolve(args.ref)
+        if thread is None:
+            print(f"Niet gevonden: {args.ref}")
+            sys.exit(1)
+        rows = index.thread(thread)
+        print(f"Thread {thread}: {len(rows)} berichten\n")
+        for row in rows:
+            indent = '  ' * min(row['depth'], 8)
+            print(f"{row['date'] or '?':19s}  {indent}{(row['sender'] or '')[:35]:35s}  {(row['subject'] or '')[:50]}")
+            print(f"{'':19s}  {indent}{store.location(row['digest'])}")
+
+    index.close()
+    print(f"({(time.perf_counter() - started) * 1000:.0f} ms)", file=sys.stderr)
+
+
+if __name__ == '__main__':
+    main()
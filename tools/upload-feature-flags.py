@@ -1,13 +1,58 @@
 #!/usr/bin/env python3
-"""Upload feature flags configuration to production server"""
+"""
+Upload feature flags configuration to production server
 
-import paramiko
+The JSON goes straight from memory to a temp file next to the target and is
+then renamed over it, so the backend never reads a half-written config.
+After the app pool restart the API is polled (exponential backoff, with a
+deadline) until it serves the new flags; the time-to-ready is reported.
+
+Fleet mode rolls the same config out to every host of an inventory, in
+waves (default: 10% canary, then the rest). Hosts in a wave run in
+parallel over a pool of authenticated SSH connections; a wave with a
+failed host stops the rollout. The inventory is a JSON list of hosts:
+
+    ["10.0.0.5", "10.0.0.6:2222",
+     {"host": "10.0.0.7", "user": "deploy", "password": "...", "url": "https://10.0.0.7/api/featureflags"}]
+
+Usage:
+    python upload-feature-flags.py                              # SSH_HOST
+    python upload-feature-flags.py --fleet hosts.json [--waves 10,100] [--workers 16]
+"""
+
+import argparse
+import io
 import json
+import math
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import paramiko
+import requests
+
+from flag_client import FlagClient
 
 SSH_HOST = "YOUR_SERVER_IP"
+SSH_PORT = 22
 SSH_USER = "administrator"
 SSH_PASSWORD = "YOUR_SERVER_PASSWORD"
 
+REMOTE_PATH = "C:/stores/brand2boost/backend/Configuration/feature-flags.json"
+FLAGS_URL = "https://api.brand2boost.com/api/featureflags"
+RESTART_COMMAND = 'powershell -Command "Import-Module WebAdministration; Restart-WebAppPool -Name (Get-Website \'Brand2boostAPI\').applicationPool"'
+
+# Readiness polling na de restart
+READY_DEADLINE = 120      # seconden
+POLL_INITIAL_DELAY = 0.25
+POLL_MAX_DELAY = 5.0
+POLL_TIMEOUT = 5          # per request
+
+# Fleet mode: cumulatieve percentages per wave, en de health URL per host
+FLEET_WAVES = [10, 100]
+FLEET_WORKERS = 16
+FLEET_URL_TEMPLATE = "https://{host}/api/featureflags"
+
 # Feature flags configuration
 FEATURE_FLAGS = {
     "FeatureFlags": {
@@ -23,92 +68,266 @@ FEATURE_FLAGS = {
     }
 }
 
+def connect(host=None, port=None, username=None, password=None):
+    """SSH verbinding; zonder argumenten naar SSH_HOST"""
+    ssh = paramiko.SSHClient()
+    ssh.set_missing_host_key_policy(paramiko.AutoAddPolicy())
+    ssh.connect(host or SSH_HOST, port=port or SSH_PORT,
+                username=username or SSH_USER, password=password or SSH_PASSWORD)
+    return ssh
+
+def upload_config(ssh, data, remote_path=REMOTE_PATH):
+    """Schrijf bytes uit het geheugen naar remote_path via temp file + rename"""
+    temp_path = f"{remote_path}.tmp"
+    sftp = ssh.open_sftp()
+    try:
+        sftp.putfo(io.BytesIO(data), temp_path)
+        try:
+            # posix-rename@openssh.com vervangt het doel in één stap (ook op Windows OpenSSH)
+            sftp.posix_rename(temp_path, remote_path)
+        except IOError:
+            # Server zonder de extensie: gewone rename faalt als het doel bestaat
+            try:
+                sftp.remove(remote_path)
+            except IOError:
+                pass
+            sftp.rename(temp_path, remote_path)
+    finally:
+        sftp.close()
+
+def restart_backend(ssh, command=RESTART_COMMAND):
+    """Restart de app pool; geeft (output, error)"""
+    stdin, stdout, stderr = ssh.exec_command(command)
+    output = stdout.read().decode('utf-8').strip()
+    error = stderr.read().decode('utf-8').strip()
+    return output, error
+
+def wait_until_ready(expected, url=FLAGS_URL, deadline=READY_DEADLINE, client=None):
+    """
+    Poll de API tot die de verwachte flags serveert.
+    Geeft (flags, seconden tot ready); flags is None als de deadline verstrijkt.
+    Conditional GETs: zolang de oude config er nog staat kost een poll alleen een 304.
+    """
+    client = client or FlagClient(url, cache_path=None, timeout=POLL_TIMEOUT)
+    started = time.monotonic()
+    delay = POLL_INITIAL_DELAY
+    while True:
+        try:
+            flags, _ = client.refresh()
+            if all(flags.get(name) == value for name, value in expected.items()):
+                return flags, time.monotonic() - started
+        except (requests.RequestException, ValueError):
+            pass  # app pool start nog op
+        remaining = deadline - (time.monotonic() - started)
+        if remaining <= 0:
+            return None, time.monotonic() - started
+        time.sleep(min(delay, remaining))
+        delay = min(delay * 2, POLL_MAX_DELAY)
+
 def upload_feature_flags():
     """Upload feature flags config and restart backend"""
     try:
-        ssh = paramiko.SSHClient()
-        ssh.set_missing_host_key_policy(paramiko.AutoAddPolicy())
-        ssh.connect(SSH_HOST, username=SSH_USER, password=SSH_PASSWORD)
+        ssh = connect()
 
         print("Connected to server")
         print()
 
-        # Create feature flags JSON
         config_json = json.dumps(FEATURE_FLAGS, indent=2)
-
-        # Write to temp file on local machine
-        temp_file = "C:\\Users\\HP\\AppData\\Local\\Temp\\feature-flags.json"
-        with open(temp_file, 'w') as f:
-            f.write(config_json)
-
         print("Created feature-flags.json:")
         print(config_json)
         print()
 
-        # Upload via SFTP
+        # Upload via SFTP, rechtstreeks uit het geheugen
         print("Uploading to server...")
-        sftp = ssh.open_sftp()
-
-        # Upload to backend directory
-        remote_path = "C:/stores/brand2boost/backend/Configuration/feature-flags.json"
-        sftp.put(temp_file, remote_path)
-        sftp.close()
-
-        print(f"Uploaded to: {remote_path}")
+        upload_config(ssh, config_json.encode('utf-8'))
+        print(f"Uploaded to: {REMOTE_PATH}")
         print()
 
         # Restart backend to reload configuration
         print("Restarting backend...")
-        commands = [
-            'powershell -Command "Import-Module WebAdministration; Restart-WebAppPool -Name (Get-Website \'Brand2boostAPI\').applicationPool"'
-        ]
-
-        for cmd in commands:
-            stdin, stdout, stderr = ssh.exec_command(cmd)
-            output = stdout.read().decode('utf-8')
-            error = stderr.read().decode('utf-8')
-
-            if output:
-                print(f"  Output: {output.strip()}")
-            if error:
-                print(f"  Error: {error.strip()}")
+        output, error = restart_backend(ssh)
+        if output:
+            print(f"  Output: {output}")
+        if error:
+            print(f"  Error: {error}")
+        ssh.close()
 
         print()
-        print("Backend restarted successfully!")
+        print("Waiting for backend...")
+        expected = FEATURE_FLAGS["FeatureFlags"]
+        # Korte poll: geen snapshot op schijf nodig, alleen in het geheugen
+        flags, elapsed = wait_until_ready(expected, client=FlagClient(FLAGS_URL, cache_path=None, timeout=POLL_TIMEOUT))
+        if flags is None:
+            print(f"[WARNING] Backend not serving the new flags after {elapsed:.1f}s")
+            return False
+
+        print(f"Backend ready in {elapsed:.1f}s")
+        print(json.dumps(flags, indent=2))
+        disabled = [flag for flag, enabled in flags.items() if not enabled]
         print()
-        print("Verifying feature flags...")
-
-        # Wait a moment for restart
-        import time
-        time.sleep(3)
-
-        # Check API
-        import requests
-        response = requests.get("https://api.brand2boost.com/api/featureflags")
-        if response.status_code == 200:
-            flags = response.json()
-            print(json.dumps(flags, indent=2))
-
-            # Check if all flags are enabled
-            all_enabled = all(flags.values())
-            if all_enabled:
-                print()
-                print("[SUCCESS] All feature flags are enabled!")
-            else:
-                print()
-                print("[WARNING] Some flags are still disabled:")
-                for flag, enabled in flags.items():
-                    if not enabled:
-                        print(f"  - {flag}: {enabled}")
+        if disabled:
+            print("[WARNING] Some flags are still disabled:")
+            for flag in disabled:
+                print(f"  - {flag}: {flags[flag]}")
         else:
-            print(f"Failed to verify: HTTP {response.status_code}")
-
-        ssh.close()
+            print("[SUCCESS] All feature flags are enabled!")
+        return True
 
     except Exception as e:
         print(f"Error: {e}")
         import traceback
         traceback.print_exc()
+        return False
+
+# --- fleet mode ---
+
+def load_inventory(path):
+    """Inventory JSON -> lijst van host dicts met host, port, user, password en url"""
+    with open(path, encoding='utf-8') as f:
+        entries = json.load(f)
+    hosts = []
+    for entry in entries:
+        if isinstance(entry, str):
+            host, _, port = entry.partition(':')
+            entry = {'host': host, 'port': int(port) if port else 22}
+        host = dict(entry)
+        host.setdefault('port', 22)
+        host.setdefault('user', SSH_USER)
+        host.setdefault('password', SSH_PASSWORD)
+        host.setdefault('url', FLEET_URL_TEMPLATE.format(host=host['host']))
+        host.setdefault('name', f"{host['host']}:{host['port']}" if host['port'] != 22 else host['host'])
+        hosts.append(host)
+    return hosts
+
+def plan_waves(hosts, percentages=FLEET_WAVES):
+    """Verdeel hosts over waves; percentages zijn cumulatief, elke wave heeft minstens één host"""
+    waves = []
+    done = 0
+    for percentage in percentages:
+        upto = min(len(hosts), max(done + 1, math.ceil(len(hosts) * min(percentage, 100) / 100)))
+        if upto > done:
+            waves.append(hosts[done:upto])
+            done = upto
+        if done >= len(hosts):
+            break
+    if done < len(hosts):
+        waves.append(hosts[done:])
+    return waves
+
+class SshPool:
+    """Authenticated SSH connections per host, reused for upload and restart; thread-safe"""
+
+    def __init__(self):
+        self._clients = {}
+        self._locks = {}
+        self._lock = threading.Lock()
+
+    def get(self, host):
+        with self._lock:
+            lock = self._locks.setdefault(host['name'], threading.Lock())
+        with lock:
+            ssh = self._clients.get(host['name'])
+            transport = ssh.get_transport() if ssh else None
+            if transport is None or not transport.is_active():
+                ssh = connect(host['host'], host['port'], host['user'], host['password'])
+                self._clients[host['name']] = ssh
+            return ssh
+
+    def close(self):
+        with self._lock:
+            clients = list(self._clients.values())
+            self._clients.clear()
+        for ssh in clients:
+            ssh.close()
+
+def rollout_host(pool, host, data, expected):
+    """Upload + restart + readiness voor één host; geeft een resultaat dict met timings"""
+    result = {'host': host['name'], 'status': 'ok'}
+    started = time.monotonic()
+    step = 'connect'
+    try:
+        ssh = pool.get(host)
+        result['connect'] = time.monotonic() - started
+        step = 'upload'
+        mark = time.monotonic()
+        upload_config(ssh, data)
+        result['upload'] = time.monotonic() - mark
+        step = 'restart'
+        mark = time.monotonic()
+        output, error = restart_backend(ssh)
+        result['restart'] = time.monotonic() - mark
+        if error:
+            result['message'] = error.splitlines()[0][:60]
+        step = 'ready'
+        flags, result['ready'] = wait_until_ready(expected, url=host['url'])
+        if flags is None:
+            result['status'] = 'not ready'
+    except Exception as e:
+        result['status'] = f"{step} failed"
+        result['message'] = str(e)[:60]
+    result['total'] = time.monotonic() - started
+    return result
+
+def print_fleet_summary(results):
+    def seconds(value):
+        return f"{value:.1f}" if value is not None else '-'
+    print(f"\n{'Host':<24} {'Wave':>4} {'Connect':>8} {'Upload':>7} {'Restart':>8} {'Ready':>7} {'Total':>7}  Status")
+    print('-' * 84)
+    for r in results:
+        print(f"{r['host']:<24} {r['wave']:>4} {seconds(r.get('connect')):>8} {seconds(r.get('upload')):>7} "
+              f"{seconds(r.get('restart')):>8} {seconds(r.get('ready')):>7} {seconds(r.get('total')):>7}  "
+              f"{r['status']}{' - ' + r['message'] if r.get('message') else ''}")
+
+def rollout_fleet(hosts, percentages=FLEET_WAVES, workers=FLEET_WORKERS, continue_on_error=False):
+    """Rol FEATURE_FLAGS in waves uit over alle hosts; geeft de resultaten per host"""
+    data = json.dumps(FEATURE_FLAGS, indent=2).encode('utf-8')
+    expected = FEATURE_FLAGS["FeatureFlags"]
+    waves = plan_waves(hosts, percentages)
+    pool = SshPool()
+    results = []
+    started = time.monotonic()
+    try:
+        with ThreadPoolExecutor(max_workers=workers) as executor, \
+                ThreadPoolExecutor(max_workers=workers) as connector:
+            for number, wave in enumerate(waves, 1):
+                print(f"Wave {number}/{len(waves)}: {len(wave)} hosts...")
+                wave_started = time.monotonic()
+                futures = [executor.submit(rollout_host, pool, host, data, expected) for host in wave]
+                # Volgende wave alvast verbinden terwijl deze loopt: alleen de handshake, nog geen wijziging
+                if number < len(waves):
+                    for host in waves[number]:
+                        connector.submit(pool.get, host)
+                wave_results = [future.result() for future in futures]
+                for r in wave_results:
+                    r['wave'] = number
+                results.extend(wave_results)
+                failed = [r for r in wave_results if r['status'] != 'ok']
+                print(f"  {len(wave) - len(failed)}/{len(wave)} ok in {time.monotonic() - wave_started:.1f}s")
+                if failed and not continue_on_error and number < len(waves):
+                    print(f"[STOP] {len(failed)} hosts failed in wave {number}, rollout halted")
+                    break
+    finally:
+        pool.close()
+
+    print_fleet_summary(results)
+    ok = sum(1 for r in results if r['status'] == 'ok')
+    print(f"\n{ok}/{len(hosts)} hosts updated in {time.monotonic() - started:.1f}s")
+    return results
+
+def main():
+    parser = argparse.ArgumentParser(description="Upload the feature flags config and restart the backend")
+    parser.add_argument("--fleet", metavar="INVENTORY", help="JSON list of hosts to roll out to")
+    parser.add_argument("--waves", default=','.join(str(w) for w in FLEET_WAVES),
+                        help="cumulative percentages per wave (default: %(default)s)")
+    parser.add_argument("--workers", type=int, default=FLEET_WORKERS, help="hosts in parallel per wave")
+    parser.add_argument("--continue-on-error", action="store_true", help="start the next wave despite failures")
+    args = parser.parse_args()
+
+    if args.fleet:
+        waves = [float(w) for w in args.waves.split(',') if w.strip()]
+        rollout_fleet(load_inventory(args.fleet), waves, args.workers, args.continue_on_error)
+    else:
+        upload_feature_flags()
 
 if __name__ == "__main__":
-    upload_feature_flags()
+    main()